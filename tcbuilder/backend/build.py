@@ -11,7 +11,7 @@ import shutil
 import tempfile
 
 from urllib.parse import urlparse, unquote
-from urllib.request import urlretrieve
+from urllib.request import Request, urlopen, urlretrieve
 
 import jsonschema
 import yaml
@@ -229,6 +229,28 @@ def fetch_remote(url, fname=None, cksum=None, download_dir=None):
     return out_fname, is_temp
 
 
+def get_remote_sha256sum(url):
+    """Get the SHA-256 checksum of a remote file as announced by the server
+
+    Artifactory (where images in the Toradex feeds are stored) provides the
+    checksum in the X-Checksum-Sha256 header.
+
+    :param url: URL of the remote file.
+    :returns: The checksum or None if the server does not provide it.
+    """
+
+    try:
+        with urlopen(Request(url, method="HEAD")) as response:
+            cksum = response.headers.get("X-Checksum-Sha256")
+    except OSError as exc:
+        log.debug(f"Could not determine checksum of '{url}': {exc}")
+        return None
+
+    if cksum is None or not re.match(r"^[a-fA-F0-9]{64}$", cksum):
+        return None
+    return cksum.lower()
+
+
 def parse_config_file(config_path, schema_path=DEFAULT_SCHEMA_FILE, substs=None):
     """Parse a configuration file against the expected schema
 
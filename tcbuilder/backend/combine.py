@@ -4,12 +4,11 @@ import logging
 import re
 import datetime
 
-import guestfs
-
 from tezi.image import ImageConfig
 from tcbuilder.backend.common import \
     (set_output_ownership, check_licence_acceptance,
-     run_with_loading_animation, DOCKER_BUNDLE_FILENAME)
+     run_with_loading_animation, copy_tree, DOCKER_BUNDLE_FILENAME)
+from tcbuilder.backend.guestfs_session import open_image
 from tcbuilder.errors import InvalidStateError, InvalidDataError, TorizonCoreBuilderError
 
 log = logging.getLogger("torizon." + __name__)
@@ -172,8 +171,11 @@ def combine_single_tezi_image(bundle_dir, files_to_add, output_dir, tezi_props):
 
     for filename in files_to_add:
         filename = filename.split(":")[0]
-        shutil.copy(os.path.join(bundle_dir, filename),
-                    os.path.join(output_dir, filename))
+        output_file = os.path.join(output_dir, filename)
+        # Never write in place: the file may be hardlinked to the source image.
+        if os.path.lexists(output_file):
+            os.unlink(output_file)
+        shutil.copy(os.path.join(bundle_dir, filename), output_file)
 
     return update_tezi_files(output_dir, tezi_props, files_to_add)
 
@@ -219,7 +221,7 @@ def combine_tezi_image(image_dir, bundle_dir, output_directory, tezi_props, forc
                     "Rename output or use --force to overwrite.")
 
         log.info("Creating copy of source image.")
-        shutil.copytree(image_dir, output_directory)
+        copy_tree(image_dir, output_directory)
 
     # Notice that the present function can be used simply for updating the
     # metadata and not necessarily to add containers (so the function name
@@ -241,6 +243,54 @@ def combine_tezi_image(image_dir, bundle_dir, output_directory, tezi_props, forc
     combine_single_tezi_image(**combine_params)
 
 
+def add_files_to_raw_image(gfs, bundle_dir, files_to_add, rootfs_label):
+    """Add bundle files to the rootfs of a raw image attached to a guestfs handle"""
+
+    if len(gfs.list_partitions()) < 1:
+        raise TorizonCoreBuilderError(
+            "Image doesn't have any partitions or it's not a valid raw image. Aborting.")
+
+    # Get partition number from ext4 fs called rootfs_label in disk image (.wic/.img)
+    rootfs_partition = gfs.findfs_label(rootfs_label)
+    log.info(f"  rootfs partition found: {rootfs_partition} "
+             f"(filesystem label: {rootfs_label})")
+    gfs.mount(rootfs_partition, "/")
+
+    log.info("Adding files to rootfs.")
+    for src_dest_untar in files_to_add:
+
+        src_dest_untar = src_dest_untar.split(":")
+        list_len = len(src_dest_untar)
+        untar = False
+
+        if list_len < 2:
+            raise TorizonCoreBuilderError(
+                "Internal error: DOCKER_FILES_TO_ADD not properly formatted. Aborting.")
+
+        if list_len >= 3:
+            untar = src_dest_untar[2]
+            untar = (untar.lower() == 'true')
+
+        src, dest = src_dest_untar[0:2]
+
+        # Create destination path in rootfs if it doesn't exist
+        if not gfs.is_dir(dest):
+            gfs.mkdir_p(dest)
+
+        if untar:
+            run_with_loading_animation(
+                func=gfs.tar_in,
+                args=(os.path.join(bundle_dir, src), dest),
+                kwargs={'compress': TAR_EXT_TO_COMPRESSION_TYPE[os.path.splitext(src)[1]]},
+                loading_msg=f"  Unpacking {src} to {dest} ...")
+
+        else:
+            run_with_loading_animation(
+                func=gfs.copy_in,
+                args=(os.path.join(bundle_dir, src), dest),
+                loading_msg=f"  Copying {src} to {dest} ...")
+
+
 def combine_raw_image(image_path, bundle_dir, output_path, rootfs_label, force):
 
     files_to_add = check_combine_files(bundle_dir)
@@ -268,63 +318,13 @@ def combine_raw_image(image_path, bundle_dir, output_path, rootfs_label, force):
         log.info("Combining Torizon OS image with Docker Container bundle.")
 
         try:
-            gfs = guestfs.GuestFS(python_return_dict=True)
-            gfs.add_drive_opts(output_path, format="raw")
-            run_with_loading_animation(
-                func=gfs.launch,
-                loading_msg="Initializing image...")
-            if len(gfs.list_partitions()) < 1:
-                raise TorizonCoreBuilderError(
-                    "Image doesn't have any partitions or it's not a valid raw image. Aborting.")
-
-            # Get partition number from ext4 fs called rootfs_label in disk image (.wic/.img)
-            rootfs_partition = gfs.findfs_label(rootfs_label)
-            log.info(f"  rootfs partition found: {rootfs_partition} "
-                     f"(filesystem label: {rootfs_label})")
-            gfs.mount(rootfs_partition, "/")
-
-            log.info("Adding files to rootfs.")
-            for src_dest_untar in files_to_add:
-
-                src_dest_untar = src_dest_untar.split(":")
-                list_len = len(src_dest_untar)
-                untar = False
-
-                if list_len < 2:
-                    raise TorizonCoreBuilderError(
-                        "Internal error: DOCKER_FILES_TO_ADD not properly formatted. Aborting.")
-
-                if list_len >= 3:
-                    untar = src_dest_untar[2]
-                    untar = (untar.lower() == 'true')
-
-                src, dest = src_dest_untar[0:2]
-
-                # Create destination path in rootfs if it doesn't exist
-                if not gfs.is_dir(dest):
-                    gfs.mkdir_p(dest)
-
-                if untar:
-                    run_with_loading_animation(
-                        func=gfs.tar_in,
-                        args=(os.path.join(bundle_dir, src), dest),
-                        kwargs={'compress': TAR_EXT_TO_COMPRESSION_TYPE[os.path.splitext(src)[1]]},
-                        loading_msg=f"  Unpacking {src} to {dest} ...")
-
-                else:
-                    run_with_loading_animation(
-                        func=gfs.copy_in,
-                        args=(os.path.join(bundle_dir, src), dest),
-                        loading_msg=f"  Copying {src} to {dest} ...")
-
-            gfs.shutdown()
-            gfs.close()
+            with open_image(output_path, loading_msg="Initializing image...",
+                            operation="bundle combining") as gfs:
+                add_files_to_raw_image(gfs, bundle_dir, files_to_add, rootfs_label)
         except RuntimeError as gfserr:
             if output_path != image_path:
                 log.info("Removing copy of source image.")
                 os.remove(output_path)
-            if gfs:
-                gfs.close()
             if f"unable to resolve 'LABEL={rootfs_label}'" in str(gfserr):
                 raise TorizonCoreBuilderError(
                     f"Filesystem with label '{rootfs_label}' not found in image. Aborting.")
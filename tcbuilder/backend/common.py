@@ -1,8 +1,10 @@
+import fcntl
 import ipaddress
 import json
 import logging
 import os
 import re
+import shutil
 import socket
 import subprocess
 import sys
@@ -61,6 +63,25 @@ RAW_PROP_DEFAULTS = {
     "raw_rootfs_label" : DEFAULT_RAW_ROOTFS_LABEL
 }
 
+# Multithreaded decompressors for each file format, in order of preference;
+# each one is only used if the program is available.
+PARALLEL_UNPACK_COMMANDS = [
+    ((".gz", ".tgz"), ["pigz -dc"]),
+    ((".xz",), ["xz -dc -T0"]),
+    ((".zst",), ["pzstd -dc"]),
+    ((".bz2",), ["lbzip2 -dc", "pbzip2 -dc"]),
+]
+
+# ioctl request for sharing the data of a file with another one (from linux/fs.h).
+FICLONE = 0x40049409
+
+# Files of a TEZI image which are rewritten in place after the image is copied.
+TEZI_REWRITTEN_FILES = ("image.json", "wrapup.sh")
+
+# Files never modified in place by TorizonCore Builder (only removed or
+# replaced), which can thus be shared between image copies through hardlinks.
+IMMUTABLE_FILE_EXTENSIONS = (".tar", ".gz", ".tgz", ".xz", ".zst", ".bz2", ".lz4")
+
 # Based on this solution: https://stackoverflow.com/a/50690347
 # Usage of Event object to stop thread was based on:
 # https://www.pythontutorial.net/python-concurrency/python-stop-thread/
@@ -272,9 +293,30 @@ def get_unpack_command(filename):
     return cmd
 
 
-def get_tar_compress_program_options(filename):
-    """ Get array with options to pass to tar to decompress given file format. """
-    cmd = get_unpack_command(filename)
+def get_parallel_unpack_command(filename):
+    """Get shell command to unpack a given file format using multiple threads
+
+    If no multithreaded decompressor is available for the file format, the
+    command returned by get_unpack_command() is used instead.
+    """
+    for extensions, cmds in PARALLEL_UNPACK_COMMANDS:
+        if filename.endswith(extensions):
+            for cmd in cmds:
+                if shutil.which(cmd.split()[0]):
+                    return cmd
+    return get_unpack_command(filename)
+
+
+def get_tar_compress_program_options(filename, parallel=False):
+    """ Get array with options to pass to tar to decompress given file format.
+
+    :param filename: Name of the (possibly compressed) tarball.
+    :param parallel: Whether to prefer a multithreaded decompressor.
+    """
+    if parallel:
+        cmd = get_parallel_unpack_command(filename)
+    else:
+        cmd = get_unpack_command(filename)
     # Tar adds a -d option to the command passed, but cat does not
     # accept this, so omit the --use-compress-program entirely in this
     # case.
@@ -519,6 +561,85 @@ def get_file_sha256sum(path):
     return parts[0]
 
 
+def clone_file(src, dst):
+    """Create a copy of a file sharing its data blocks (reflink)
+
+    Only supported on some filesystems (e.g. Btrfs and XFS) and when source
+    and destination are in the same filesystem; OSError is raised otherwise.
+    """
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+
+
+def copy_file_data(src, dst):
+    """Copy the data of a file letting the kernel do it when possible"""
+    with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+        remaining = os.fstat(fsrc.fileno()).st_size
+        try:
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+        except OSError:
+            # E.g. cross-filesystem copy on older kernels: copy in userspace.
+            fsrc.seek(0)
+            fdst.seek(0)
+            fdst.truncate()
+            shutil.copyfileobj(fsrc, fdst)
+
+
+def copy_tree(src_dir, dst_dir, rewritten_files=TEZI_REWRITTEN_FILES, link_immutable=True):
+    """Copy a directory tree (usually a TEZI image) as cheaply as possible
+
+    Each file is reflinked if the filesystem supports it; otherwise files known
+    to be immutable (see IMMUTABLE_FILE_EXTENSIONS) are hardlinked and the rest
+    is copied with copy_file_range(). Files in `rewritten_files` are always
+    fully copied.
+
+    Notice that hardlinked files are shared with the source tree: they must be
+    replaced, never modified in place (and their ownership is shared too).
+
+    :param src_dir: Source directory.
+    :param dst_dir: Destination directory (must not exist).
+    :param rewritten_files: Names of files which will be modified in place.
+    :param link_immutable: Whether immutable files can be hardlinked.
+    """
+
+    counts = {"cloned": 0, "linked": 0, "copied": 0}
+
+    def copy_function(src, dst):
+        name = os.path.basename(src)
+        if name in rewritten_files:
+            shutil.copy2(src, dst)
+            counts["copied"] += 1
+            return dst
+        try:
+            clone_file(src, dst)
+            shutil.copystat(src, dst)
+            counts["cloned"] += 1
+            return dst
+        except OSError:
+            pass
+        if link_immutable and name.endswith(IMMUTABLE_FILE_EXTENSIONS):
+            try:
+                # Remove the file left by the clone attempt.
+                os.unlink(dst)
+                os.link(src, dst)
+                counts["linked"] += 1
+                return dst
+            except OSError:
+                pass
+        copy_file_data(src, dst)
+        shutil.copystat(src, dst)
+        counts["copied"] += 1
+        return dst
+
+    shutil.copytree(src_dir, dst_dir, copy_function=copy_function)
+    log.debug(f"Copied {src_dir} -> {dst_dir}: {counts['cloned']} file(s) reflinked, "
+              f"{counts['linked']} hardlinked, {counts['copied']} copied.")
+
+
 def get_own_container_id(
         docker_client, image_name="torizoncore-builder", env_var="TCB_CONTAINER_NAME"):
     """Determine ID of current container
@@ -591,11 +712,7 @@ def get_arch_from_ostree(storage_dir, ref="base"):
         raise InvalidStateError(
             f"Source OSTree archive ({src_ostree_archive_dir}) does not exist!")
     srcrepo = ostree.open_ostree(src_ostree_archive_dir)
-    ret, csumdeploy = srcrepo.resolve_rev(ref, False)
-    if not ret:
-        raise TorizonCoreBuilderError(f"Error resolving {ref}.")
-    srcmeta, _subject, _body = ostree.get_metadata_from_ref(srcrepo, csumdeploy)
-    return srcmeta.get("oe.arch")
+    return ostree.get_commit_info(srcrepo, ref)["arch"]
 
 
 def get_docker_platform(storage_dir):
@@ -2,26 +2,28 @@
 Backend handling for the deploy subcommand.
 """
 
+import concurrent.futures
 import json
 import logging
 import os
-import shutil
+import re
 import subprocess
+import tempfile
 import threading
+import time
 import shlex
 
-import guestfs
-import paramiko
-
 # pylint: disable=wrong-import-position
 import gi
 gi.require_version("OSTree", "1.0")
 from gi.repository import Gio, OSTree
 
 from tcbuilder.backend import ostree
-from tcbuilder.backend.common import (get_rootfs_tarball, resolve_remote_host,
-                                      run_with_loading_animation)
+from tcbuilder.backend.common import (get_rootfs_tarball, run_with_loading_animation,
+                                      copy_tree)
+from tcbuilder.backend.guestfs_session import open_image
 from tcbuilder.backend.rforward import reverse_forward_tunnel, request_port_forward
+from tcbuilder.backend.sshsession import SSHSession, DeviceLogAdapter
 from tcbuilder.errors import TorizonCoreBuilderError, InvalidDataError
 from tezi.utils import find_rootfs_content
 # pylint: enable=wrong-import-position
@@ -33,6 +35,21 @@ EXTRA_ROOTFS_SIZE_KB = 0
 # Value based on
 # https://github.com/torizon/meta-toradex-torizon/blob/953aacb8b3241ea26f98e853d1a1d4c8463636a4/recipes-images/images/torizon-core-common.inc#L11
 IMAGE_OVERHEAD_FACTOR = 2.3
+# Maximum compression levels accepted for the rootfs tarball (higher zstd
+# levels require the "--ultra" option).
+ZSTD_MAX_COMPRESSION_LEVEL = 19
+XZ_MAX_COMPRESSION_LEVEL = 9
+# Size of the chunks piped from tar into the compressor.
+PACK_CHUNK_SIZE = 1024 * 1024
+# Number of devices deployed concurrently by default in fleet mode.
+DEFAULT_FLEET_JOBS = 8
+# HTTP server workers reserved per device in fleet mode (ostree pulls objects
+# over several parallel connections).
+FLEET_CONNECTIONS_PER_DEVICE = 4
+# Serializes the generation of static deltas (shared by devices).
+STATIC_DELTA_LOCK = threading.Lock()
+# First mke2fs version properly copying xattrs and hardlinks with "-d".
+MKE2FS_POPULATE_MIN_VERSION = (1, 45, 0)
 
 def create_sysroot(deploy_sysroot_dir):
     sysroot = OSTree.Sysroot.new(Gio.File.new_for_path(deploy_sysroot_dir))
@@ -140,20 +157,28 @@ def deploy_rootfs(sysroot, src_sysroot_dir, ref, refspec, kargs):
         raise TorizonCoreBuilderError("Error writing deployment.")
 
 
-def update_uncompressed_image_size(image_filename):
+def update_uncompressed_image_size(image_filename, uncompressed_size=None):
     """
     Update the 'uncompressed_size' field of the 'image.json' file.
 
+    The field holds the size in MiB, as expected by Toradex Easy Installer.
+
     :param image_filename: Compressed image filename.
+    :param uncompressed_size: Uncompressed size of the image in bytes; when not
+                              passed it is determined from the compressed file.
     """
 
-    # '.zst' is the default compression used, but it can also be '.xz'
-    cmd = ["zstd", "-l", f"{image_filename}"]
-    if image_filename.endswith(".xz"):
-        cmd[0] = "xz"
+    if uncompressed_size is None:
+        # '.zst' is the default compression used, but it can also be '.xz'
+        cmd = ["zstd", "-l", f"{image_filename}"]
+        if image_filename.endswith(".xz"):
+            cmd[0] = "xz"
 
-    output = subprocess.check_output(cmd)
-    uncompressed_image_size = output.split()[11] # Uncompressed field of zstd/xz -l
+        output = subprocess.check_output(cmd)
+        # Uncompressed field of zstd/xz -l (already in MiB)
+        uncompressed_size_mib = float(output.split()[11])
+    else:
+        uncompressed_size_mib = uncompressed_size / 1024 / 1024
 
     image_json = os.path.join(os.path.dirname(image_filename), 'image.json')
     with open(image_json, "r", encoding="utf-8") as jsonfile:
@@ -163,7 +188,7 @@ def update_uncompressed_image_size(image_filename):
         raise InvalidDataError(
             "No root file system content section found in Easy Installer image.")
 
-    content["uncompressed_size"] = float(uncompressed_image_size)
+    content["uncompressed_size"] = uncompressed_size_mib
     with open(image_json, "w", encoding="utf-8") as jsonfile:
         json.dump(jsondata, jsonfile, indent=4)
 
@@ -175,17 +200,46 @@ def create_installed_versions(path, ref, branch):
         json.dump(versioninfo, versionfile)
 
 def copy_tezi_image(src_tezi_dir, dst_tezi_dir):
-    shutil.copytree(src_tezi_dir, dst_tezi_dir)
+    copy_tree(src_tezi_dir, dst_tezi_dir)
 
-def pack_rootfs_for_tezi(dst_sysroot_dir, output_dir):
-    image_filename = get_rootfs_tarball(output_dir)
+def get_compress_command(image_filename, level=None, threads=None):
+    """Get the command compressing stdin to stdout for a rootfs tarball
+
+    :param image_filename: Compressed image filename (.zst or .xz).
+    :param level: Compression level (compressor's default if not set).
+    :param threads: Number of compression threads (0 means one per CPU core,
+                    which is the default).
+    """
 
     if image_filename.endswith(".xz"):
-        uncompressed_file = image_filename.replace(".xz", "")
-        compress_cmd = ["xz", "-z", uncompressed_file]
+        cmd, max_level = ["xz", "-z", "-c"], XZ_MAX_COMPRESSION_LEVEL
     elif image_filename.endswith(".zst"):
-        uncompressed_file = image_filename.replace(".zst", "")
-        compress_cmd = ["zstd", "--rm", uncompressed_file]
+        cmd, max_level = ["zstd", "-c", "-q"], ZSTD_MAX_COMPRESSION_LEVEL
+    else:
+        raise InvalidDataError(
+            f"Unsupported compression format of rootfs tarball '{image_filename}'.")
+
+    if level is not None:
+        if not 1 <= level <= max_level:
+            raise InvalidDataError(
+                f"Compression level {level} is not supported by {cmd[0]} "
+                f"(valid levels: 1-{max_level}).")
+        cmd.append(f"-{level}")
+    cmd.append(f"-T{0 if threads is None else threads}")
+    return cmd
+
+
+# pylint: disable=too-many-locals
+def pack_rootfs_for_tezi(dst_sysroot_dir, output_dir, compression_level=None,
+                         compression_threads=None):
+    """Create the compressed rootfs tarball of a TEZI image in a single pass
+
+    Tar output is piped into a multithreaded compressor writing the final file
+    while the uncompressed size (needed by image.json) is counted on the way.
+    """
+    image_filename = get_rootfs_tarball(output_dir)
+    compress_cmd = get_compress_command(
+        image_filename, compression_level, compression_threads)
 
     # pylint: disable=line-too-long
     # This is a OSTree bare repository. Care must been taken to preserve all
@@ -196,17 +250,42 @@ def pack_rootfs_for_tezi(dst_sysroot_dir, output_dir):
     tar_cmd = [
         "tar",
         "--xattrs", "--xattrs-include=*",
-        "-cf", uncompressed_file,
+        "-cf", "-",
         "-S", "-C", dst_sysroot_dir,
         "-p", "."
     ]
-    log.debug(f"Running tar command: {shlex.join(tar_cmd)}")
-    subprocess.check_output(tar_cmd, stderr=subprocess.STDOUT)
-
-    log.debug(f"Running compress command: {shlex.join(compress_cmd)}")
-    subprocess.check_output(compress_cmd, stderr=subprocess.STDOUT)
-
-    update_uncompressed_image_size(image_filename)
+    log.debug(f"Running: {shlex.join(tar_cmd)} | {shlex.join(compress_cmd)}")
+
+    uncompressed_size = 0
+    with open(image_filename, "wb") as outfile, \
+         tempfile.TemporaryFile() as errfile:
+        tar_proc = subprocess.Popen(tar_cmd, stdout=subprocess.PIPE, stderr=errfile)
+        compress_proc = subprocess.Popen(compress_cmd, stdin=subprocess.PIPE,
+                                         stdout=outfile, stderr=errfile)
+        try:
+            while True:
+                chunk = tar_proc.stdout.read(PACK_CHUNK_SIZE)
+                if not chunk:
+                    break
+                uncompressed_size += len(chunk)
+                compress_proc.stdin.write(chunk)
+        except BrokenPipeError:
+            # Compressor failed: the error is reported below.
+            tar_proc.kill()
+        finally:
+            compress_proc.stdin.close()
+            tar_ret = tar_proc.wait()
+            compress_ret = compress_proc.wait()
+
+        if tar_ret or compress_ret:
+            errfile.seek(0)
+            raise subprocess.CalledProcessError(
+                tar_ret or compress_ret, tar_cmd if tar_ret else compress_cmd,
+                output=errfile.read())
+
+    log.debug(f"Packed {uncompressed_size} bytes into {image_filename}.")
+    update_uncompressed_image_size(image_filename, uncompressed_size)
+# pylint: enable=too-many-locals
 
 
 def copy_files_from_old_sysroot(src_sysroot, dst_sysroot):
@@ -280,20 +359,71 @@ def deploy_ostree_local(src_sysroot_dir, src_ostree_archive_dir,
 
 
 def deploy_tezi_image(tezi_dir, src_sysroot_dir, src_ostree_archive_dir,
-                      output_dir, dst_sysroot_dir, ref=None):
+                      output_dir, dst_sysroot_dir, ref=None, compression=None):
     """Deploys a Toradex Easy Installer image with given OSTree reference
 
     Creates a new Toradex Easy Installer image with a OSTree deployment of the
     given OSTree reference.
+
+    :param compression: Dictionary with the optional keys "level" and "threads"
+                        controlling the compression of the rootfs tarball.
     """
+    compression = compression or {}
     deploy_ostree_local(src_sysroot_dir, src_ostree_archive_dir, dst_sysroot_dir, ref)
 
     log.info("Packing rootfs...")
     copy_tezi_image(tezi_dir, output_dir)
-    pack_rootfs_for_tezi(dst_sysroot_dir, output_dir)
+    pack_rootfs_for_tezi(dst_sysroot_dir, output_dir,
+                         compression_level=compression.get("level"),
+                         compression_threads=compression.get("threads"))
     log.info("Packing rootfs done.")
 
 
+def mke2fs_can_populate():
+    """Tell whether mke2fs can build a filesystem from a directory (-d)"""
+    try:
+        output = subprocess.run(["mke2fs", "-V"], check=True, text=True,
+                                stdout=subprocess.PIPE, stderr=subprocess.STDOUT).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return False
+    # Output is like: "mke2fs 1.46.2 (28-Feb-2021)"
+    match = re.match(r"mke2fs\s+(\d+)\.(\d+)(?:\.(\d+))?", output)
+    if not match:
+        return False
+    version = tuple(int(part or 0) for part in match.groups())
+    return version >= MKE2FS_POPULATE_MIN_VERSION
+
+
+def get_last_partition_extent(image):
+    """Get the offset and size (in bytes) of the last partition of a disk image"""
+    output = subprocess.check_output(["sfdisk", "--json", image], text=True)
+    table = json.loads(output)["partitiontable"]
+    sector_size = table.get("sectorsize", 512)
+    last_partition = table["partitions"][-1]
+    return last_partition["start"] * sector_size, last_partition["size"] * sector_size
+
+
+def write_rootfs_with_mke2fs(output_raw_img, rootfs_label, dst_sysroot_dir):
+    """Create the rootfs partition of a raw image on the host
+
+    The ext4 filesystem is built by mke2fs directly inside the last partition
+    of the image (where virt-resize left the space for the rootfs) and
+    populated from dst_sysroot_dir, preserving ownership, xattrs and hardlinks.
+    """
+    offset, size = get_last_partition_extent(output_raw_img)
+    mkfs_cmd = [
+        "mke2fs", "-t", "ext4", "-q", "-F",
+        "-L", rootfs_label,
+        "-d", dst_sysroot_dir,
+        # Discarding would punch holes in the image file outside the partition
+        # with some versions of mke2fs when an offset is used.
+        "-E", f"offset={offset},nodiscard",
+        output_raw_img, f"{size // 1024}k"
+    ]
+    log.debug(f"Running mke2fs command: {shlex.join(mkfs_cmd)}")
+    subprocess.check_output(mkfs_cmd, stderr=subprocess.STDOUT, text=True)
+
+
 def write_rootfs_to_raw_image(base_raw_img, output_raw_img, base_rootfs_partition, rootfs_label,
                               base_rootfs_partition_size_kb, other_partitions_size_kb,
                               rootfs_size_kb, dst_sysroot_dir):
@@ -323,42 +453,51 @@ def write_rootfs_to_raw_image(base_raw_img, output_raw_img, base_rootfs_partitio
     subprocess.run(resizecmd, check=True)
     log.info("------------------------------------------------------------")
 
-    try:
-        gfs = guestfs.GuestFS(python_return_dict=True)
-        gfs.add_drive_opts(output_raw_img, format="raw")
-        run_with_loading_animation(
-            func=gfs.launch,
-            loading_msg="Initializing output image...")
-
-        # virt-resize rearranged all existing partitions and generated a new empty partition at the
-        # end of the disk. We will format it to ext4 and put the unpacked rootfs contents in it.
-
-        # Its partition number (/dev/sda1, /dev/sda2, etc.) is equal to the number of partitions
-        # in the image, given that it is the last one.
-
-        output_rootfs_partition = f"/dev/sda{len(gfs.list_partitions())}"
-        log.info(f"Creating new '{rootfs_label}' rootfs partition at {output_rootfs_partition}.")
-
-        gfs.mkfs("ext4", output_rootfs_partition)
-        gfs.set_label(output_rootfs_partition, rootfs_label)
-        gfs.mount(output_rootfs_partition, "/")
-
-        dst_sysroot_dir_ls = os.listdir(dst_sysroot_dir)
-        if 'lost+found' in dst_sysroot_dir_ls:
-            dst_sysroot_dir_ls.remove('lost+found')
-
-        log.info("Copying unpacked rootfs contents to output image. This may take a few minutes...")
-        for content in dst_sysroot_dir_ls:
+    # Fast path: build the filesystem on the host, avoiding copying every
+    # file through the guestfs appliance.
+    if mke2fs_can_populate():
+        try:
+            log.info(f"Creating new '{rootfs_label}' rootfs partition with mke2fs.")
             run_with_loading_animation(
-                func=gfs.copy_in,
-                args=(f"{dst_sysroot_dir}/{content}", "/"),
-                loading_msg=f"  Copying /{content}...")
+                func=write_rootfs_with_mke2fs,
+                args=(output_raw_img, rootfs_label, dst_sysroot_dir),
+                loading_msg="Copying unpacked rootfs contents to output image...")
+            return
+        except (subprocess.CalledProcessError, KeyError, IndexError, ValueError) as exc:
+            details = getattr(exc, "output", None) or exc
+            log.warning(f"Warning: could not create rootfs partition with mke2fs ({details}); "
+                        "falling back to guestfs.")
 
-        gfs.shutdown()
-        gfs.close()
+    try:
+        with open_image(output_raw_img, loading_msg="Initializing output image...",
+                        operation="rootfs writing") as gfs:
+            # virt-resize rearranged all existing partitions and generated a new empty partition
+            # at the end of the disk. We will format it to ext4 and put the unpacked rootfs
+            # contents in it.
+
+            # Its partition number (/dev/sda1, /dev/sda2, etc.) is equal to the number of
+            # partitions in the image, given that it is the last one.
+
+            output_rootfs_partition = f"/dev/sda{len(gfs.list_partitions())}"
+            log.info(f"Creating new '{rootfs_label}' rootfs partition at "
+                     f"{output_rootfs_partition}.")
+
+            gfs.mkfs("ext4", output_rootfs_partition)
+            gfs.set_label(output_rootfs_partition, rootfs_label)
+            gfs.mount(output_rootfs_partition, "/")
+
+            dst_sysroot_dir_ls = os.listdir(dst_sysroot_dir)
+            if 'lost+found' in dst_sysroot_dir_ls:
+                dst_sysroot_dir_ls.remove('lost+found')
+
+            log.info("Copying unpacked rootfs contents to output image. "
+                     "This may take a few minutes...")
+            for content in dst_sysroot_dir_ls:
+                run_with_loading_animation(
+                    func=gfs.copy_in,
+                    args=(f"{dst_sysroot_dir}/{content}", "/"),
+                    loading_msg=f"  Copying /{content}...")
     except RuntimeError as gfserr:
-        if gfs:
-            gfs.close()
         raise TorizonCoreBuilderError(f"guestfs: {gfserr.args[0]}")
 
 
@@ -372,32 +511,25 @@ def deploy_raw_image(base_raw_img, src_sysroot_dir, src_ostree_archive_dir,
     deploy_ostree_local(src_sysroot_dir, src_ostree_archive_dir, dst_sysroot_dir, ref)
 
     try:
-        gfs = guestfs.GuestFS(python_return_dict=True)
-        gfs.add_drive_opts(base_raw_img, format="raw", readonly=1)
-        run_with_loading_animation(
-            func=gfs.launch,
-            loading_msg="Initializing base WIC/raw image...")
-        if len(gfs.list_partitions()) < 1:
-            raise TorizonCoreBuilderError(
-                "Image doesn't have any partitions or it's not a valid WIC/raw image. Aborting.")
-        # Get partition number from ext4 fs called rootfs_label in disk image (.wic/.img)
-        rootfs_partition = gfs.findfs_label(rootfs_label)
-        log.info(f"  '{rootfs_label}' partition found: {rootfs_partition}")
-
-        base_rootfs_partition_size_kb = gfs.blockdev_getsize64(rootfs_partition) / 1024
-
-        other_partitions_size_kb = 0
-        partitions = gfs.list_partitions()
-        partitions.remove(rootfs_partition)
-        for part in partitions:
-            other_partitions_size_kb += gfs.blockdev_getsize64(part) / 1024
-
-        # Close read-only handle
-        gfs.shutdown()
-        gfs.close()
+        with open_image(base_raw_img, readonly=True,
+                        loading_msg="Initializing base WIC/raw image...",
+                        operation="partition probing") as gfs:
+            if len(gfs.list_partitions()) < 1:
+                raise TorizonCoreBuilderError(
+                    "Image doesn't have any partitions or it's not a valid WIC/raw image. "
+                    "Aborting.")
+            # Get partition number from ext4 fs called rootfs_label in disk image (.wic/.img)
+            rootfs_partition = gfs.findfs_label(rootfs_label)
+            log.info(f"  '{rootfs_label}' partition found: {rootfs_partition}")
+
+            base_rootfs_partition_size_kb = gfs.blockdev_getsize64(rootfs_partition) / 1024
+
+            other_partitions_size_kb = 0
+            partitions = gfs.list_partitions()
+            partitions.remove(rootfs_partition)
+            for part in partitions:
+                other_partitions_size_kb += gfs.blockdev_getsize64(part) / 1024
     except RuntimeError as gfserr:
-        if gfs:
-            gfs.close()
         if f"unable to resolve 'LABEL={rootfs_label}'" in str(gfserr):
             raise TorizonCoreBuilderError(
                 f"Filesystem with label '{rootfs_label}' not found in image. Aborting.")
@@ -416,32 +548,71 @@ def deploy_raw_image(base_raw_img, src_sysroot_dir, src_ostree_archive_dir,
                               rootfs_size_kb, dst_sysroot_dir)
     log.info(f"Image {os.path.basename(output_raw_img)} created successfully!")
 
-def run_command_with_sudo(client, command, password):
-    stdin, stdout, stderr = client.exec_command("sudo -S -- " + command)
-    stdin.write(f"{password}\n")
-    stdin.flush()
-    status = stdout.channel.recv_exit_status()  # wait for exec_command to finish
+def get_booted_commit(session):
+    """Get the checksum of the OSTree commit booted on a device (or None)"""
+    result = session.run("ostree admin status")
+    if not result.ok:
+        return None
+    # The booted deployment is marked with an asterisk, e.g.:
+    # * torizon 6f5a...c3b2.0
+    match = re.search(r"^\*\s+\S+\s+([0-9a-f]{64})\.\d+", result.output, re.MULTILINE)
+    return match.group(1) if match else None
 
-    stdout_str = stdout.read().decode('utf-8').strip()
-    stderr_str = stderr.read().decode('utf-8').strip()
 
-    if status != 0:
-        if len(stdout_str) > 0:
-            log.info(stdout_str)
-        if len(stderr_str) > 0:
-            log.error(stderr_str)
-        raise TorizonCoreBuilderError(f"Failed to run command on module: {command}")
+def send_static_delta_remote(session, repo, repo_dir, to_csum, dev_log=log):
+    """Send a static delta bringing a commit to a device
 
-    if len(stdout_str) > 0:
-        log.debug(stdout_str)
-    if len(stderr_str) > 0:
-        log.debug(stderr_str)
+    The delta goes from the commit currently booted on the device to the given
+    one; it is generated as a single file (once for all devices booting the
+    same commit) and sent over SFTP, to be applied offline on the device.
 
-
-# pylint: disable=too-many-locals
-def deploy_ostree_remote(remote_host, remote_username, remote_password, remote_port,
-                         remote_mdns, src_ostree_archive_dir, ref, reboot=False):
-    """Implementation to deploy OSTree on remote device"""
+    :param dev_log: Logger used for messages related to the device.
+    :returns: List of steps (as expected by SSHSession.run_batch()) applying
+              the delta on the device, or None if no static delta could be
+              used (so the commit must be pulled instead).
+    """
+    from_csum = get_booted_commit(session)
+    if from_csum is None:
+        dev_log.info("Could not determine the commit booted on the device.")
+        return None
+
+    if from_csum == to_csum:
+        dev_log.info(f"Commit {to_csum} is already booted on the device.")
+        return []
+
+    _, have_commit = repo.has_object(OSTree.ObjectType.COMMIT, from_csum, None)
+    if not have_commit:
+        dev_log.info(
+            f"Commit booted on the device ({from_csum}) is not in the local repository.")
+        return None
+
+    superblock = os.path.join(
+        repo_dir, "deltas", ostree.get_delta_id(from_csum, to_csum), "superblock")
+    with STATIC_DELTA_LOCK:
+        if not os.path.exists(superblock):
+            dev_log.info(f"Creating static delta from booted commit {from_csum}...")
+            ostree.generate_delta(repo, from_csum, to_csum, inline_parts=True)
+
+    remote_path = f"/tmp/tcbuilder-{to_csum}.delta"
+    delta_size = os.path.getsize(superblock)
+    dev_log.info(
+        f"Sending static delta ({delta_size / (1024 * 1024):.1f} MB) to the device...")
+    session.sftp().put(superblock, remote_path)
+
+    # The delta file is removed even if applying it fails.
+    return [(f"ostree static-delta apply-offline {remote_path}; st=$?; "
+             f"rm -f {remote_path}; exit $st",
+             "Applying static delta on the device...")]
+
+
+def prepare_remote_deployment(src_ostree_archive_dir, ref):
+    """Get what is needed to deploy a reference on remote devices
+
+    :returns: Tuple (repo_dir, repo, checksum, deploy_args) with the path of
+              the archive repository to serve (see ostree.get_archive_repo()),
+              the repository, the checksum of the commit to deploy and the
+              arguments to pass to "ostree admin deploy" on the devices.
+    """
 
     # It seems the customer did not pass a reference, deploy the original commit
     # (probably not that useful in practise, but useful to test the workflow)
@@ -451,6 +622,7 @@ def deploy_ostree_remote(remote_host, remote_username, remote_password, remote_p
     # We need to resolve the reference to a checksum again, otherwise we
     # pull_local_ref complains with:
     # "Commit has no requested ref ‘base’ in ref binding metadata"
+    src_ostree_archive_dir = ostree.get_archive_repo(src_ostree_archive_dir)
     srcrepo = ostree.open_ostree(src_ostree_archive_dir)
     ret, csumdeploy = srcrepo.resolve_rev(ref, False)
     if not ret:
@@ -466,11 +638,96 @@ def deploy_ostree_remote(remote_host, remote_username, remote_password, remote_p
         arg = f"--karg-append={arg}"
         args_list.append(arg)
 
-    args_cli = shlex.join(args_list)
-
     log.info(f"Pulling OSTree with ref {ref} (checksum {csumdeploy}) "
              "from local archive repository...")
 
+    return src_ostree_archive_dir, srcrepo, csumdeploy, shlex.join(args_list)
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def deploy_ostree_to_device(device, srcrepo, src_ostree_archive_dir, csumdeploy, args_cli,
+                            local_ostree_server_port, reboot=False, static_delta=False,
+                            dev_log=log):
+    """Deploy a commit on one device
+
+    :param device: Dictionary with the keys "host", "username", "password",
+                   "port" and "mdns_source" describing the device.
+    :param local_ostree_server_port: Port of the local HTTP server serving the
+                                     archive repository.
+    :param dev_log: Logger used for messages related to the device.
+    """
+
+    with SSHSession.connect(device["host"], device["username"], device["password"],
+                            device["port"], device.get("mdns_source")) as session:
+        # Get the reverse TCP port that was chosen by the remote SSH
+        reverse_ostree_server_port = request_port_forward(session.transport)
+
+        forwarding_thread = threading.Thread(target=reverse_forward_tunnel,
+                                             args=("localhost",
+                                                   local_ostree_server_port,
+                                                   session.transport))
+        forwarding_thread.daemon = True
+        forwarding_thread.start()
+
+        # All commands requiring root are run as a single batch (authenticating
+        # with sudo only once).
+        steps = [
+            "ostree remote add --no-gpg-verify --force tcbuilder "
+            f"http://localhost:{reverse_ostree_server_port}/"
+        ]
+
+        delta_steps = None
+        if static_delta:
+            delta_steps = send_static_delta_remote(
+                session, srcrepo, src_ostree_archive_dir, csumdeploy, dev_log)
+            if delta_steps is None:
+                dev_log.info("Falling back to pulling the commit.")
+
+        if delta_steps is None:
+            delta_steps = [(f"ostree pull tcbuilder:{csumdeploy}",
+                            "Starting OSTree pull on the device...")]
+        steps.extend(delta_steps)
+
+        steps.extend([
+            # Do the final staging after we set upgrade_available, therefore option --stage
+            (f"ostree admin deploy --stage {args_cli} tcbuilder:{csumdeploy}",
+             "Deploying new OSTree on the device..."),
+            # Make sure we set bootcount to 0, it can be > 1 from previous runs
+            "fw_setenv bootcount 0",
+            # Make sure we remove the rollback flag from previous runs
+            "fw_setenv rollback 0",
+            # Set upgrade_available for U-Boot
+            "fw_setenv upgrade_available 1",
+            # Finalize the update after we set upgrade_available for U-Boot
+            "ostree admin finalize-staged"
+        ])
+
+        session.run_batch(steps, logger=dev_log)
+        dev_log.info("Deploying successfully finished.")
+
+        if reboot:
+            # If reboot is started in foreground it leads to exit code <> 0 sometimes
+            # which leads to a stack trace in torizoncore-builder. Start in background
+            # to make the command run successfully always.
+            session.run_batch(["sh -c 'reboot &'"], logger=dev_log)
+            dev_log.info("Device reboot initiated...")
+        else:
+            dev_log.info("Please reboot the device to boot into the new deployment.")
+# pylint: enable=too-many-arguments,too-many-locals
+
+
+def deploy_ostree_remote(remote_host, remote_username, remote_password, remote_port,
+                         remote_mdns, src_ostree_archive_dir, ref, reboot=False,
+                         static_delta=False):
+    """Implementation to deploy OSTree on remote device
+
+    :param static_delta: Whether to send a static delta (from the commit booted on the
+                         device) instead of having the device pull all missing objects.
+    """
+
+    src_ostree_archive_dir, srcrepo, csumdeploy, args_cli = \
+        prepare_remote_deployment(src_ostree_archive_dir, ref)
+
     # Start http server...
     http_server_thread = ostree.serve_ostree_start(src_ostree_archive_dir,
                                                    "localhost", port=0)
@@ -479,68 +736,71 @@ def deploy_ostree_remote(remote_host, remote_username, remote_password, remote_p
     local_ostree_server_port = http_server_thread.server_port
     log.info(f'OSTree server listening on "localhost:{local_ostree_server_port}".')
 
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    resolved_remote_host = resolve_remote_host(remote_host, remote_mdns)
-    client.connect(hostname=resolved_remote_host,
-                   username=remote_username,
-                   password=remote_password,
-                   port=remote_port)
-
-    # Get the reverse TCP port that was chosen by the remote SSH
-    reverse_ostree_server_port = request_port_forward(client.get_transport())
-
-    forwarding_thread = threading.Thread(target=reverse_forward_tunnel,
-                                         args=("localhost",
-                                               local_ostree_server_port,
-                                               client.get_transport()))
-    forwarding_thread.daemon = True
-    forwarding_thread.start()
-
-    run_command_with_sudo(
-        client,
-        "ostree remote add --no-gpg-verify --force tcbuilder "
-        f"http://localhost:{reverse_ostree_server_port}/",
-        remote_password)
-
-    log.info("Starting OSTree pull on the device...")
-    run_command_with_sudo(
-        client, f"ostree pull tcbuilder:{csumdeploy}", remote_password)
-
-    log.info("Deploying new OSTree on the device...")
-    # Do the final staging after we set upgrade_available, therefore option --stage
-    run_command_with_sudo(
-        client, f"ostree admin deploy --stage {args_cli} tcbuilder:{csumdeploy}", remote_password)
-
-    # Make sure we set bootcount to 0, it can be > 1 from previous runs
-    run_command_with_sudo(
-        client, "fw_setenv bootcount 0", remote_password)
-
-    # Make sure we remove the rollback flag from previous runs
-    run_command_with_sudo(
-        client, "fw_setenv rollback 0", remote_password)
-
-    # Set upgrade_available for U-Boot
-    run_command_with_sudo(
-        client, "fw_setenv upgrade_available 1", remote_password)
-
-    # Finalize the update after we set upgrade_available for U-Boot
-    run_command_with_sudo(
-        client, "ostree admin finalize-staged", remote_password)
-
-    log.info("Deploying successfully finished.")
-
-    if reboot:
-        # If reboot is started in foreground it leads to exit code <> 0 sometimes
-        # which leads to a stack trace in torizoncore-builder. Start in background
-        # to make the command run successfully always.
-        run_command_with_sudo(client, "sh -c 'reboot &'", remote_password)
-        log.info("Device reboot initiated...")
-    else:
-        log.info("Please reboot the device to boot into the new deployment.")
+    device = {
+        "host": remote_host,
+        "username": remote_username,
+        "password": remote_password,
+        "port": remote_port,
+        "mdns_source": remote_mdns
+    }
+    try:
+        deploy_ostree_to_device(device, srcrepo, src_ostree_archive_dir, csumdeploy,
+                                args_cli, local_ostree_server_port, reboot, static_delta)
+    finally:
+        ostree.serve_ostree_stop(http_server_thread)
+
+
+# pylint: disable=too-many-locals
+def deploy_ostree_fleet(devices, src_ostree_archive_dir, ref, reboot=False,
+                        static_delta=False, jobs=DEFAULT_FLEET_JOBS):
+    """Deploy OSTree on several remote devices concurrently
+
+    All devices pull from a single local HTTP server (each one through its own
+    SSH reverse tunnel); at most `jobs` devices are handled at the same time.
+
+    :param devices: List of devices as returned by load_device_inventory().
+    :returns: List of tuples (host, error, seconds) with the outcome of each
+              device, where error is None on success.
+    """
 
-    client.close()
+    src_ostree_archive_dir, srcrepo, csumdeploy, args_cli = \
+        prepare_remote_deployment(src_ostree_archive_dir, ref)
 
-    ostree.serve_ostree_stop(http_server_thread)
+    http_server_thread = ostree.serve_ostree_start(
+        src_ostree_archive_dir, "localhost", port=0,
+        max_workers=max(ostree.DEFAULT_SERVER_WORKERS, jobs * FLEET_CONNECTIONS_PER_DEVICE))
+    local_ostree_server_port = http_server_thread.server_port
+    log.info(f'OSTree server listening on "localhost:{local_ostree_server_port}".')
+    log.info(f"Deploying to {len(devices)} device(s), {jobs} at a time...")
+
+    def deploy_one(device):
+        dev_log = DeviceLogAdapter(log, {"host": device["host"]})
+        start = time.monotonic()
+        try:
+            deploy_ostree_to_device(device, srcrepo, src_ostree_archive_dir, csumdeploy,
+                                    args_cli, local_ostree_server_port, reboot,
+                                    static_delta, dev_log)
+            error = None
+        except Exception as exc:  # pylint: disable=broad-except
+            error = str(exc) or type(exc).__name__
+            dev_log.error(f"Error: {error}")
+        return device["host"], error, time.monotonic() - start
+
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = list(executor.map(deploy_one, devices))
+    finally:
+        ostree.serve_ostree_stop(http_server_thread)
+
+    width = max(len("Device"), *(len(host) for host, _, _ in results))
+    log.info("Deployment results:")
+    log.info(f"  {'Device':<{width}}  Result  Time")
+    for host, error, elapsed in results:
+        outcome = "OK" if error is None else "FAILED"
+        line = f"  {host:<{width}}  {outcome:<6}  {elapsed:.1f}s"
+        if error is not None:
+            line += f"  ({error})"
+        log.info(line)
+
+    return results
 # pylint: enable=too-many-locals
@@ -2,6 +2,7 @@
 Backend for the DT (device-tree) related operations.
 """
 
+import glob
 import logging
 import json
 import os
@@ -12,6 +13,10 @@ import io
 
 log = logging.getLogger("torizon." + __name__)
 
+# File (inside the sysroot directory of the storage) indexing the device tree
+# files of the unpacked image, see get_sysroot_dt_index().
+SYSROOT_DT_INDEX_FILE = "tcbuilder-dt-index.json"
+
 
 def get_dt_changes_dir(storage_dir):
     '''Returns the directory that contains external device tree related changes.'''
@@ -80,14 +85,78 @@ def get_current_dtb_basename(storage_dir):
     return None
 
 
+def build_sysroot_dt_index(storage_dir):
+    '''Index the device tree files of the deployment(s) in the storage sysroot.
+
+    Only the "usr/lib/modules/<kernel_version>/dtb" directories are read
+    (instead of the whole root filesystem). Paths in the index are relative
+    to the sysroot directory.'''
+
+    sysroot_dir = os.path.join(storage_dir, "sysroot")
+    index = {"kernel_subdir": None, "dtbs": {}, "first_dtb": None,
+             "overlays": {}, "overlays_txt": None}
+    dtb_dirs = glob.glob(os.path.join(sysroot_dir, "ostree", "deploy", "*", "deploy", "*",
+                                      "usr", "lib", "modules", "*", "dtb"))
+    for dtb_dir in sorted(dtb_dirs):
+        if not os.path.isdir(dtb_dir) or os.path.islink(dtb_dir):
+            continue
+        rel_dtb_dir = os.path.relpath(dtb_dir, sysroot_dir)
+        if index["kernel_subdir"] is None:
+            index["kernel_subdir"] = \
+                "usr/lib/modules/" + rel_dtb_dir.split("/usr/lib/modules/", 1)[1]
+        for base_dir, dirnames, filenames in os.walk(dtb_dir):
+            dirnames.sort()
+            rel_dir = os.path.relpath(base_dir, sysroot_dir)
+            for filename in sorted(filenames):
+                path = os.path.join(rel_dir, filename)
+                if os.path.basename(base_dir) == "overlays":
+                    index["overlays"].setdefault(filename, path)
+                    continue
+                if base_dir == dtb_dir and filename == "overlays.txt":
+                    index["overlays_txt"] = index["overlays_txt"] or path
+                index["dtbs"].setdefault(filename, path)
+                if filename.endswith(".dtb") and index["first_dtb"] is None:
+                    index["first_dtb"] = path
+    return index
+
+
+def get_sysroot_dt_index(storage_dir):
+    '''Get the index of the device tree files of the unpacked image.
+
+    The index is built on first use and stored inside the sysroot directory,
+    so it is discarded along with the image when another one is unpacked.'''
+
+    index_file = os.path.join(storage_dir, "sysroot", SYSROOT_DT_INDEX_FILE)
+    try:
+        with open(index_file, "r") as jsonf:
+            return json.load(jsonf)
+    except (OSError, ValueError):
+        pass
+
+    index = build_sysroot_dt_index(storage_dir)
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "w") as jsonf:
+            json.dump(index, jsonf)
+        os.replace(tmp_file, index_file)
+    except OSError as exc:
+        log.debug(f"Could not save device tree index {index_file}: {exc}")
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
+    return index
+
+
+def get_sysroot_dt_path(storage_dir, rel_path):
+    '''Get the path of a file of the device tree index (None if not found).'''
+    if rel_path is None:
+        return None
+    return os.path.join(storage_dir, "sysroot", rel_path)
+
+
 def get_dtb_kernel_subdir(storage_dir):
     '''Returns "usr/lib/modules/<kernel_version/dtb".'''
 
-    answer = subprocess.check_output(
-        ("set -o pipefail && "
-         f"find {storage_dir}/sysroot/ostree/deploy -type d -name dtb -print -quit |"
-         " sed -r -e 's|.*/(usr/lib/modules/)|\\1|'"),
-        shell=True, text=True).strip()
+    answer = get_sysroot_dt_index(storage_dir)["kernel_subdir"]
     assert answer, "panic: missing kernel device tree directory!"
     return answer
 
@@ -112,20 +181,16 @@ def get_current_dtb_path(storage_dir):
             # This is a recently applied device tree.
             return (answer, True)
         # This is a device tree from the base image.
-        answer = subprocess.check_output(
-            ["find", f"{storage_dir}/sysroot/ostree/deploy", "-type", "f",
-             "-name", dtb_basename, "-print", "-quit"],
-            text=True).strip()
-        assert os.path.exists(answer), f"panic: missing device tree blob file for {dtb_basename}!"
+        answer = get_sysroot_dt_path(
+            storage_dir, get_sysroot_dt_index(storage_dir)["dtbs"].get(dtb_basename))
+        assert answer and os.path.exists(answer), \
+            f"panic: missing device tree blob file for {dtb_basename}!"
         return (answer, True)
 
     # Cannot identify the device tree by peeking the boot loader configuration.
     # Hint by returning the first device tree blob found in the base image.
-    answer = subprocess.check_output(
-        ["find", f"{storage_dir}/sysroot/ostree/deploy", "-type", "f",
-         "-name", "*.dtb", "-print", "-quit"],
-        text=True).strip()
-    assert os.path.exists(answer), "panic: missing device tree blobs in base image!"
+    answer = get_sysroot_dt_path(storage_dir, get_sysroot_dt_index(storage_dir)["first_dtb"])
+    assert answer and os.path.exists(answer), "panic: missing device tree blobs in base image!"
     return (answer, False)
 
 
@@ -3,6 +3,7 @@
 import logging
 import os
 import subprocess
+import tempfile
 
 from tcbuilder.backend import dt
 
@@ -21,10 +22,7 @@ def get_active_overlays_txt_path(storage_dir):
     if os.path.exists(path):
         # There is a recently applied (but not yet deployed) overlays.txt.
         return path
-    path = subprocess.check_output(
-        ["find", os.path.join(storage_dir, 'sysroot', 'ostree', 'deploy'),
-         "-type", "f", "-wholename", "*/usr/lib/modules/*/dtb/overlays.txt",
-         "-print", "-quit"], text=True).strip()
+    path = dt.get_sysroot_dt_path(storage_dir, dt.get_sysroot_dt_index(storage_dir)["overlays_txt"])
     if path:
         # The base image has an overlay definition.
         return path
@@ -57,12 +55,8 @@ def find_path_to_overlay(storage_dir, basename):
         # this base name.
         return path
     # Resort to the overlay blobs of the base image.
-    path = subprocess.check_output(
-        ["find",
-         os.path.join(storage_dir, "sysroot/ostree/deploy"),
-         "-type", "f", "-wholename",
-         os.path.join("*/usr/lib/modules/*/dtb/overlays", basename),
-         "-print", "-quit"], text=True).strip()
+    path = dt.get_sysroot_dt_path(
+        storage_dir, dt.get_sysroot_dt_index(storage_dir)["overlays"].get(basename))
     assert path, f"panic: no blob found for overlay {basename}!"
     return path
 
@@ -74,11 +68,12 @@ def get_applied_overlay_paths(storage_dir, base_names=None):
     return [find_path_to_overlay(storage_dir, basename) for basename in base_names]
 
 
-def modify_dtb_by_overlays(source_dtb_path, source_dtob_paths, target_dtb_path):
+def modify_dtb_by_overlays(source_dtb_path, source_dtob_paths, target_dtb_path, quiet=False):
     """Apply overlay blobs over device tree blob.
 
     Apply the device tree overlay blobs 'dtob_paths' over the device tree blob
     'source_dtb_path', producing the device tree blob 'target_dtb_path'.
+    With 'quiet', errors are not logged.
 
     Returns True on successful application, False otherwise.
     """
@@ -88,16 +83,43 @@ def modify_dtb_by_overlays(source_dtb_path, source_dtob_paths, target_dtb_path):
         "fdtoverlay", "-i", source_dtb_path, "-o", target_dtb_path
     ] + source_dtob_paths, check=False, capture_output=True, text=True)
     if res.returncode != 0:
-        log.error(res.stderr)
-        log.error(f"error: cannot apply device tree overlays {source_dtob_paths} "
-                  f"against device tree {source_dtb_path}.")
+        if not quiet:
+            log.error(res.stderr)
+            log.error(f"error: cannot apply device tree overlays {source_dtob_paths} "
+                      f"against device tree {source_dtb_path}.")
         return False
     dtb_check = subprocess.check_output(["file", target_dtb_path], text=True).strip()
-    log.info(dtb_check)
+    if not quiet:
+        log.info(dtb_check)
     if not "Device Tree Blob" in dtb_check:
-        log.error(
-            f"error: application of overlays {source_dtob_paths} against "
-            f"device tree {source_dtb_path} did not produce a device tree blob.")
+        if not quiet:
+            log.error(
+                f"error: application of overlays {source_dtob_paths} against "
+                f"device tree {source_dtb_path} did not produce a device tree blob.")
         return False
 
     return True
+
+
+def find_inapplicable_overlay(source_dtb_path, source_dtob_paths, start=0):
+    """Find the first overlay blob that cannot be applied.
+
+    Bisect the list of overlay blobs 'source_dtob_paths' (which as a whole cannot
+    be applied over the device tree blob 'source_dtb_path') to find the first one
+    that cannot be applied on top of the ones preceding it; the first 'start'
+    overlays are known to be applicable together.
+
+    Returns the index of the overlay in the list.
+    """
+
+    with tempfile.NamedTemporaryFile() as tmpf:
+        # Invariant: the first 'good' overlays can be applied, the first 'bad' cannot.
+        good, bad = start, len(source_dtob_paths)
+        while bad - good > 1:
+            middle = (good + bad) // 2
+            if modify_dtb_by_overlays(source_dtb_path, source_dtob_paths[:middle],
+                                      tmpf.name, quiet=True):
+                good = middle
+            else:
+                bad = middle
+    return bad - 1
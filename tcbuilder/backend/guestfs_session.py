@@ -0,0 +1,139 @@
+"""
+Helpers for sharing libguestfs appliances between the stages of a command.
+"""
+
+import contextlib
+import logging
+import os
+import time
+
+import guestfs
+
+from tcbuilder.backend.common import run_with_loading_animation
+
+log = logging.getLogger("torizon." + __name__)
+
+# Session currently active (see GuestFSSession).
+_active_session = None
+
+
+class GuestFSSession:
+    """Set of running libguestfs appliances shared by the stages of a command
+
+    Launching an appliance boots a kernel and takes several seconds. While a
+    session is active (i.e. inside a ``with GuestFSSession():`` block), the
+    appliances started by open_image() are kept running and reused whenever
+    the same image is opened again; all of them are shut down once the block
+    exits. Drives cannot be added to a running appliance, so each image gets
+    its own appliance.
+
+    Notice that images must not be modified by other programs while they are
+    open in a session.
+    """
+
+    def __init__(self):
+        # Map: image real path -> (GuestFS handle, readonly flag)
+        self.handles = {}
+
+    def __enter__(self):
+        global _active_session  # pylint: disable=global-statement
+        assert _active_session is None, "Nested guestfs sessions are not supported"
+        _active_session = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        global _active_session  # pylint: disable=global-statement
+        _active_session = None
+        self.close()
+        return False
+
+    def get(self, image, readonly, loading_msg):
+        """Get a launched appliance with the given image attached as /dev/sda"""
+        key = os.path.realpath(image)
+        if key in self.handles:
+            gfs, handle_readonly = self.handles[key]
+            if readonly or not handle_readonly:
+                log.debug(f"guestfs: reusing appliance for {image}.")
+                return gfs
+            # Image is needed in read-write mode now.
+            self.drop(image)
+
+        gfs = launch_image(image, readonly, loading_msg)
+        self.handles[key] = (gfs, readonly)
+        return gfs
+
+    def drop(self, image, shutdown=True):
+        """Stop the appliance of an image (if any)"""
+        entry = self.handles.pop(os.path.realpath(image), None)
+        if entry is not None:
+            close_handle(entry[0], shutdown)
+
+    def close(self):
+        """Stop all appliances of the session"""
+        for image in list(self.handles):
+            self.drop(image)
+
+
+def launch_image(image, readonly, loading_msg):
+    """Launch a libguestfs appliance with a single raw image attached"""
+    gfs = guestfs.GuestFS(python_return_dict=True)
+    try:
+        gfs.add_drive_opts(image, format="raw", readonly=int(readonly))
+        start = time.monotonic()
+        run_with_loading_animation(func=gfs.launch, loading_msg=loading_msg)
+        log.debug(f"guestfs: appliance for {image} launched in "
+                  f"{time.monotonic() - start:.1f}s.")
+    except:
+        gfs.close()
+        raise
+    return gfs
+
+
+def close_handle(gfs, shutdown=True):
+    """Shut down (if requested) and close a libguestfs handle"""
+    try:
+        if shutdown:
+            gfs.shutdown()
+    finally:
+        gfs.close()
+
+
+@contextlib.contextmanager
+def open_image(image, readonly=False, loading_msg="Initializing image...", operation=None):
+    """Context manager providing a launched appliance with an image attached
+
+    The appliance is taken from the active GuestFSSession if there is one;
+    otherwise it is launched just for this operation. Filesystems mounted by
+    the caller are unmounted on exit (and the appliance is stopped when not
+    shared or after a guestfs error).
+
+    :param image: Path to the raw image.
+    :param readonly: Whether the image will only be read.
+    :param loading_msg: Message displayed while the appliance is launched.
+    :param operation: Description of the operation, used for logging.
+    """
+    session = _active_session
+    if session is None:
+        gfs = launch_image(image, readonly, loading_msg)
+    else:
+        gfs = session.get(image, readonly, loading_msg)
+
+    start = time.monotonic()
+    failed = False
+    try:
+        yield gfs
+    except RuntimeError:
+        # Errors coming from guestfs: the appliance may be unusable now.
+        failed = True
+        raise
+    finally:
+        log.debug(f"guestfs: {operation or 'operation'} on {image} took "
+                  f"{time.monotonic() - start:.1f}s.")
+        if session is None:
+            close_handle(gfs, shutdown=not failed)
+        elif failed:
+            session.drop(image, shutdown=False)
+        else:
+            gfs.umount_all()
+            if not readonly:
+                gfs.sync()
@@ -4,6 +4,8 @@ Backend handling for build subcommand
 
 import base64
 import binascii
+import concurrent.futures
+import hashlib
 import http.server
 import json
 import logging
@@ -11,22 +13,28 @@ import os
 import re
 import shlex
 import shutil
+import stat
 import subprocess
 import sys
+import tarfile
 import tempfile
+import time
 import urllib.request
 
 from zipfile import ZipFile
 from tempfile import TemporaryDirectory
 
-import guestfs
 import paramiko
 
+from gi.repository import Gio
+
 from tcbuilder.backend.common import (get_rootfs_tarball, get_tar_compress_program_options,
-                                      set_output_ownership, run_with_loading_animation,
-                                      get_tezi_image_version, DEFAULT_RAW_ROOTFS_LABEL,
-                                      RAW_PROP_TO_ARGNAME)
+                                      get_parallel_unpack_command, set_output_ownership,
+                                      run_with_loading_animation, get_tezi_image_version,
+                                      get_file_sha256sum, copy_tree,
+                                      DEFAULT_RAW_ROOTFS_LABEL, RAW_PROP_TO_ARGNAME)
 from tcbuilder.backend import ostree
+from tcbuilder.backend.guestfs_session import open_image
 from tcbuilder.errors import (TorizonCoreBuilderError, InvalidArgumentError, InvalidStateError)
 from tezi.image import ImageConfig, DEFAULT_IMAGE_JSON_FILENAME
 from tezi.errors import TeziError
@@ -37,6 +45,23 @@ PROV_IMPORT_DIRNAME = "import"
 PROV_ONLINE_DATA_FILENAME = "auto-provisioning.json"
 PROV_DATA_FILENAME = "provisioning-data.tar.gz"
 
+# Directory (inside storage) holding previously unpacked images.
+UNPACK_CACHE_DIRNAME = "unpack-cache"
+# Maximum number of unpacked images kept in the cache.
+UNPACK_CACHE_MAX_ENTRIES = 3
+# Directories making up an unpacked image, in the order used by import_local_image().
+UNPACK_CACHE_SUBDIRS = ("tezi", "sysroot", "ostree-archive")
+
+# Prefix of the PAX headers where GNU tar stores extended attributes.
+TAR_XATTR_PAX_PREFIX = "SCHILY.xattr."
+# Size of the chunks read from the decompressed rootfs stream.
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Regular files larger than this are not read from the stream into memory:
+# they are imported from the file extracted by tar once it finishes.
+STREAM_MAX_MEMBER_SIZE = 16 * 1024 * 1024
+# Maximum amount of object data read from the stream waiting to be written.
+STREAM_MAX_PENDING_BYTES = 256 * 1024 * 1024
+
 VERSION_TO_YOCTO_MAP = {
     "dunfell": "dunfell-5.x.y",
     "kirkstone": "kirkstone-6.x.y"
@@ -239,19 +264,201 @@ def unpack_local_image(image_dir, sysroot_dir):
     # here
     # See: https://dev.gentoo.org/~mgorny/articles/portability-of-tar-features.html#extended-file-metadata
     # pylint: enable=line-too-long
+    # The decompressor is chosen so as to use all available cores; tar streams
+    # its output directly into the extraction.
     tarcmd = [
         "tar",
         "--xattrs", "--xattrs-include=*",
         "-xhf", tarfile,
         "-C", sysroot_dir,
-    ] + get_tar_compress_program_options(tarfile)
+    ] + get_tar_compress_program_options(tarfile, parallel=True)
     log.debug(f"Running tar command: {shlex.join(tarcmd)}")
+    tarsize = os.path.getsize(tarfile)
+    start = time.monotonic()
     subprocess.check_output(tarcmd, stderr=subprocess.STDOUT)
+    elapsed = time.monotonic() - start
+    log.info(f"Unpacked {tarsize / (1024 * 1024):.1f} MB compressed tarball in "
+             f"{elapsed:.1f}s ({tarsize / (1024 * 1024) / max(elapsed, 0.001):.1f} MB/s "
+             "of compressed data).")
 
     # Remove the tarball since we have it unpacked now
     os.unlink(tarfile)
 
 
+class _TeeReader:
+    """File-like object copying everything read from a stream into another one"""
+
+    def __init__(self, src, dst):
+        self.src = src
+        self.dst = dst
+
+    def read(self, size=-1):
+        """Read from the source stream, writing the data to the destination"""
+        data = self.src.read(size)
+        if data:
+            self.dst.write(data)
+        return data
+
+
+def _parse_object_path(name):
+    """Get checksum and extension of a loose object given its path in the sysroot
+
+    :returns: Tuple (checksum, extension) or (None, None) if the path does not
+              refer to a loose object.
+    """
+    parts = name.split(os.sep)
+    if len(parts) != 5 or parts[:3] != ["ostree", "repo", "objects"]:
+        return None, None
+    base, _, ext = parts[4].partition(".")
+    return parts[3] + base, ext
+
+
+def _get_member_xattrs(member):
+    """Get the extended attributes of a tar member as a list of (name, value)"""
+    return [(key[len(TAR_XATTR_PAX_PREFIX):].encode(),
+             value.encode("utf-8", "surrogateescape"))
+            for key, value in member.pax_headers.items()
+            if key.startswith(TAR_XATTR_PAX_PREFIX)]
+
+
+def _write_content_object_from_file(repo, csum, path):
+    """Write a content object into a repository taking the data from a file"""
+    st_info = os.lstat(path)
+    xattrs = [(name.encode(), os.getxattr(path, name, follow_symlinks=False))
+              for name in os.listxattr(path, follow_symlinks=False)]
+    if stat.S_ISLNK(st_info.st_mode):
+        ostree.write_content_object(repo, csum, b"", st_info.st_uid, st_info.st_gid,
+                                    st_info.st_mode, xattrs, os.readlink(path))
+    else:
+        stream = Gio.File.new_for_path(path).read(None)
+        try:
+            ostree.write_content_object(repo, csum, stream, st_info.st_uid, st_info.st_gid,
+                                        st_info.st_mode, xattrs, size=st_info.st_size)
+        finally:
+            stream.close(None)
+
+
+# pylint: disable=too-many-locals
+def stream_unpack_local_image(image_dir, sysroot_dir, repo):
+    """Extract the root fs tarball importing its OSTree objects on the fly
+
+    The decompressed tarball is read only once: while GNU tar extracts it
+    into the sysroot directory, every object of the sysroot's OSTree
+    repository found in the stream is written into the given (archive)
+    repository. This makes pulling the objects from the sysroot afterwards
+    unnecessary; only references need to be set.
+
+    :param image_dir: Directory of the Toradex Easy Installer image.
+    :param sysroot_dir: Directory where the root fs should be extracted.
+    :param repo: OSTree.Repo object where the objects should be imported.
+    """
+    tarball = get_rootfs_tarball(image_dir)
+    unpack_cmd = shlex.split(get_parallel_unpack_command(tarball))
+    tarcmd = [
+        "tar",
+        "--xattrs", "--xattrs-include=*",
+        "-xhf", "-",
+        "-C", sysroot_dir,
+    ]
+    log.debug(f"Running: {shlex.join(unpack_cmd)} | {shlex.join(tarcmd)}")
+
+    tarsize = os.path.getsize(tarball)
+    start = time.monotonic()
+
+    # Objects stored as hardlinks to files extracted by tar (or too large to
+    # be kept in memory): they are only imported after tar finishes writing
+    # the files.
+    linked_objects = []
+    # Pending futures mapped to the size of the data they hold.
+    pending = {}
+    workers = os.cpu_count() or 1
+
+    def submit(func, *args, size=0):
+        while pending and (len(pending) >= 4 * workers or
+                           sum(pending.values()) + size > STREAM_MAX_PENDING_BYTES):
+            done, _ = concurrent.futures.wait(
+                pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                future.result()
+        pending[executor.submit(func, *args)] = size
+
+    repo.prepare_transaction(None)
+    try:
+        with open(tarball, "rb") as infile, \
+             tempfile.TemporaryFile() as errfile, \
+             concurrent.futures.ThreadPoolExecutor(max_workers=workers) as executor:
+            unpack_proc = subprocess.Popen(unpack_cmd, stdin=infile, stdout=subprocess.PIPE)
+            tar_proc = subprocess.Popen(tarcmd, stdin=subprocess.PIPE,
+                                        stdout=errfile, stderr=subprocess.STDOUT)
+            try:
+                tee = _TeeReader(unpack_proc.stdout, tar_proc.stdin)
+                with tarfile.open(fileobj=tee, mode="r|", bufsize=STREAM_CHUNK_SIZE) as tar:
+                    for member in tar:
+                        csum, ext = _parse_object_path(os.path.normpath(member.name))
+                        if ext == "file" and member.islnk():
+                            linked_objects.append(
+                                (csum, os.path.join(sysroot_dir,
+                                                    os.path.normpath(member.linkname))))
+                        elif (ext == "file" and member.isreg() and
+                              member.size > STREAM_MAX_MEMBER_SIZE):
+                            linked_objects.append(
+                                (csum, os.path.join(sysroot_dir,
+                                                    os.path.normpath(member.name))))
+                        elif ext == "file" and (member.isreg() or member.issym()):
+                            is_sym = member.issym()
+                            data = b"" if is_sym else tar.extractfile(member).read()
+                            mode = (member.mode & 0o7777) | \
+                                (stat.S_IFLNK if is_sym else stat.S_IFREG)
+                            submit(ostree.write_content_object, repo, csum, data,
+                                   member.uid, member.gid, mode, _get_member_xattrs(member),
+                                   member.linkname if is_sym else None, size=len(data))
+                        elif ext in ostree.OSTREE_METADATA_OBJECT_TYPES and member.isreg():
+                            data = tar.extractfile(member).read()
+                            submit(ostree.write_metadata_object, repo, csum, ext, data,
+                                   size=len(data))
+                # Pass the remaining padding of the archive to tar.
+                while tee.read(STREAM_CHUNK_SIZE):
+                    pass
+            except BrokenPipeError:
+                # Tar failed: the error is reported below.
+                pass
+            except:
+                # Do not leave the decompressor blocked writing to the pipe.
+                unpack_proc.kill()
+                raise
+            finally:
+                tar_proc.stdin.close()
+                unpack_proc.stdout.close()
+                unpack_ret = unpack_proc.wait()
+                tar_ret = tar_proc.wait()
+
+            if unpack_ret or tar_ret:
+                errfile.seek(0)
+                raise subprocess.CalledProcessError(
+                    tar_ret or unpack_ret, tarcmd if tar_ret else unpack_cmd,
+                    output=errfile.read())
+
+            for csum, path in linked_objects:
+                submit(_write_content_object_from_file, repo, csum, path)
+            for future in concurrent.futures.as_completed(pending):
+                future.result()
+
+        repo.commit_transaction(None)
+    except:
+        repo.abort_transaction(None)
+        raise
+
+    elapsed = time.monotonic() - start
+    log.info(f"Unpacked and imported {tarsize / (1024 * 1024):.1f} MB compressed tarball "
+             f"in {elapsed:.1f}s ({tarsize / (1024 * 1024) / max(elapsed, 0.001):.1f} MB/s "
+             "of compressed data).")
+
+    # Remove the tarball since we have it unpacked now
+    os.unlink(tarball)
+# pylint: enable=too-many-locals
+
+
 def unpack_local_raw_image(image_dir, sysroot_dir, raw_rootfs_label):
     """Extract the root fs from the image into the sysroot directory"""
 
@@ -259,31 +466,23 @@ def unpack_local_raw_image(image_dir, sysroot_dir, raw_rootfs_label):
         raw_rootfs_label = DEFAULT_RAW_ROOTFS_LABEL
 
     try:
-        gfs = guestfs.GuestFS(python_return_dict=True)
-        # Add input image
-        gfs.add_drive_opts(image_dir, format="raw", readonly=1)
-        # Launch libguestfs backend
-        run_with_loading_animation(
-            func=gfs.launch,
-            loading_msg="Initializing WIC/raw image...")
-
-        if len(gfs.list_partitions()) < 1:
-            raise TorizonCoreBuilderError(
-                "Image doesn't have any partitions or it's not a valid WIC/raw image. Aborting.")
-
-        # Get partition number from ext4 fs called raw_rootfs_label in disk image (.wic/.img)
-        rootfs_partition = gfs.findfs_label(raw_rootfs_label)
-        log.info(f"'{raw_rootfs_label}' partition found: {rootfs_partition}")
-        gfs.mount_ro(rootfs_partition, "/")
-        run_with_loading_animation(
-            func=gfs.copy_out,
-            args=("/", sysroot_dir),
-            loading_msg="Unpacking image. This may take a few minutes...")
-        gfs.shutdown()
-        gfs.close()
+        with open_image(image_dir, readonly=True,
+                        loading_msg="Initializing WIC/raw image...",
+                        operation="rootfs unpacking") as gfs:
+            if len(gfs.list_partitions()) < 1:
+                raise TorizonCoreBuilderError(
+                    "Image doesn't have any partitions or it's not a valid WIC/raw image. "
+                    "Aborting.")
+
+            # Get partition number from ext4 fs called raw_rootfs_label in disk image (.wic/.img)
+            rootfs_partition = gfs.findfs_label(raw_rootfs_label)
+            log.info(f"'{raw_rootfs_label}' partition found: {rootfs_partition}")
+            gfs.mount_ro(rootfs_partition, "/")
+            run_with_loading_animation(
+                func=gfs.copy_out,
+                args=("/", sysroot_dir),
+                loading_msg="Unpacking image. This may take a few minutes...")
     except RuntimeError as gfserr:
-        if gfs:
-            gfs.close()
         if f"unable to resolve 'LABEL={raw_rootfs_label}'" in str(gfserr):
             raise TorizonCoreBuilderError(
                 f"Filesystem with label '{raw_rootfs_label}' not found in image. Aborting.")
@@ -300,15 +499,25 @@ def _make_tezi_extract_dir(tezi_dir):
     return extract_dir
 
 
-# pylint: disable=too-many-locals
+# pylint: disable=too-many-locals,too-many-branches
 def import_local_image(image_dir_or_file, tezi_dir, src_sysroot_dir, src_ostree_archive_dir,
-                       raw_rootfs_label=None):
+                       raw_rootfs_label=None, stream_import=False,
+                       storage_mode=ostree.DEFAULT_STORAGE_MODE):
     """Import local raw/WIC or Toradex Easy Installer image
 
     Import local raw/WIC or Toradex Easy installer image (archive file or unpacked dir) to be
     customized. Assuming an empty/non-existing src_sysroot_dir as well as src_ostree_archive_dir.
+
+    With `stream_import` (Toradex Easy Installer images only), OSTree objects are imported into
+    the archive repository while the root fs tarball is being extracted, see
+    stream_unpack_local_image().
+
+    The storage repository is created with the given `storage_mode` (a key of
+    ostree.STORAGE_MODES).
     """
     os.mkdir(src_sysroot_dir)
+    repo_mode = ostree.STORAGE_MODES[storage_mode]
+    repo = None
 
     if ((image_dir_or_file.lower().endswith(".wic") or
          image_dir_or_file.lower().endswith(".img")) and os.path.isfile(image_dir_or_file)):
@@ -348,7 +557,7 @@ def import_local_image(image_dir_or_file, tezi_dir, src_sysroot_dir, src_ostree_
         elif os.path.isdir(image_dir_or_file):
             log.info("Copying Toradex Easy Installer image.")
             log.debug(f"Copy directory {image_dir_or_file} -> {tezi_dir}.")
-            shutil.copytree(image_dir_or_file, tezi_dir)
+            copy_tree(image_dir_or_file, tezi_dir)
         elif os.path.exists(image_dir_or_file):
             raise TorizonCoreBuilderError(f"Image is not a file or directory: {image_dir_or_file}")
         else:
@@ -363,17 +572,24 @@ def import_local_image(image_dir_or_file, tezi_dir, src_sysroot_dir, src_ostree_
                             "is specific to raw images. Ignoring.")
 
         log.info("Unpacking TorizonCore Toradex Easy Installer image.")
-        unpack_local_image(tezi_dir, src_sysroot_dir)
+        if stream_import:
+            repo = ostree.create_ostree(src_ostree_archive_dir, repo_mode)
+            stream_unpack_local_image(tezi_dir, src_sysroot_dir, repo)
+        else:
+            unpack_local_image(tezi_dir, src_sysroot_dir)
 
     src_sysroot = ostree.load_sysroot(src_sysroot_dir)
     csum, _ = ostree.get_deployment_info_from_sysroot(src_sysroot)
-
-    log.info(f"Importing OSTree revision {csum} from local repository...")
-    repo = ostree.create_ostree(src_ostree_archive_dir)
     src_ostree_dir = os.path.join(src_sysroot_dir, "ostree/repo")
-
     target_refs = ostree.get_reference_dict(src_ostree_dir, base_csum=csum)
-    ostree.pull_local_refs(repo, src_ostree_dir, refs=target_refs, remote="torizon")
+
+    if repo is None:
+        log.info(f"Importing OSTree revision {csum} from local repository...")
+        repo = ostree.create_ostree(src_ostree_archive_dir, repo_mode)
+        ostree.pull_local_refs(repo, src_ostree_dir, refs=target_refs, remote="torizon")
+    else:
+        # Objects already imported while unpacking.
+        ostree.set_local_refs(repo, target_refs)
     metadata, _, _ = ostree.get_metadata_from_checksum(src_sysroot.repo(), csum)
 
     if os.path.exists(tezi_dir):
@@ -383,7 +599,146 @@ def import_local_image(image_dir_or_file, tezi_dir, src_sysroot_dir, src_ostree_
 
     log.info(f"  Commit checksum: {csum}".format(csum))
     log.info(f"  TorizonCore Version: {metadata['version']}")
-# pylint: enable=too-many-locals
+# pylint: enable=too-many-locals,too-many-branches
+
+
+def get_unpack_cache_key(image_dir_or_file, raw_rootfs_label=None,
+                         storage_mode=ostree.DEFAULT_STORAGE_MODE):
+    """Determine the key identifying an input image in the unpack cache
+
+    The key is the SHA-256 checksum of the image file, so that a checksum
+    known in advance (e.g. from a remote input) can be used to look the image
+    up before downloading it. For image directories and raw images, the key
+    is derived from the checksums of all the files and from the rootfs label.
+    Images unpacked with a non-default storage mode get a different key.
+
+    :param image_dir_or_file: Path to the image archive, file or directory.
+    :param raw_rootfs_label: Label of the rootfs in raw images (if any).
+    :param storage_mode: Mode of the storage repository (see ostree.STORAGE_MODES).
+    :returns: The cache key as a hexadecimal string.
+    """
+
+    if os.path.isdir(image_dir_or_file):
+        hasher = hashlib.sha256()
+        for rootdir, dirnames, filenames in os.walk(image_dir_or_file):
+            dirnames.sort()
+            for filename in sorted(filenames):
+                path = os.path.join(rootdir, filename)
+                relpath = os.path.relpath(path, image_dir_or_file)
+                hasher.update(f"{relpath}:{get_file_sha256sum(path)}\n".encode())
+        key = hasher.hexdigest()
+    else:
+        key = get_file_sha256sum(image_dir_or_file)
+        if raw_rootfs_label is not None:
+            key = hashlib.sha256(f"{key}:{raw_rootfs_label}".encode()).hexdigest()
+
+    return get_storage_mode_cache_key(key, storage_mode)
+
+
+def get_storage_mode_cache_key(key, storage_mode):
+    """Derive the unpack cache key of an image unpacked with a storage mode
+
+    :param key: Key of the image for the default storage mode (e.g. the
+                SHA-256 checksum of the image file).
+    :param storage_mode: Mode of the storage repository (see ostree.STORAGE_MODES).
+    :returns: The cache key as a hexadecimal string.
+    """
+
+    if storage_mode != ostree.DEFAULT_STORAGE_MODE:
+        key = hashlib.sha256(f"{key}:{storage_mode}".encode()).hexdigest()
+    return key
+
+
+def clone_tree(src_dir, dst_dir):
+    """Copy a directory tree sharing the file data with the source
+
+    Files are reflinked when the filesystem supports it and hardlinked
+    otherwise. The latter is safe for unpacked images because OSTree never
+    modifies its files in place (they are always replaced atomically).
+
+    :param src_dir: Source directory.
+    :param dst_dir: Destination directory (must not exist).
+    """
+
+    try:
+        subprocess.check_output(["cp", "-a", "--reflink=always", src_dir, dst_dir],
+                                stderr=subprocess.STDOUT)
+        return
+    except subprocess.CalledProcessError:
+        log.debug(f"Reflinks not supported: hardlinking {src_dir} -> {dst_dir}")
+        if os.path.exists(dst_dir):
+            shutil.rmtree(dst_dir)
+    subprocess.check_output(["cp", "-a", "--link", src_dir, dst_dir],
+                            stderr=subprocess.STDOUT)
+
+
+def restore_unpack_cache(cache_dir, key, tezi_dir, src_sysroot_dir, src_ostree_archive_dir):
+    """Restore a previously unpacked image from the unpack cache
+
+    Assuming empty/non-existing destination directories.
+
+    :param cache_dir: Directory holding the unpack cache.
+    :param key: Key of the image as returned by get_unpack_cache_key().
+    :returns: True if the image was found in the cache, False otherwise.
+    """
+
+    entry_dir = os.path.join(cache_dir, key)
+    if not os.path.isdir(entry_dir):
+        log.debug(f"Image {key} not found in unpack cache.")
+        return False
+
+    log.info(f"Restoring unpacked image {key} from cache.")
+    for subdir, dst_dir in zip(UNPACK_CACHE_SUBDIRS,
+                               (tezi_dir, src_sysroot_dir, src_ostree_archive_dir)):
+        if os.path.exists(os.path.join(entry_dir, subdir)):
+            clone_tree(os.path.join(entry_dir, subdir), dst_dir)
+    # Mark entry as recently used.
+    os.utime(entry_dir)
+
+    src_sysroot = ostree.load_sysroot(src_sysroot_dir)
+    csum, _ = ostree.get_deployment_info_from_sysroot(src_sysroot)
+    metadata, _, _ = ostree.get_metadata_from_checksum(src_sysroot.repo(), csum)
+    log.info("Unpacked OSTree from cache:")
+    log.info(f"  Commit checksum: {csum}")
+    log.info(f"  TorizonCore Version: {metadata['version']}")
+    return True
+
+
+def save_unpack_cache(cache_dir, key, tezi_dir, src_sysroot_dir, src_ostree_archive_dir):
+    """Store a freshly unpacked image into the unpack cache
+
+    Least recently used entries are evicted so that the cache holds at most
+    UNPACK_CACHE_MAX_ENTRIES images.
+
+    :param cache_dir: Directory holding the unpack cache.
+    :param key: Key of the image as returned by get_unpack_cache_key().
+    """
+
+    entry_dir = os.path.join(cache_dir, key)
+    if os.path.exists(entry_dir):
+        return
+
+    log.debug(f"Storing unpacked image {key} into cache.")
+    os.makedirs(cache_dir, exist_ok=True)
+    # Populate a temporary directory first so that an interrupted operation
+    # never leaves an incomplete entry behind.
+    tempdir = tempfile.mkdtemp(prefix=".", dir=cache_dir)
+    try:
+        for subdir, src_dir in zip(UNPACK_CACHE_SUBDIRS,
+                                   (tezi_dir, src_sysroot_dir, src_ostree_archive_dir)):
+            if os.path.exists(src_dir):
+                clone_tree(src_dir, os.path.join(tempdir, subdir))
+        os.rename(tempdir, entry_dir)
+    except:
+        shutil.rmtree(tempdir, ignore_errors=True)
+        raise
+
+    entries = sorted((os.path.join(cache_dir, entry) for entry in os.listdir(cache_dir)
+                      if not entry.startswith(".")),
+                     key=os.path.getmtime, reverse=True)
+    for entry in entries[UNPACK_CACHE_MAX_ENTRIES:]:
+        log.debug(f"Evicting {os.path.basename(entry)} from unpack cache.")
+        shutil.rmtree(entry)
 
 
 def prov_check_provdata_presence(input_dir):
@@ -526,7 +881,7 @@ def provision(input_dir, output_dir, shared_data, online_data, hibernated=False,
             shutil.rmtree(output_dir)
 
         log.debug("Creating copy of TorizonCore input image.")
-        shutil.copytree(input_dir, output_dir)
+        copy_tree(input_dir, output_dir)
 
     # Actual provisioning:
     try:
@@ -1,13 +1,20 @@
+import concurrent.futures
 import datetime
+import json
+import logging
 import os
+import shutil
 import subprocess
 import shlex
+import tempfile
+import threading
+import uuid
 
-import paramiko
-
-from tcbuilder.errors import OperationFailureError, TorizonCoreBuilderError
+from tcbuilder.errors import InvalidDataError, OperationFailureError
 from tcbuilder.backend.ostree import OSTREE_WHITEOUT_PREFIX, OSTREE_OPAQUE_WHITEOUT_NAME
-from tcbuilder.backend.common import resolve_remote_host
+from tcbuilder.backend.sshsession import SSHSession, DeviceLogAdapter
+
+log = logging.getLogger("torizon." + __name__)
 
 IGNORE_FILES = [
     'group-',
@@ -30,27 +37,18 @@ IGNORE_FILES = [
     'ostree/remotes.d/toradex-nightly.conf',
 ]
 TAR_NAME = 'isolated_changes.tar'
+# Size of the chunks piped from the device into the local tar (streaming mode).
+STREAM_CHUNK_SIZE = 1024 * 1024
+# Suffix of the checksum manifest kept next to the changes directory (see
+# get_manifest_file()).
+MANIFEST_SUFFIX = ".manifest.json"
+# Number of devices scanned concurrently by default (see scan_fleet_drift()).
+DEFAULT_SCAN_JOBS = 8
 
 NO_CHANGES = 0
 CHANGES_CAPTURED = 1
 
 
-def run_command_with_sudo(client, command, password):
-    stdin, stdout, _stderr = client.exec_command(command=command, get_pty=True)
-    stdin.write(password + '\n')
-    stdin.flush()
-    status = stdout.channel.recv_exit_status()  # wait for exec_command to finish
-
-    return status, stdin, stdout
-
-
-def run_command_without_sudo(client, command):
-    stdin, stdout, _stderr = client.exec_command(command)
-    status = stdout.channel.recv_exit_status()  # wait for exec_command to finish
-
-    return status, stdin, stdout
-
-
 def ignore_changes_deletion(change):
     # NOTE: this offset must match the output of `ostree admin config`:
     fname = change[5:]
@@ -60,8 +58,8 @@ def ignore_changes_deletion(change):
     return True
 
 
-def remove_tmp_dir(client, tmp_dir_name):
-    run_command_without_sudo(client, 'rm -rf ' + tmp_dir_name)
+def remove_tmp_dir(session, tmp_dir_name):
+    session.run('rm -rf ' + tmp_dir_name)
 
 
 def check_path(path):
@@ -69,57 +67,51 @@ def check_path(path):
         path.rsplit('/', 1)[0])
 
 
-def whiteouts(client, sftp_channel, tmp_dir_name, deleted_f_d):
+def whiteout_path(sftp_channel, deleted_f_d):
+    """
+    Get the path (relative to "/") of the whiteout entry for a deleted
+    file/dir of /etc.
+    """
     # check if deleted file/dir was in subdirectory of /etc --> '/' for file/dir at /etc
     path = check_path(deleted_f_d)
     if path != '/':  # file/dir was in subdirectory of /etc
         # check if any file exists other than file/dir deleted in same subdirectory of /etc
         d_list = sftp_channel.listdir('/etc' + path)
         if not d_list:  # entire content(s) deleted
-            deleted_file_dir_to_tar = 'etc' + path + OSTREE_OPAQUE_WHITEOUT_NAME
-        else:
-            deleted_file_dir_to_tar = 'etc' + path + OSTREE_WHITEOUT_PREFIX \
-                                        + deleted_f_d.rsplit('/', 1)[1]
-    else:
-        deleted_file_dir_to_tar = 'etc' + path + OSTREE_WHITEOUT_PREFIX \
-                                    + deleted_f_d
+            return 'etc' + path + OSTREE_OPAQUE_WHITEOUT_NAME
+        return 'etc' + path + OSTREE_WHITEOUT_PREFIX + deleted_f_d.rsplit('/', 1)[1]
+
+    return 'etc' + path + OSTREE_WHITEOUT_PREFIX + deleted_f_d
+
 
+def whiteouts(tmp_dir_name, deleted_file_dir_to_tar):
+    """
+    Get the command creating a whiteout entry in the torizonbuilder tmp
+    directory.
+    """
     # create deleted files/dir in torizonbuilder tmp directory with whiteout format
-    create_deleted_info_cmd = 'mkdir -p {0}/{1} && touch {0}/{2}'.format(
-        tmp_dir_name, deleted_file_dir_to_tar.rsplit('/', 1)[0],
+    return 'mkdir -p {0}/{1} && touch {0}/{2}'.format(
+        tmp_dir_name, shlex.quote(deleted_file_dir_to_tar.rsplit('/', 1)[0]),
         shlex.quote(deleted_file_dir_to_tar))
-    status, _stdin, stdout = run_command_without_sudo(client, create_deleted_info_cmd)
-    if status > 0:
-        raise OperationFailureError(
-            f'Could not create dir in {tmp_dir_name}',
-            stdout.read().decode('utf-8').strip())
-
-
-def get_tcattr_file_content(files_dir_to_tar, ssh_client, sftp_client,
-                            remote_password, tmp_dir_name):
-    """
-    Get the content (permission/ownership) for the "/etc/.tcattr"
-    metadata file of all files that will be isolated and will be
-    used later by the "union" command.
-    """
-
-    facl_command = "sudo getfacl -n {0} 2>/dev/null".format(files_dir_to_tar)
-    status, _stdin, stdout = run_command_with_sudo(ssh_client, facl_command,
-                                                   remote_password)
-    if status > 0:
-        remove_tmp_dir(ssh_client, tmp_dir_name)
-        sftp_client.close()
-        ssh_client.close()
-        facl_command_error = 'Unable to save permissions/ownership at target'
-        raise OperationFailureError(facl_command_error,
-                                    stdout.read().decode('utf-8').strip())
-
-    tcattr = stdout.read().decode("utf-8").strip().split("\r\n")
-    # remove upto password keyword
-    indx = tcattr.index("Password: ")
-    tcattr = tcattr[(indx + 1):]
-    tcattr = "\n".join(tcattr) + "\n"
-    return tcattr
+
+
+def create_local_whiteouts(usr_dir, whiteout_paths):
+    """
+    Create the whiteout entries directly in the local changes directory.
+    """
+    for path in whiteout_paths:
+        os.makedirs(os.path.join(usr_dir, os.path.dirname(path)), exist_ok=True)
+        with open(os.path.join(usr_dir, path), "w"):
+            pass
+
+
+def get_tcattr_command(files_dir_to_tar):
+    """
+    Get the command producing the content (permission/ownership) for the
+    "/etc/.tcattr" metadata file of all files that will be isolated and
+    will be used later by the "union" command.
+    """
+    return "getfacl -n {0} 2>/dev/null".format(files_dir_to_tar)
 
 
 def create_tcattr_file(diff_dir, tcattr):
@@ -140,100 +132,464 @@ def list_to_string_with_quote(args_list):
     return r' '.join([shlex.quote(file) for file in args_list])
 
 
-# pylint: disable=too-many-locals
-def isolate_user_changes(diff_dir, r_name_ip, r_username, r_password, r_port, r_mdns):
-    client = paramiko.SSHClient()
-    client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
-
-    resolved_remote_host = resolve_remote_host(r_name_ip, r_mdns)
-    client.connect(hostname=resolved_remote_host,
-                   username=r_username,
-                   password=r_password,
-                   port=r_port)
-    # get config diff
-    status, _stdin, stdout = run_command_with_sudo(
-        client, 'sudo ostree admin config-diff', r_password)
-    if status > 0:
-        client.close()
-        raise OperationFailureError('Unable to get user changes',
-                                    stdout.read().decode('utf-8').strip())
-
-    output = stdout.read().decode("utf-8").split("\r\n")
-    # remove upto password keyword
-    indx = output.index("Password: ")
-    output = output[(indx + 1):]
+def extract_tar_command(usr_dir, archive, compress=False):
+    """
+    Get the command extracting the isolated changes into {diff_dir}/usr/ so
+    that at time of union they can be committed to /usr/etc of unpacked
+    image as it is.
+    """
+    return [
+        "tar", "--acls", "--xattrs", "--overwrite", "--preserve-permissions",
+        "-xzf" if compress else "-xf", archive, "-C", os.path.join(usr_dir, "")
+    ]
 
-    # filter out files
-    changed_itr = filter(ignore_changes_deletion, output)
-    changes = list(changed_itr)
-    if not changes:
-        return NO_CHANGES
-
-    # Buffer to store the content for the ".tcattr" file
-    tcattr = None
-
-    sftp = client.open_sftp()
-    if sftp is not None:
-        # perform all operations in /tmp
-        tmp_dir_name = '/tmp/torizon-builder-' + str(datetime.datetime.now().date()) + '_' + str(
-            datetime.datetime.now().time()).replace(':', '-')
-        sftp.mkdir(tmp_dir_name)
-
-        files_dir_to_tar = ''
-        files_list = []
-        f_delete_exists = False
-        # append /etc because ostree config provides file/dir names relative to /etc
-        for item in changes:
-            f_name = item[5:]   # Sync with ignore_changes_deletion
-            if item[0] != 'D':
-                files_list.append('/etc/' + f_name)
-            else:
-                f_delete_exists = True
-                whiteouts(client, sftp, tmp_dir_name, f_name)
+
+def get_tcattr_content(session, facl_files):
+    """
+    Get the content for the ".tcattr" file of the given files (on its own
+    remote command, used when there are no files to be transferred).
+    """
+    if not facl_files:
+        return ""
+    result = session.run_batch(
+        [get_tcattr_command(list_to_string_with_quote(facl_files))], check=False)[-1]
+    if not result.ok:
+        raise OperationFailureError('Unable to save permissions/ownership at target',
+                                    result.output.strip())
+    return result.output.strip() + "\n"
+
+
+def fetch_user_changes(session, usr_dir, files_list, whiteout_paths, facl_files=None):
+    """
+    Capture the changed files by creating an archive in the device's /tmp,
+    copying it with SFTP and extracting it locally.
+
+    :param facl_files: Files whose permissions/ownership go into the ".tcattr"
+                       file (default: files_list).
+    :returns: Content for the ".tcattr" file.
+    """
+    if facl_files is None:
+        facl_files = files_list
+    os.makedirs(usr_dir, exist_ok=True)
+    if not files_list and not whiteout_paths:
+        return get_tcattr_content(session, facl_files)
+
+    # perform all operations in /tmp
+    tmp_dir_name = '/tmp/torizon-builder-' + str(datetime.datetime.now().date()) + '_' + str(
+        datetime.datetime.now().time()).replace(':', '-')
+    sftp = session.sftp()
+    sftp.mkdir(tmp_dir_name)
+
+    local_tar = os.path.join(os.path.dirname(usr_dir), TAR_NAME)
+    try:
+        if whiteout_paths:
+            result = session.run_batch(
+                [whiteouts(tmp_dir_name, path) for path in whiteout_paths],
+                sudo=False, check=False)[-1]
+            if not result.ok:
+                raise OperationFailureError(
+                    f'Could not create dir in {tmp_dir_name}', result.output.strip())
 
         files_dir_to_tar = list_to_string_with_quote(files_list)
-        if f_delete_exists:
-            tar_command = "sudo tar --exclude={0} --xattrs --acls -cf {1}/{0} -C {1} . {2}". \
+        if whiteout_paths:
+            tar_command = "tar --exclude={0} --xattrs --acls -cf {1}/{0} -C {1} . {2}". \
                 format(TAR_NAME, tmp_dir_name, files_dir_to_tar)
         else:
             # don't include current directory i.e. '.':
             # whiteout files does not exist in /tmp/torizon-builder/
-            tar_command = "sudo tar --xattrs --acls -cf {1}/{0} {2}".format(
+            tar_command = "tar --xattrs --acls -cf {1}/{0} {2}".format(
                 TAR_NAME, tmp_dir_name, files_dir_to_tar)
-        # make tar
-        status, _stdin, stdout = run_command_with_sudo(client, tar_command, r_password)
-        if status > 0:
-            remove_tmp_dir(client, tmp_dir_name)
-            sftp.close()
-            client.close()
-            raise OperationFailureError('Unable to bundle up changes at target',
-                                        stdout.read().decode('utf-8').strip())
+
+        # make tar and get permissions/ownership in a single batch
+        results = session.run_batch(
+            [tar_command, get_tcattr_command(list_to_string_with_quote(facl_files))],
+            check=False)
+        if not results[-1].ok:
+            if len(results) == 1:
+                raise OperationFailureError('Unable to bundle up changes at target',
+                                            results[-1].output.strip())
+            raise OperationFailureError('Unable to save permissions/ownership at target',
+                                        results[-1].output.strip())
+        tcattr = results[-1].output.strip() + "\n"
 
         # get the tar
-        sftp.get(tmp_dir_name + '/' + TAR_NAME, diff_dir + '/' + TAR_NAME, None)
-        remove_tmp_dir(client, tmp_dir_name)
-        sftp.close()
-
-        tcattr = get_tcattr_file_content(files_dir_to_tar, client, sftp,
-                                         r_password, tmp_dir_name)
-    else:
-        client.close()
-        raise TorizonCoreBuilderError('Unable to create SSH connection for transferring of files')
-
-    client.close()
-
-    # Extract tar to diff_dir/usr/ so that at time of union
-    # they can be committed to /usr/etc of unpacked image as it is
-    os.mkdir(os.path.join(diff_dir, "usr"))
-    extract_tar_cmd = [
-        "tar", "--acls", "--xattrs", "--overwrite", "--preserve-permissions", "-xf",
-        os.path.join(diff_dir, TAR_NAME), "-C", os.path.join(diff_dir, "usr", "")
-    ]
-    subprocess.check_output(extract_tar_cmd, stderr=subprocess.STDOUT)
+        sftp.get(tmp_dir_name + '/' + TAR_NAME, local_tar, None)
+    finally:
+        remove_tmp_dir(session, tmp_dir_name)
 
-    create_tcattr_file(diff_dir, tcattr)
+    subprocess.check_output(extract_tar_command(usr_dir, local_tar), stderr=subprocess.STDOUT)
+    os.remove(local_tar)
+
+    return tcattr
 
-    os.remove(os.path.join(diff_dir, TAR_NAME))
 
-    return CHANGES_CAPTURED
+# pylint: disable=too-many-locals
+def stream_user_changes(session, usr_dir, files_list, compress=False, facl_files=None):
+    """
+    Capture the changed files by piping tar from the device straight into a
+    local tar extracting them, so that nothing is staged on the device or
+    written twice locally. The permissions/ownership for the ".tcattr" file
+    are sent (through stderr) by the same remote command.
+
+    :param compress: Whether to compress the stream with gzip.
+    :param facl_files: Files whose permissions/ownership go into the ".tcattr"
+                       file (default: files_list).
+    :returns: Content for the ".tcattr" file.
+    """
+    if facl_files is None:
+        facl_files = files_list
+    os.makedirs(usr_dir, exist_ok=True)
+    if not files_list:
+        return get_tcattr_content(session, facl_files)
+
+    marker = f"@@tcbuilder-{uuid.uuid4().hex}"
+    # Paths relative to "/" keep tar from complaining about leading slashes.
+    files = list_to_string_with_quote([name.lstrip('/') for name in files_list])
+    facl = list_to_string_with_quote([name.lstrip('/') for name in facl_files])
+    script = "\n".join([
+        "cd / || exit",
+        f'{{ getfacl -n {facl} 2>/dev/null; st=$?; echo "{marker} $st"; }} >&2',
+        '[ "$st" -eq 0 ] || exit "$st"',
+        f"exec tar --xattrs --acls -c{'z' if compress else ''}f - {files}"
+    ])
+    stdout, stderr = session.start("sh -c " + shlex.quote(script), sudo=True)
+
+    # Read stderr concurrently so that the channel never stalls on it.
+    stderr_data = []
+    stderr_thread = threading.Thread(
+        target=lambda: stderr_data.append(stderr.read()), daemon=True)
+    stderr_thread.start()
+
+    with tempfile.TemporaryFile() as tar_log:
+        extract = subprocess.Popen(extract_tar_command(usr_dir, "-", compress),
+                                   stdin=subprocess.PIPE, stdout=tar_log,
+                                   stderr=subprocess.STDOUT)
+        try:
+            while True:
+                chunk = stdout.read(STREAM_CHUNK_SIZE)
+                if not chunk:
+                    break
+                extract.stdin.write(chunk)
+        except BrokenPipeError:
+            pass  # Extraction failed: reported below.
+        finally:
+            extract.stdin.close()
+        extract_status = extract.wait()
+        tar_log.seek(0)
+        extract_output = tar_log.read().decode("utf-8", errors="replace").strip()
+
+    status = stdout.channel.recv_exit_status()
+    stderr_thread.join()
+
+    tcattr, found, remote_output = b"".join(stderr_data).decode("utf-8").partition(marker)
+    if not found:
+        raise OperationFailureError('Unable to get user changes', tcattr.strip())
+    facl_status, _, remote_output = remote_output.partition("\n")
+    if int(facl_status) != 0:
+        raise OperationFailureError('Unable to save permissions/ownership at target',
+                                    tcattr.strip())
+    if status != 0 or extract_status != 0:
+        raise OperationFailureError('Unable to bundle up changes at target',
+                                    "\n".join([remote_output.strip(), extract_output]).strip())
+
+    return tcattr.strip() + "\n"
 # pylint: enable=too-many-locals
+
+
+def get_config_diff(session):
+    """
+    Get the changes made to /etc on a device (as reported by "ostree admin
+    config-diff"), leaving out the ignored files.
+
+    :returns: List of tuples (status, name) where status is "A" (added),
+              "M" (modified) or "D" (deleted) and name is relative to /etc.
+    """
+    result = session.run_batch(['ostree admin config-diff'], check=False)[-1]
+    if not result.ok:
+        raise OperationFailureError('Unable to get user changes', result.output.strip())
+
+    # filter out files
+    changes = filter(ignore_changes_deletion, result.output.splitlines())
+    return [(item[0], item[5:]) for item in changes]   # Sync with ignore_changes_deletion
+
+
+def split_config_diff(session, changes):
+    """
+    Split changes into the files to be captured and the whiteout entries for
+    the deleted ones.
+
+    :returns: Tuple (files_list, whiteout_paths).
+    """
+    files_list = []
+    whiteout_paths = []
+    # append /etc because ostree config provides file/dir names relative to /etc
+    for status, f_name in changes:
+        if status != 'D':
+            files_list.append('/etc/' + f_name)
+        else:
+            whiteout_paths.append(whiteout_path(session.sftp(), f_name))
+    return files_list, whiteout_paths
+
+
+def get_manifest_file(diff_dir):
+    """
+    Get the path of the checksum manifest of a changes directory; it is kept
+    next to the directory so that it does not end up in the union commit.
+    """
+    return os.path.normpath(diff_dir) + MANIFEST_SUFFIX
+
+
+def load_manifest(manifest_file):
+    """
+    Load the checksum manifest of a previous capture (if any).
+
+    :returns: Tuple (files, whiteouts) where files maps the path (relative
+              to "/") of each captured file to its digest and whiteouts is
+              the list of whiteout entries created.
+    """
+    try:
+        with open(manifest_file, encoding="utf-8") as infile:
+            manifest = json.load(infile)
+        return manifest["files"], manifest["whiteouts"]
+    except FileNotFoundError:
+        return {}, []
+    except (ValueError, KeyError, TypeError) as exc:
+        raise InvalidDataError(f"Error loading manifest file '{manifest_file}': {exc}")
+
+
+def save_manifest(manifest_file, files, whiteout_paths):
+    """
+    Save the checksum manifest of a capture.
+    """
+    with open(manifest_file, "w", encoding="utf-8") as outfile:
+        json.dump({"files": files, "whiteouts": whiteout_paths}, outfile,
+                  indent=2, sort_keys=True)
+
+
+def hash_remote_files(session, files_list):
+    """
+    Get a digest of the content and basic metadata (mode and ownership) of
+    each file on the device; contents are hashed on the device so only the
+    digests are transferred.
+
+    :returns: Dictionary mapping the path (relative to "/") of each file to
+              its digest.
+    """
+    if not files_list:
+        return {}
+
+    # Output lines: "<mode>:<uid>:<gid> <hash> <path>" (hash of the content
+    # for regular files, of the target for links and "-" for directories).
+    script = "\n".join([
+        "cd / || exit",
+        "for f do",
+        '    if [ -L "$f" ]; then h=$(readlink "$f" | sha256sum) || exit',
+        '    elif [ -f "$f" ]; then h=$(sha256sum < "$f") || exit',
+        "    else h=-; fi",
+        "    m=$(stat -c '%f:%u:%g' \"$f\") || exit",
+        '    printf \'%s %s %s\\n\' "$m" "${h%% *}" "$f"',
+        "done"
+    ])
+    files = [name.lstrip('/') for name in files_list]
+    result = session.run_batch(
+        ["sh -c " + shlex.quote(script) + " sh " + list_to_string_with_quote(files)],
+        check=False)[-1]
+    if not result.ok:
+        raise OperationFailureError('Unable to checksum changes at target',
+                                    result.output.strip())
+
+    digests = {}
+    for line in result.output.splitlines():
+        meta, digest, path = line.split(" ", 2)
+        digests[path] = f"{meta} {digest}"
+    return digests
+
+
+def remove_stale_entries(usr_dir, paths):
+    """
+    Remove entries of a previous capture from the local changes directory.
+    """
+    for path in paths:
+        full_path = os.path.join(usr_dir, path)
+        if os.path.isdir(full_path) and not os.path.islink(full_path):
+            shutil.rmtree(full_path)
+        elif os.path.lexists(full_path):
+            os.remove(full_path)
+
+
+# pylint: disable=too-many-arguments,too-many-locals
+def isolate_user_changes(diff_dir, r_name_ip, r_username, r_password, r_port, r_mdns,
+                         stream=False, compress=False, incremental=False):
+    """
+    Capture the changes made to /etc on a device into diff_dir.
+
+    :param stream: Whether to pipe the changes from the device straight into
+                   diff_dir instead of staging an archive in the device's /tmp.
+    :param compress: Whether to compress the stream (when streaming).
+    :param incremental: Whether to transfer only the files that changed since
+                        the previous capture into diff_dir, based on its
+                        checksum manifest (see get_manifest_file()), which is
+                        updated.
+    """
+    manifest_file = get_manifest_file(diff_dir)
+    usr_dir = os.path.join(diff_dir, "usr")
+
+    with SSHSession.connect(r_name_ip, r_username, r_password, r_port, r_mdns) as session:
+        changes = get_config_diff(session)
+        if not changes:
+            if incremental:
+                # Drop whatever a previous capture left.
+                shutil.rmtree(usr_dir, ignore_errors=True)
+                if os.path.exists(manifest_file):
+                    os.remove(manifest_file)
+            return NO_CHANGES
+
+        files_list, whiteout_paths = split_config_diff(session, changes)
+
+        if incremental:
+            old_digests, old_whiteouts = load_manifest(manifest_file)
+            digests = hash_remote_files(session, files_list)
+            remove_stale_entries(
+                usr_dir,
+                [path for path in old_digests if path not in digests] +
+                [path for path in old_whiteouts if path not in whiteout_paths])
+            fetch_list = [
+                '/' + path for path, digest in digests.items()
+                if old_digests.get(path) != digest or
+                not os.path.lexists(os.path.join(usr_dir, path))]
+            log.info(f"{len(fetch_list)} of {len(files_list)} changed file(s) "
+                     "differ from the previous capture.")
+            # Whiteouts are always created locally in this mode.
+            if stream:
+                tcattr = stream_user_changes(session, usr_dir, fetch_list, compress,
+                                             facl_files=files_list)
+            else:
+                tcattr = fetch_user_changes(session, usr_dir, fetch_list, [],
+                                            facl_files=files_list)
+            create_local_whiteouts(usr_dir, whiteout_paths)
+        elif stream:
+            tcattr = stream_user_changes(session, usr_dir, files_list, compress)
+            create_local_whiteouts(usr_dir, whiteout_paths)
+        else:
+            tcattr = fetch_user_changes(session, usr_dir, files_list, whiteout_paths)
+
+    create_tcattr_file(diff_dir, tcattr)
+    if incremental:
+        save_manifest(manifest_file, digests, whiteout_paths)
+
+    return CHANGES_CAPTURED
+# pylint: enable=too-many-arguments,too-many-locals
+
+
+def scan_device_drift(device, fetch_dir=None):
+    """
+    Get the changes made to /etc on a device along with the digest of each
+    changed file (computed on the device, so no contents are transferred).
+
+    :param device: Dictionary with the keys "host", "username", "password",
+                   "port" and "mdns_source" describing the device.
+    :param fetch_dir: Directory where to capture the changes (as done by
+                      isolate_user_changes()) or None to not download them.
+    :returns: Dictionary mapping the path (relative to "/") of each changed
+              file to a tuple (status, digest), where digest is None for
+              deleted files.
+    """
+    with SSHSession.connect(device["host"], device["username"], device["password"],
+                            device["port"], device.get("mdns_source")) as session:
+        changes = get_config_diff(session)
+        digests = hash_remote_files(
+            session, ['/etc/' + f_name for status, f_name in changes if status != 'D'])
+        drift = {'etc/' + f_name: (status, digests.get('etc/' + f_name))
+                 for status, f_name in changes}
+
+        if fetch_dir is not None and changes:
+            files_list, whiteout_paths = split_config_diff(session, changes)
+            os.mkdir(fetch_dir)
+            usr_dir = os.path.join(fetch_dir, "usr")
+            tcattr = stream_user_changes(session, usr_dir, files_list)
+            create_local_whiteouts(usr_dir, whiteout_paths)
+            create_tcattr_file(fetch_dir, tcattr)
+
+    return drift
+
+
+def build_drift_report(scans):
+    """
+    Consolidate the changes found on several devices.
+
+    :param scans: List of tuples (host, drift, error) where drift is as
+                  returned by scan_device_drift() and error is None if the
+                  scan succeeded.
+    :returns: Dictionary with the keys "devices" (hosts scanned successfully),
+              "failed" (mapping of host to error) and "files": a list sorted
+              by path where each changed file appears once, with its
+              "variants", i.e. the distinct (status, digest) pairs found and
+              the devices holding each of them.
+    """
+    files = {}
+    for host, drift, error in scans:
+        if error is not None:
+            continue
+        for path, (status, digest) in drift.items():
+            files.setdefault(path, {}).setdefault((status, digest), []).append(host)
+
+    return {
+        "devices": [host for host, _, error in scans if error is None],
+        "failed": {host: error for host, _, error in scans if error is not None},
+        "files": [
+            {"path": path,
+             "variants": [{"status": status, "digest": digest, "devices": hosts}
+                          for (status, digest), hosts in sorted(
+                              variants.items(), key=lambda item: -len(item[1]))]}
+            for path, variants in sorted(files.items())
+        ]
+    }
+
+
+def log_drift_report(report):
+    """
+    Log a drift report as built by build_drift_report().
+    """
+    log.info(f"Drift report ({len(report['devices'])} device(s) scanned, "
+             f"{len(report['failed'])} failed, {len(report['files'])} file(s) changed):")
+    for entry in report["files"]:
+        for idx, variant in enumerate(entry["variants"]):
+            path = entry["path"] if idx == 0 else ""
+            digest = variant["digest"].split()[-1][:12] if variant["digest"] else "-"
+            log.info(f"  {path:<40} {variant['status']} {digest:<12} "
+                     f"{', '.join(variant['devices'])}")
+    for host, error in report["failed"].items():
+        log.info(f"  {host}: FAILED ({error})")
+
+
+def scan_fleet_drift(devices, jobs=DEFAULT_SCAN_JOBS, fetch_dir=None):
+    """
+    Scan several devices concurrently for changes made to /etc.
+
+    :param devices: List of devices as returned by load_device_inventory().
+    :param jobs: Maximum number of devices scanned at the same time.
+    :param fetch_dir: Directory where to capture the changes of each device
+                      (into a subdirectory named after the device) or None
+                      to not download them.
+    :returns: Report as built by build_drift_report().
+    """
+
+    def scan_one(device):
+        dev_log = DeviceLogAdapter(log, {"host": device["host"]})
+        try:
+            drift = scan_device_drift(
+                device, fetch_dir and os.path.join(fetch_dir, device["host"]))
+            dev_log.info(f"{len(drift)} changed file(s) in /etc.")
+            return device["host"], drift, None
+        except Exception as exc:  # pylint: disable=broad-except
+            error = str(exc) or type(exc).__name__
+            dev_log.error(f"Error: {error}")
+            return device["host"], None, error
+
+    log.info(f"Scanning {len(devices)} device(s), {jobs} at a time...")
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+        scans = list(executor.map(scan_one, devices))
+
+    report = build_drift_report(scans)
+    log_drift_report(report)
+    return report
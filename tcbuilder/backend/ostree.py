@@ -3,12 +3,17 @@
 Helper functions for commonly used OSTree functions.
 """
 
+import base64
+import concurrent.futures
+import json
 import logging
 import os
 import re
+import socket
 import subprocess
 import traceback
 import threading
+import time
 
 from functools import partial
 from http.server import SimpleHTTPRequestHandler, HTTPServer
@@ -25,6 +30,37 @@ log = logging.getLogger("torizon." + __name__)
 
 OSTREE_BASE_REF = "base"
 DEFAULT_SERVER_PORT = 8080
+# Maximum number of connections handled concurrently by the HTTP server.
+DEFAULT_SERVER_WORKERS = 16
+# Seconds after which idle (keep-alive) connections are closed by the server.
+SERVER_IDLE_TIMEOUT = 10
+
+# Modes of the storage repository: objects are stored compressed ("archive",
+# as needed to serve them over HTTP or push them to the OTA server) or
+# uncompressed ("bare-user", faster for local work; an archive copy of the
+# repository is then created when needed, see get_archive_repo()).
+STORAGE_MODES = {
+    "archive": OSTree.RepoMode.ARCHIVE_Z2,
+    "bare-user": OSTree.RepoMode.BARE_USER,
+}
+DEFAULT_STORAGE_MODE = "archive"
+# Suffix of the directory holding the archive copy of a non-archive repository.
+ARCHIVE_EXPORT_SUFFIX = "-export"
+
+# File (inside the storage directory) caching information about the commits
+# of the repositories of the storage, see get_commit_info().
+COMMIT_INDEX_FILE = "commit-index.json"
+# Repositories of the storage directory (relative to it) using its commit
+# index; commits of any other repository are only cached in memory.
+STORAGE_REPO_DIRS = ("ostree-archive", "ostree-archive" + ARCHIVE_EXPORT_SUFFIX,
+                     os.path.join("sysroot", "ostree", "repo"))
+# Location of the kernel modules (and kernel and device trees) in a commit.
+KERNEL_MODULES_DIR = "/usr/lib/modules"
+
+# Commit indexes already loaded, by path of the index file (or of the
+# repository for indexes kept only in memory).
+_commit_indexes = {}
+_commit_indexes_lock = threading.Lock()
 
 # Whiteout defines match what Containers are using:
 # https://github.com/opencontainers/image-spec/blob/v1.0.1/layer.md#whiteouts
@@ -32,6 +68,14 @@ DEFAULT_SERVER_PORT = 8080
 OSTREE_WHITEOUT_PREFIX = ".wh."
 OSTREE_OPAQUE_WHITEOUT_NAME = ".wh..wh..opq"
 
+# Metadata object types indexed by the extension of loose object files.
+OSTREE_METADATA_OBJECT_TYPES = {
+    "dirtree": OSTree.ObjectType.DIR_TREE,
+    "dirmeta": OSTree.ObjectType.DIR_META,
+    "commit": OSTree.ObjectType.COMMIT,
+    "commitmeta": OSTree.ObjectType.COMMIT_META,
+}
+
 def open_ostree(ostree_dir):
     repo = OSTree.Repo.new(Gio.File.new_for_path(ostree_dir))
     if not repo.open(None):
@@ -43,6 +87,65 @@ def create_ostree(ostree_dir, mode: OSTree.RepoMode = OSTree.RepoMode.ARCHIVE_Z2
     repo.create(mode, None)
     return repo
 
+def _get_storage_dir(repo_dir, storage_repo_dirs):
+    """
+    Get the storage directory holding a repository.
+
+    :param repo_dir: Absolute path of the repository.
+    :param storage_repo_dirs: Locations of the repository (relative to the
+                              storage directory) to consider.
+    :returns: The path of the storage directory or None if the repository
+              is not one of the given ones of a storage directory.
+    """
+    repo_dir = os.path.normpath(repo_dir)
+    for storage_repo_dir in storage_repo_dirs:
+        if not repo_dir.endswith(os.sep + storage_repo_dir):
+            continue
+        storage_dir = repo_dir[:-len(storage_repo_dir) - 1]
+        if all(os.path.isdir(os.path.join(storage_dir, subdir))
+               for subdir in ("ostree-archive", "sysroot")):
+            return storage_dir
+    return None
+
+
+def get_archive_repo(ostree_dir):
+    """
+    Get an archive repository holding all references of a repository, as
+    needed to serve it over HTTP or push it to the OTA server.
+
+    If the storage repository is not in archive mode (see STORAGE_MODES),
+    its references are pulled into a sibling archive repository (created on
+    first use; later calls only compress the objects missing there). Any
+    other repository must be in archive mode.
+
+    :param ostree_dir: Path of the repository.
+    :returns: Path of the archive repository.
+    :raises:
+        TorizonCoreBuilderError: if the repository is neither in archive mode
+                                 nor the storage repository.
+    """
+    repo = open_ostree(ostree_dir)
+    if repo.get_mode() == OSTree.RepoMode.ARCHIVE_Z2:
+        return ostree_dir
+
+    if _get_storage_dir(os.path.abspath(ostree_dir), ("ostree-archive",)) is None:
+        raise TorizonCoreBuilderError(
+            f"OSTree repository {ostree_dir} is not in archive mode: only archive "
+            "repositories can be used.")
+
+    archive_dir = os.path.normpath(ostree_dir) + ARCHIVE_EXPORT_SUFFIX
+    if os.path.isdir(archive_dir):
+        archive_repo = open_ostree(archive_dir)
+    else:
+        archive_repo = create_ostree(archive_dir)
+
+    log.info(f"Updating archive copy {archive_dir} of the OSTree repository...")
+    start = time.monotonic()
+    pull_local_refs(archive_repo, ostree_dir, refs=get_reference_dict(ostree_dir))
+    log.debug(f"Archive copy updated in {time.monotonic() - start:.1f}s.")
+    return archive_dir
+
+
 def load_sysroot(sysroot_dir):
     sysroot = OSTree.Sysroot.new(Gio.File.new_for_path(sysroot_dir))
     sysroot.load()
@@ -65,25 +168,150 @@ def get_deployment_info_from_sysroot(sysroot):
     return csum, kargs
 
 
-def get_metadata_from_checksum(repo, csum):
-    result, commitvar, _state = repo.load_commit(csum)
+def _resolve_commit(repo, rev):
+    """Get the checksum of a commit given a reference or a checksum"""
+    try:
+        result, csum = repo.resolve_rev(rev, False)
+    except GLib.Error:
+        result = False
     if not result:
-        raise TorizonCoreBuilderError(f"Error loading commit {csum}.")
+        raise TorizonCoreBuilderError(f"Error loading commit {rev}.")
+    return csum
+
+
+def _get_commit_index_file(repo_dir):
+    """Get the commit index file used for a repository (None if not in the storage)"""
+    storage_dir = _get_storage_dir(repo_dir, STORAGE_REPO_DIRS)
+    if storage_dir is None:
+        return None
+    return os.path.join(storage_dir, COMMIT_INDEX_FILE)
+
+
+def _load_commit_index(index_file):
+    """Get the commit index stored in a file (empty if missing or invalid)"""
+    if index_file not in _commit_indexes:
+        try:
+            with open(index_file, encoding="utf-8") as infile:
+                index = json.load(infile)
+            if not isinstance(index, dict):
+                raise ValueError("not a dictionary")
+        except FileNotFoundError:
+            index = {}
+        except (OSError, ValueError) as exc:
+            log.debug(f"Ignoring invalid commit index {index_file}: {exc}")
+            index = {}
+        _commit_indexes[index_file] = index
+    return _commit_indexes[index_file]
+
+
+def _save_commit_index(index_file, index):
+    """Store a commit index replacing the file atomically"""
+    tmp_file = f"{index_file}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_file, "w", encoding="utf-8") as outfile:
+            json.dump(index, outfile)
+        os.replace(tmp_file, index_file)
+    except OSError as exc:
+        # E.g. read-only storage: the index only avoids repeated work.
+        log.debug(f"Could not save commit index {index_file}: {exc}")
+        if os.path.exists(tmp_file):
+            os.unlink(tmp_file)
 
-    # commitvar is GLib.Variant, use unpack to get a Python dictionary
-    commit = commitvar.unpack()
 
-    # Unpack commit object, see OSTree src/libostree/ostree-repo-commit.c
-    metadata, _parent, _, subject, body, _time, _content_csum, _metadata_csum = commit
+def _find_kernel(repo, csum):
+    """Get the kernel version of a commit"""
 
-    return metadata, subject, body
+    kernel_version = ""
 
-def get_metadata_from_ref(repo, ref):
-    result, _, csum = repo.read_commit(ref)
-    if not result:
-        raise TorizonCoreBuilderError(f"Error loading commit {ref}.")
+    module_files = ls(repo, KERNEL_MODULES_DIR, csum)
+    module_dirs = filter(lambda file: file["type"] == "directory",
+                         module_files)
+
+    # This is a similar approach to what OSTree does in the deploy command.
+    # It searches for the directory under /usr/lib/modules/<kver> which
+    # contains a vmlinuz file.
+    for module_dir in module_dirs:
+        directory_name = module_dir["name"]
+
+        # Check if the directory contains a vmlinuz image if so it is our
+        # kernel directory
+        files = ls(repo, f"{KERNEL_MODULES_DIR}/{directory_name}", csum)
+        if any(file for file in files if file["name"] == "vmlinuz"):
+            kernel_version = directory_name
+            break
+
+    return kernel_version
+
+
+def get_commit_info(repo, rev, kernel=False):
+    """
+    Get information about a commit from the commit index.
+
+    The index is keyed by commit checksum (commits never change, so entries
+    never become stale); the information is collected from the commit on
+    first use only. For the repositories of the storage directory (see
+    STORAGE_REPO_DIRS), the index is stored in a file of the storage
+    directory shared by all of them; for any other repository (e.g. one
+    given by the user) it is kept only in memory.
 
-    return get_metadata_from_checksum(repo, csum)
+    :param repo: OSTree.Repo object.
+    :param rev: Reference or checksum of the commit.
+    :param kernel: Whether the information about the kernel is needed (it
+                   is collected separately, since it requires reading the
+                   tree of the commit).
+    :returns: Dictionary with the keys "metadata" (commit metadata as a
+              serialized GLib.Variant, see get_metadata_from_checksum()),
+              "subject", "body", "arch" (from the metadata) and, if
+              requested, "kernel_version".
+    """
+    csum = _resolve_commit(repo, rev)
+    repo_dir = os.path.abspath(repo.get_path().get_path())
+    index_file = _get_commit_index_file(repo_dir)
+
+    with _commit_indexes_lock:
+        if index_file is None:
+            index = _commit_indexes.setdefault(repo_dir, {})
+        else:
+            index = _load_commit_index(index_file)
+        info = index.get(csum)
+        changed = False
+
+        if info is None:
+            result, commitvar, _state = repo.load_commit(csum)
+            if not result:
+                raise TorizonCoreBuilderError(f"Error loading commit {csum}.")
+            # Unpack commit object, see OSTree src/libostree/ostree-repo-commit.c
+            metavar = commitvar.get_child_value(0)
+            metadata = metavar.unpack()
+            info = {
+                "metadata": base64.b64encode(metavar.get_data_as_bytes().get_data()).decode(),
+                "subject": commitvar.get_child_value(3).get_string(),
+                "body": commitvar.get_child_value(4).get_string(),
+                "arch": metadata.get("oe.arch"),
+            }
+            index[csum] = info
+            changed = True
+
+        if kernel and "kernel_version" not in info:
+            info["kernel_version"] = _find_kernel(repo, csum)
+            changed = True
+
+        if changed and index_file is not None:
+            _save_commit_index(index_file, index)
+
+        return dict(info)
+
+
+def get_metadata_from_checksum(repo, csum):
+    info = get_commit_info(repo, csum)
+    metavar = GLib.Variant.new_from_bytes(
+        GLib.VariantType("a{sv}"), GLib.Bytes.new(base64.b64decode(info["metadata"])), False)
+
+    # metavar is GLib.Variant, use unpack to get a Python dictionary
+    return metavar.unpack(), info["subject"], info["body"]
+
+def get_metadata_from_ref(repo, ref):
+    return get_metadata_from_checksum(repo, ref)
 
 
 def pull_remote(repo, name, remote, refs, token, progress=None):
@@ -126,26 +354,46 @@ def pull_remote(repo, name, remote, refs, token, progress=None):
         asyncprogress.finish()
 
 
-def generate_delta(repo, from_delta, to_delta):
+def generate_delta(repo, from_delta, to_delta, inline_parts=False):
     """
     Function to generate static delta.
 
     :param repo: Static delta repo.
     :param from_delta: The OSTree commit to create a static delta from
     :param to_delta: The OSTree commit to create a static delta to
+    :param inline_parts: Whether to put all delta parts inside the superblock
+                         (so that the delta is a single file).
     """
 
+    params = {}
+    if inline_parts:
+        params["inline-parts"] = GLib.Variant("b", True)
+
     result = repo.static_delta_generate(OSTree.StaticDeltaGenerateOpt.MAJOR,
                                         from_delta,
                                         to_delta,
                                         None,
-                                        GLib.Variant("a{sv}", None),
+                                        GLib.Variant("a{sv}", params or None),
                                         None)
 
     if not result:
         raise TorizonCoreBuilderError("Error generating static delta.")
 
 
+def get_delta_id(from_delta, to_delta):
+    """
+    Get the identifier of a static delta, which is also its path relative to
+    the "deltas" directory of the repository.
+
+    :param from_delta: The OSTree commit the static delta starts from
+    :param to_delta: The OSTree commit the static delta goes to
+    """
+
+    b64_from = base64.b64encode(bytes.fromhex(from_delta)).decode().strip('=').replace('/', '_')
+    b64_to = base64.b64encode(bytes.fromhex(to_delta)).decode().strip('=').replace('/', '_')
+    return f"{b64_from[:2]}/{b64_from[2:]}-{b64_to}"
+
+
 def pull_remote_ref(repo, uri, ref, remote=None, progress=None):
     options = GLib.Variant("a{sv}", {
         "gpg-verify": GLib.Variant("b", False)
@@ -220,29 +468,114 @@ def pull_local_refs(repo: OSTree.Repo, repopath: str, refs: str, remote=None):
     repo_fd = repo.get_dfd()
     repo_str = os.readlink(f"/proc/self/fd/{repo_fd}")
 
+    # All commits are pulled by a single process, so the source repository
+    # is opened and scanned only once.
+    csums = list(dict.fromkeys(refs.values()))
+    log.debug(f"Pulling from local repository {repopath} commit checksums {', '.join(csums)}")
     try:
-        for ref_name, ref_csum in refs.items():
-            log.debug(f"Pulling from local repository {repopath} commit checksum {ref_csum}")
-            subprocess.run(
-                [arg for arg in [
-                    "ostree",
-                    "pull-local",
-                    f"--repo={repo_str}",
-                    f"--remote={remote}" if remote else None,
-                    repopath,
-                    ref_csum] if arg],
-                check=True)
-            repo.reload_config()
-            # Note: In theory we can do this with two options in one go, but that seems
-            # to validate ref-bindings... (has probably something to do with Collection IDs etc..)
-            #"refs": GLib.Variant.new_strv(["base"]),
-            #"override-commit-ids": GLib.Variant.new_strv([ref]),
-            repo.set_collection_ref_immediate(OSTree.CollectionRef.new(None, ref_name), ref_csum)
+        subprocess.run(
+            [arg for arg in [
+                "ostree",
+                "pull-local",
+                f"--repo={repo_str}",
+                f"--remote={remote}" if remote else None,
+                repopath,
+                *csums] if arg],
+            check=True)
     except subprocess.CalledProcessError as exc:
         logging.error(traceback.format_exc())
         raise TorizonCoreBuilderError(
             f"Error pulling contents from local repository {repopath}.") from exc
 
+    repo.reload_config()
+    # Note: In theory we can do this with two options in one go, but that seems
+    # to validate ref-bindings... (has probably something to do with Collection IDs etc..)
+    #"refs": GLib.Variant.new_strv(["base"]),
+    #"override-commit-ids": GLib.Variant.new_strv([ref]),
+    set_local_refs(repo, refs)
+
+
+def set_local_refs(repo, refs):
+    """
+    Point local references to the given commits.
+
+    :param repo: OSTree.Repo object.
+    :param refs: Dict with the reference names as keys and the checksums as values.
+    """
+    # All references are set in a single transaction.
+    repo.prepare_transaction(None)
+    try:
+        for ref_name, ref_csum in refs.items():
+            repo.transaction_set_collection_ref(
+                OSTree.CollectionRef.new(None, ref_name), ref_csum)
+        repo.commit_transaction(None)
+    except:
+        repo.abort_transaction(None)
+        raise
+
+
+# pylint: disable=too-many-arguments
+def write_content_object(repo, csum, data, uid, gid, mode, xattrs, symlink_target=None,
+                         size=None):
+    """Write a content (file) object into a repository
+
+    The repository must be in a transaction. The checksum of the object is
+    verified while writing it.
+
+    :param repo: OSTree.Repo object.
+    :param csum: Checksum of the object.
+    :param data: Bytes with the file contents or a Gio.InputStream providing
+                 them (ignored for symlinks).
+    :param uid: Owner user ID.
+    :param gid: Owner group ID.
+    :param mode: File mode (including the file type bits).
+    :param xattrs: List of (name, value) tuples of bytes with the extended
+                   attributes of the file.
+    :param symlink_target: Target of the symlink if the object is one.
+    :param size: Size of the file contents (required when data is a stream).
+    """
+    info = Gio.FileInfo.new()
+    info.set_attribute_uint32("unix::uid", uid)
+    info.set_attribute_uint32("unix::gid", gid)
+    info.set_attribute_uint32("unix::mode", mode)
+    if symlink_target is None:
+        info.set_file_type(Gio.FileType.REGULAR)
+        if isinstance(data, Gio.InputStream):
+            info.set_size(size)
+            stream = data
+        else:
+            info.set_size(len(data))
+            stream = Gio.MemoryInputStream.new_from_bytes(GLib.Bytes.new(data))
+    else:
+        info.set_file_type(Gio.FileType.SYMBOLIC_LINK)
+        info.set_symlink_target(symlink_target)
+        stream = None
+    # Names are stored NUL-terminated and sorted just like OSTree does.
+    xattrs = GLib.Variant("a(ayay)", [(name + b"\0", value) for name, value in sorted(xattrs)])
+    _, content, length = OSTree.raw_file_to_content_stream(stream, info, xattrs, None)
+    repo.write_content(csum, content, length, None)
+# pylint: enable=too-many-arguments
+
+
+def write_metadata_object(repo, csum, ext, data):
+    """Write a metadata object into a repository
+
+    The repository must be in a transaction.
+
+    :param repo: OSTree.Repo object.
+    :param csum: Checksum of the object (for detached commit metadata this
+                 is the checksum of the commit).
+    :param ext: Extension of the loose object file (a key of
+                OSTREE_METADATA_OBJECT_TYPES).
+    :param data: Bytes with the serialized object.
+    """
+    objtype = OSTREE_METADATA_OBJECT_TYPES[ext]
+    variant = GLib.Variant.new_from_bytes(
+        OSTree.metadata_variant_type(objtype), GLib.Bytes.new(data), False)
+    if objtype == OSTree.ObjectType.COMMIT_META:
+        repo.write_commit_detached_metadata(csum, variant, None)
+    else:
+        repo.write_metadata(objtype, csum, variant, None)
 
 
 def _convert_gio_file_type(gio_file_type):
@@ -325,26 +658,7 @@ def get_kernel_version(repo, commit):
             version(str) - The kernel version used in this OSTree commit
     """
 
-    kernel_version = ""
-
-    module_files = ls(repo, "/usr/lib/modules", commit)
-    module_dirs = filter(lambda file: file["type"] == "directory",
-                         module_files)
-
-    # This is a similar approach to what OSTree does in the deploy command.
-    # It searches for the directory under /usr/lib/modules/<kver> which
-    # contains a vmlinuz file.
-    for module_dir in module_dirs:
-        directory_name = module_dir["name"]
-
-        # Check if the directory contains a vmlinuz image if so it is our
-        # kernel directory
-        files = ls(repo, f"/usr/lib/modules/{directory_name}", commit)
-        if any(file for file in files if file["name"] == "vmlinuz"):
-            kernel_version = directory_name
-            break
-
-    return kernel_version
+    return get_commit_info(repo, commit, kernel=True)["kernel_version"]
 
 def copy_file(repo, commit, input_file, output_file):
     """ copy a file within a OSTree repo to somewhere else
@@ -376,7 +690,13 @@ def copy_file(repo, commit, input_file, output_file):
 
 
 class TCBuilderHTTPRequestHandler(SimpleHTTPRequestHandler):
-    """SimpleHTTPRequestHandler which makes use of logging framework"""
+    """SimpleHTTPRequestHandler which makes use of logging framework
+
+    Connections are kept alive (HTTP/1.1) and files are sent with sendfile().
+    """
+
+    protocol_version = "HTTP/1.1"
+    timeout = SERVER_IDLE_TIMEOUT
 
     def __init__(self, *args, **kwargs):
         self.log = logging.getLogger("torizon." + __name__)
@@ -386,11 +706,66 @@ class TCBuilderHTTPRequestHandler(SimpleHTTPRequestHandler):
     def log_message(self, format, *args):
         self.log.debug(format % args)
 
+    def copyfile(self, source, outputfile):
+        """Copy the data of a file to the client without going through userspace"""
+        try:
+            in_fd = source.fileno()
+        except (AttributeError, OSError):
+            # E.g. directory listings (in-memory buffer).
+            super().copyfile(source, outputfile)
+            return
+        # Headers were already written to the socket (wfile is unbuffered);
+        # socket.sendfile() uses os.sendfile() also honoring the socket timeout.
+        offset = source.tell()
+        self.connection.sendfile(source, offset, os.fstat(in_fd).st_size - offset)
+
+
+class ThreadPoolHTTPServer(HTTPServer):
+    """HTTPServer handling each connection in a bounded pool of worker threads
+
+    Connections in excess of the number of workers wait until a worker is free.
+    """
+
+    def __init__(self, server_address, handler_class, max_workers=DEFAULT_SERVER_WORKERS):
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="http-server")
+        self.active_requests = set()
+        self.active_requests_lock = threading.Lock()
+        super().__init__(server_address, handler_class)
+
+    def process_request(self, request, client_address):
+        self.executor.submit(self.process_request_thread, request, client_address)
+
+    def process_request_thread(self, request, client_address):
+        """Handle one connection (running in a worker thread)"""
+        with self.active_requests_lock:
+            self.active_requests.add(request)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:  # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            with self.active_requests_lock:
+                self.active_requests.discard(request)
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        # Wake up workers waiting on idle keep-alive connections.
+        with self.active_requests_lock:
+            for request in self.active_requests:
+                try:
+                    request.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+        self.executor.shutdown(wait=False)
+
 
 class HTTPThread(threading.Thread):
     """HTTP Server thread"""
 
-    def __init__(self, directory, host="", port=DEFAULT_SERVER_PORT):
+    def __init__(self, directory, host="", port=DEFAULT_SERVER_PORT,
+                 max_workers=DEFAULT_SERVER_WORKERS):
         threading.Thread.__init__(self, daemon=True)
 
         self.log = logging.getLogger("torizon." + __name__)
@@ -399,7 +774,7 @@ class HTTPThread(threading.Thread):
         # From what I understand, this creates a __init__ function with the
         # directory argument already set. Nice hack!
         handler_init = partial(TCBuilderHTTPRequestHandler, directory=directory)
-        self.http_server = HTTPServer((host, port), handler_init)
+        self.http_server = ThreadPoolHTTPServer((host, port), handler_init, max_workers)
 
     def run(self):
         self.http_server.serve_forever()
@@ -408,6 +783,7 @@ class HTTPThread(threading.Thread):
         """Shutdown HTTP server"""
         self.log.debug("Shutting down http server.")
         self.http_server.shutdown()
+        self.http_server.server_close()
 
     @property
     def server_port(self):
@@ -418,9 +794,10 @@ class HTTPThread(threading.Thread):
         return self.http_server.server_address
 
 
-def serve_ostree_start(ostree_dir, host="", port=DEFAULT_SERVER_PORT):
+def serve_ostree_start(ostree_dir, host="", port=DEFAULT_SERVER_PORT,
+                       max_workers=DEFAULT_SERVER_WORKERS):
     """Serving given path via http"""
-    http_thread = HTTPThread(ostree_dir, host, port)
+    http_thread = HTTPThread(ostree_dir, host, port, max_workers)
     http_thread.start()
     return http_thread
 
@@ -1030,6 +1030,8 @@ def push_ref(ostree_dir, credentials, ref, package_version=None,
     referenced by the credentials.zip file.
     """
 
+    # garage-push can only read archive repositories.
+    ostree_dir = ostree.get_archive_repo(ostree_dir)
     repo = ostree.open_ostree(ostree_dir)
     commit = repo.read_commit(ref).out_commit
 
@@ -0,0 +1,257 @@
+"""
+SSH session with a device, running batches of commands over a single channel.
+"""
+
+import logging
+import shlex
+import uuid
+
+import paramiko
+import yaml
+
+from tcbuilder.backend.common import resolve_remote_host
+from tcbuilder.errors import TorizonCoreBuilderError, InvalidDataError
+
+log = logging.getLogger("torizon." + __name__)
+
+# Keys allowed for each device of the inventory file and the corresponding
+# keys in the device dictionaries.
+INVENTORY_DEVICE_KEYS = {
+    "host": "host",
+    "username": "username",
+    "password": "password",
+    "port": "port",
+    "mdns-source": "mdns_source"
+}
+
+
+class StepResult:
+    """Outcome of one command of a batch"""
+
+    def __init__(self, command, status, output):
+        self.command = command
+        self.status = status
+        self.output = output
+
+    @property
+    def ok(self):
+        """Whether the command succeeded"""
+        return self.status == 0
+
+
+class SSHSession:
+    """Connection to a device shared by the stages of an operation
+
+    The paramiko transport (and the SFTP client, when used) is kept open
+    for the whole session. Commands are run in batches: each batch is a
+    single shell script executed through one SSH channel, so that sudo is
+    authenticated only once per batch, instead of once per command, and
+    the round-trips between commands are avoided. Markers written by the
+    script around each command allow recovering the exit status and output
+    of every step.
+    """
+
+    def __init__(self, client, password):
+        self.client = client
+        self.password = password
+        self._sftp = None
+
+    @classmethod
+    def connect(cls, host, username, password, port, mdns_source=None):
+        """Open a session with a device"""
+        client = paramiko.SSHClient()
+        client.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        client.connect(hostname=resolve_remote_host(host, mdns_source),
+                       username=username,
+                       password=password,
+                       port=port)
+        return cls(client, password)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+        return False
+
+    @property
+    def transport(self):
+        """The underlying paramiko transport"""
+        return self.client.get_transport()
+
+    def sftp(self):
+        """Get the SFTP client of the session (opened on first use)"""
+        if self._sftp is None:
+            self._sftp = self.client.open_sftp()
+        return self._sftp
+
+    def close(self):
+        """Close the session"""
+        if self._sftp is not None:
+            self._sftp.close()
+            self._sftp = None
+        self.client.close()
+
+    def start(self, command, sudo=False):
+        """Start a command, returning its stdout and stderr channel files
+
+        The channel is closed for writing once the password (if using sudo)
+        has been sent; the caller is responsible for reading the output and
+        waiting for the command to finish.
+        """
+        if sudo:
+            command = "sudo -S -p '' -- " + command
+        stdin, stdout, stderr = self.client.exec_command(command)
+        if sudo:
+            stdin.write(f"{self.password}\n")
+            stdin.flush()
+        stdin.channel.shutdown_write()
+        return stdout, stderr
+
+    def run(self, command):
+        """Run a single command (without sudo) returning a StepResult"""
+        _stdin, stdout, stderr = self.client.exec_command(command)
+        status = stdout.channel.recv_exit_status()  # wait for exec_command to finish
+        output = stdout.read().decode("utf-8") + stderr.read().decode("utf-8")
+        return StepResult(command, status, output)
+
+    # pylint: disable=too-many-locals
+    def run_batch(self, steps, sudo=True, check=True, logger=log):
+        """Run a sequence of commands through a single channel
+
+        Execution stops at the first command that fails.
+
+        :param steps: List of commands; each one is either a string or a tuple
+                      (command, message) where the message is logged when the
+                      command starts.
+        :param sudo: Whether to run the commands as root; the password of the
+                     session is sent only once for the whole batch.
+        :param check: Whether to raise an exception if a command fails.
+        :param logger: Logger used for the messages of the steps.
+        :returns: List of StepResult objects for the commands that were run
+                  (the last one being the failed command, if any).
+        """
+
+        commands = []
+        messages = []
+        for step in steps:
+            command, message = (step, None) if isinstance(step, str) else step
+            commands.append(command)
+            messages.append(message)
+
+        marker = f"@@tcbuilder-{uuid.uuid4().hex}"
+        # Keep the commands from reading the password (when sudo does not ask
+        # for it) or waiting for input.
+        script = ["exec </dev/null"]
+        for idx, command in enumerate(commands):
+            script.append(f"echo '{marker} begin {idx}'")
+            script.append(f"( {command}\n) 2>&1")
+            script.append(f"st=$?; echo '{marker} end {idx}' $st")
+            script.append('[ "$st" -eq 0 ] || exit "$st"')
+        stdout, stderr = self.start("sh -c " + shlex.quote("\n".join(script)), sudo)
+
+        results = []
+        current = None
+        output = []
+        for line in iter(stdout.readline, ""):
+            # Markers may follow output not terminated by a newline.
+            pos = line.find(marker)
+            if pos < 0:
+                output.append(line)
+                continue
+            output.append(line[:pos])
+            fields = line[pos:].split()
+            if fields[1] == "begin":
+                current = int(fields[2])
+                output = []
+                if messages[current]:
+                    logger.info(messages[current])
+            else:
+                results.append(StepResult(commands[current], int(fields[3]), "".join(output)))
+                current = None
+
+        status = stdout.channel.recv_exit_status()  # wait for the script to finish
+        stderr_str = stderr.read().decode("utf-8").strip()
+
+        if current is not None:
+            # Connection lost or script killed while running a command.
+            results.append(StepResult(commands[current], status or -1, "".join(output)))
+        elif status != 0 and not results:
+            # Nothing was run: sudo (most likely) failed.
+            if stderr_str:
+                logger.error(stderr_str)
+            raise TorizonCoreBuilderError(
+                "Failed to run commands on module: could not authenticate with sudo."
+                if sudo else "Failed to run commands on module.")
+
+        for result in results:
+            result_output = result.output.strip()
+            if result.ok:
+                if result_output:
+                    logger.debug(result_output)
+            elif check:
+                if result_output:
+                    logger.error(result_output)
+                raise TorizonCoreBuilderError(
+                    f"Failed to run command on module: {result.command}")
+
+        return results
+    # pylint: enable=too-many-locals
+
+
+class DeviceLogAdapter(logging.LoggerAdapter):
+    """Logger adapter prefixing messages with the name of a device"""
+
+    def process(self, msg, kwargs):
+        return f"[{self.extra['host']}] {msg}", kwargs
+
+
+def load_device_inventory(inventory_file, defaults):
+    """Load the list of devices to deploy to from an inventory file
+
+    The file is in YAML format, holding a list of devices under the "devices"
+    key; each device is either a host name/address or a mapping with the
+    key "host" and optionally "username", "password", "port" and
+    "mdns-source" (taken from `defaults` when absent), e.g.::
+
+        devices:
+          - 192.168.1.10
+          - host: verdin-imx8mp-06817296.local
+            password: secret
+
+    :param inventory_file: Path to the inventory file.
+    :param defaults: Dictionary with default values for "username", "password",
+                     "port" and "mdns_source".
+    :returns: List of dictionaries in the format expected by
+              deploy_ostree_to_device().
+    """
+
+    try:
+        with open(inventory_file, encoding="utf-8") as infile:
+            data = yaml.safe_load(infile)
+    except (OSError, yaml.YAMLError) as exc:
+        raise InvalidDataError(f"Error loading inventory file '{inventory_file}': {exc}")
+
+    entries = data.get("devices") if isinstance(data, dict) else None
+    if not isinstance(entries, list) or not entries:
+        raise InvalidDataError(
+            f"Inventory file '{inventory_file}' must hold a non-empty list 'devices'.")
+
+    devices = []
+    for entry in entries:
+        if isinstance(entry, str):
+            entry = {"host": entry}
+        if not isinstance(entry, dict) or not isinstance(entry.get("host"), str):
+            raise InvalidDataError(
+                f"Invalid device entry in inventory file '{inventory_file}': {entry}")
+        unknown = set(entry) - set(INVENTORY_DEVICE_KEYS)
+        if unknown:
+            raise InvalidDataError(
+                f"Unknown key(s) {', '.join(sorted(unknown))} for device '{entry['host']}' "
+                f"in inventory file '{inventory_file}'.")
+        device = dict(defaults)
+        for key, value in entry.items():
+            device[INVENTORY_DEVICE_KEYS[key]] = value
+        devices.append(device)
+
+    return devices
@@ -1,6 +1,11 @@
 import datetime
+import hashlib
 import logging
 import os
+import re
+import stat
+import struct
+import time
 
 from tcbuilder.backend import ostree
 from tcbuilder.backend.ostree import OSTREE_WHITEOUT_PREFIX, OSTREE_OPAQUE_WHITEOUT_NAME
@@ -14,6 +19,27 @@ from gi.repository import GLib, OSTree, Gio
 
 log = logging.getLogger("torizon." + __name__)
 
+# Name of the files holding the ownership, modes and ACLs of the files of a
+# changes directory (created by the isolate command or by the user).
+TCATTR_FILE = ".tcattr"
+# Extended attributes holding POSIX ACLs and the format of their values (see
+# linux/posix_acl_xattr.h).
+ACL_ACCESS_XATTR = "system.posix_acl_access"
+ACL_DEFAULT_XATTR = "system.posix_acl_default"
+ACL_XATTR_VERSION = 2
+ACL_UNDEFINED_ID = 0xFFFFFFFF
+ACL_TAGS = {"user": (0x01, 0x02), "group": (0x04, 0x08), "mask": (0x10, 0x10),
+            "other": (0x20, 0x20)}
+# Modes given to files not listed in a .tcattr file (see default_file_mode()).
+DEFAULT_FILE_MODE = 0o660
+DEFAULT_DIR_MODE = 0o755
+DEFAULT_EXEC_MODE = 0o770
+# Commit metadata key holding the hash of the inputs of a union commit (see
+# compute_union_hash()).
+UNION_HASH_METADATA_KEY = "tcbuilder.union-hash"
+# Size of the blocks in which files are read when hashing them.
+HASH_BLOCK_SIZE = 1024 * 1024
+
 
 def remove_tcattr_files_from_ostree(mtree):
     """
@@ -25,7 +51,13 @@ def remove_tcattr_files_from_ostree(mtree):
             mtree.remove(filename, False)
 
 
-def process_whiteouts(mtree, path="/"):
+def process_dir_whiteouts(mtree, path="/"):
+    """
+    Process the whiteouts of a single directory of the tree (not descending
+    into its subdirectories).
+
+    :returns: Whether the directory holds an opaque whiteout.
+    """
 
     remove_tcattr_files_from_ostree(mtree)
 
@@ -34,7 +66,7 @@ def process_whiteouts(mtree, path="/"):
         log.debug(f"Removing all contents from {path}.")
         for name in mtree.get_files().keys():
             mtree.remove(name, False)
-        return
+        return True
 
     for name in mtree.get_files().keys():
         if name.startswith(OSTREE_WHITEOUT_PREFIX):
@@ -54,102 +86,426 @@ def process_whiteouts(mtree, path="/"):
             else:
                 log.debug(f"Removing file {name_to_remove}, {result}.")
 
-    for dirname, submt in mtree.get_subdirs().items():
-        process_whiteouts(submt, os.path.join(path, dirname))
+    return False
+
+
+def find_whiteout_dirs(changes_dir):
+    """
+    Find the directories of a changes directory holding whiteouts or .tcattr
+    files, i.e. the only directories of the merged tree that need processing
+    by process_dir_whiteouts() after the changes directory is written to it.
+
+    :returns: List of directories relative to the changes directory, each one
+              as a list of path components, parents before children.
+    """
+    dirs = []
+    for base_dir, _, filenames in os.walk(changes_dir):
+        if any(name == TCATTR_FILE or name.startswith(OSTREE_WHITEOUT_PREFIX)
+               for name in filenames):
+            rel_dir = os.path.relpath(base_dir, changes_dir)
+            dirs.append([] if rel_dir == os.curdir else rel_dir.split(os.sep))
+    return dirs
+
+
+def process_changes_whiteouts(mtree, changes_dir):
+    """
+    Process the whiteouts of a changes directory just written to the tree.
+
+    Only the directories of the tree where the changes directory placed
+    whiteouts or .tcattr files are visited, so the time taken depends on the
+    size of the changes and not on the size of the whole tree. Nothing below
+    a directory holding an opaque whiteout is processed.
+    """
+    dirs = find_whiteout_dirs(changes_dir)
+    log.debug(f"Processing whiteouts in {len(dirs)} directories.")
+
+    opaque_dirs = []
+    for components in dirs:
+        if any(components[:len(opaque)] == opaque for opaque in opaque_dirs):
+            continue
+        submt = mtree
+        for component in components:
+            submt = submt.get_subdirs().get(component)
+            if submt is None:
+                break
+        if submt is None:
+            # Not a directory in the tree (e.g. replaced by a file).
+            continue
+        if process_dir_whiteouts(submt, "/" + "/".join(components)):
+            opaque_dirs.append(components)
+
+
+def parse_acl_perms(perms):
+    """Convert ACL permissions like "rw-" into mode bits"""
+    return sum(bit for char, bit in zip(perms, (4, 2, 1)) if char != "-")
+
+
+def unescape_getfacl_name(name):
+    """Undo the octal escaping of special characters done by getfacl"""
+    return os.fsdecode(re.sub(rb"\\([0-7]{3})", lambda match: bytes([int(match.group(1), 8)]),
+                              os.fsencode(name)))
+
+
+def escape_getfacl_name(name):
+    """Escape special characters of a filename as done by getfacl"""
+    return "".join(
+        chr(byte) if 0x21 <= byte <= 0x7e and byte != 0x5c else f"\\{byte:03o}"
+        for byte in os.fsencode(name))
+
+
+def parse_tcattr(tcattr_file):
+    """
+    Parse a .tcattr file (in the format produced by "getfacl -n").
+
+    :returns: Dictionary mapping each filename (relative to the directory of
+              the .tcattr file) to a dictionary with the keys "uid", "gid",
+              "flags" (setuid/setgid/sticky mode bits), "access" and
+              "default", the last two being lists of ACL entries as tuples
+              (tag, qualifier, perms).
+    """
+    entries = {}
+    entry = None
+    with open(tcattr_file, encoding="utf-8") as fd_tcattr:
+        for line in fd_tcattr:
+            line = line.strip()
+            if not line:
+                entry = None
+                continue
+            if line.startswith("# file: "):
+                entry = {"uid": 0, "gid": 0, "flags": 0, "access": [], "default": []}
+                entries[unescape_getfacl_name(line[len("# file: "):])] = entry
+            elif entry is None:
+                continue
+            elif line.startswith("# owner: "):
+                entry["uid"] = int(line[len("# owner: "):])
+            elif line.startswith("# group: "):
+                entry["gid"] = int(line[len("# group: "):])
+            elif line.startswith("# flags: "):
+                entry["flags"] = sum(bit for char, bit in zip(
+                    line[len("# flags: "):], (stat.S_ISUID, stat.S_ISGID, stat.S_ISVTX))
+                                     if char != "-")
+            elif not line.startswith("#"):
+                acl = entry["access"]
+                if line.startswith("default:"):
+                    acl = entry["default"]
+                    line = line[len("default:"):]
+                tag, qualifier, perms = line.split("#")[0].strip().split(":")
+                acl.append((tag, qualifier, parse_acl_perms(perms)))
+    return entries
+
+
+def acl_to_mode(acl):
+    """Get the permission bits of the mode corresponding to an access ACL"""
+    perms = {(tag, qualifier): value for tag, qualifier, value in acl}
+    group = perms.get(("mask", ""), perms.get(("group", ""), 0))
+    return perms.get(("user", ""), 0) << 6 | group << 3 | perms.get(("other", ""), 0)
+
+
+def encode_acl_xattr(acl):
+    """Encode ACL entries as the value of a POSIX ACL extended attribute"""
+    records = []
+    for tag, qualifier, perms in acl:
+        obj_tag, named_tag = ACL_TAGS[tag]
+        if qualifier:
+            records.append((named_tag, perms, int(qualifier)))
+        else:
+            records.append((obj_tag, perms, ACL_UNDEFINED_ID))
+    # The kernel expects the entries sorted by tag and then by id.
+    records.sort(key=lambda record: (record[0], record[2]))
+    return struct.pack("<I", ACL_XATTR_VERSION) + b"".join(
+        struct.pack("<HHI", *record) for record in records)
+
+
+def default_file_mode(mode):
+    """
+    Get the default mode of a file not listed in a .tcattr file:
+      - For executables files: 0770.
+      - For non-executables files: 0660.
+      - For directories: 0755.
+      - For symbolic links the mode is not changed.
+    """
+    if stat.S_ISLNK(mode):
+        return mode
+    if stat.S_ISDIR(mode):
+        perms = DEFAULT_DIR_MODE
+    elif mode & 0o111:
+        perms = DEFAULT_EXEC_MODE
+    else:
+        perms = DEFAULT_FILE_MODE
+    return stat.S_IFMT(mode) | perms
+
+
+class ChangesAttributes:
+    """
+    Ownership, modes and ACLs of the files of a changes directory, applied
+    while the directory is committed (through an OSTree.RepoCommitModifier)
+    instead of being set on the files themselves, so that the directory is
+    read only once and never modified or copied.
+
+    Files listed in a .tcattr file get the attributes recorded there; the
+    other files (and files listed in a .tcattr file that are symbolic links)
+    are owned by root with default modes (see default_file_mode()).
+    """
+
+    def __init__(self, changes_dir):
+        self.changes_dir = changes_dir
+        # Map: path in the commit (e.g. "/usr/etc/hostname") -> .tcattr entry
+        self.tcattr = {}
+        for base_dir, _, filenames in os.walk(changes_dir):
+            if TCATTR_FILE not in filenames:
+                continue
+            rel_dir = os.path.relpath(base_dir, changes_dir)
+            for filename, entry in parse_tcattr(os.path.join(base_dir, TCATTR_FILE)).items():
+                path = os.path.normpath(os.path.join("/", rel_dir, filename))
+                if not os.path.islink(os.path.join(changes_dir, path.lstrip("/"))):
+                    self.tcattr[path] = entry
+
+    def create_modifier(self):
+        """Create the commit modifier applying the attributes"""
+        modifier = OSTree.RepoCommitModifier.new(
+            OSTree.RepoCommitModifierFlags.NONE, self.commit_filter, None)
+        modifier.set_xattr_callback(self.xattr_callback, None)
+        return modifier
+
+    def commit_filter(self, _repo, path, file_info, _user_data):
+        """Set ownership and mode of a file about to be committed"""
+        mode = file_info.get_attribute_uint32("unix::mode")
+        entry = self.tcattr.get(path)
+        if entry is not None:
+            mode = stat.S_IFMT(mode) | entry["flags"] | acl_to_mode(entry["access"])
+            uid, gid = entry["uid"], entry["gid"]
+        elif path == "/":
+            # Root of the changes directory: only its ownership is changed.
+            uid = gid = 0
+        else:
+            mode = default_file_mode(mode)
+            uid = gid = 0
+        file_info.set_attribute_uint32("unix::uid", uid)
+        file_info.set_attribute_uint32("unix::gid", gid)
+        file_info.set_attribute_uint32("unix::mode", mode)
+        return OSTree.RepoCommitFilterResult.ALLOW
+
+    def xattr_callback(self, _repo, path, _file_info, _user_data):
+        """Get the extended attributes of a file about to be committed"""
+        full_path = os.path.join(self.changes_dir, path.lstrip("/"))
+        xattrs = {}
+        for name in os.listxattr(full_path, follow_symlinks=False):
+            xattrs[name] = os.getxattr(full_path, name, follow_symlinks=False)
+
+        entry = self.tcattr.get(path)
+        if entry is not None:
+            xattrs.pop(ACL_ACCESS_XATTR, None)
+            xattrs.pop(ACL_DEFAULT_XATTR, None)
+            # Access ACLs equivalent to the mode are not stored.
+            if any(qualifier for _, qualifier, _ in entry["access"]):
+                xattrs[ACL_ACCESS_XATTR] = encode_acl_xattr(entry["access"])
+            if entry["default"]:
+                xattrs[ACL_DEFAULT_XATTR] = encode_acl_xattr(entry["default"])
+
+        # OSTree stores the names of extended attributes NUL-terminated.
+        return GLib.Variant("a(ayay)", [(name.encode() + b"\0", value)
+                                        for name, value in sorted(xattrs.items())])
+
+
+def hash_file(path, hasher):
+    """Feed the contents of a file to a hashlib object"""
+    with open(path, "rb") as infile:
+        for block in iter(lambda: infile.read(HASH_BLOCK_SIZE), b""):
+            hasher.update(block)
+
+
+def hash_changes_dir(changes_dir, hasher):
+    """
+    Feed the names, metadata (type, mode, ownership and extended attributes)
+    and contents of all files of a changes directory to a hashlib object.
+    """
+    for base_dir, dirnames, filenames in os.walk(changes_dir):
+        dirnames.sort()
+        # Symbolic links to directories are listed but not walked into.
+        names = filenames + [name for name in dirnames
+                             if os.path.islink(os.path.join(base_dir, name))]
+        for name in [os.curdir] + sorted(names):
+            path = os.path.normpath(os.path.join(base_dir, name))
+            status = os.lstat(path)
+            hasher.update(repr((os.path.relpath(path, changes_dir), status.st_mode,
+                                status.st_uid, status.st_gid)).encode())
+            for xattr in sorted(os.listxattr(path, follow_symlinks=False)):
+                hasher.update(repr((xattr, os.getxattr(path, xattr, follow_symlinks=False)))
+                              .encode())
+            if stat.S_ISLNK(status.st_mode):
+                hasher.update(os.fsencode(os.readlink(path)))
+            elif stat.S_ISREG(status.st_mode):
+                hasher.update(str(status.st_size).encode())
+                hash_file(path, hasher)
+            hasher.update(b"\0")
+
+
+def compute_union_hash(base_csum, changes_dirs, branch_name, subject, body,
+                       attribute_dirs=None):
+    """
+    Compute a hash identifying the result of a union: it covers the base
+    commit, the contents and metadata of every changes directory (in order),
+    the branch (which ends up in the commit's ref-binding) and the commit
+    subject and body.
+    """
+    hasher = hashlib.sha256()
+    hasher.update(repr((base_csum, branch_name, subject, body)).encode())
+    for changes_dir in changes_dirs:
+        hasher.update(repr(bool(attribute_dirs and changes_dir in attribute_dirs)).encode())
+        hash_changes_dir(changes_dir, hasher)
+        hasher.update(b"\0")
+    return hasher.hexdigest()
+
+
+def find_union_commit(repo, union_hash):
+    """
+    Find a commit (pointed to by a reference of the repository) created by
+    a union with the given hash.
+
+    :returns: The checksum of the commit or None if not found.
+    """
+    refs = repo.list_refs().out_all_refs
+    for csum in set(refs.values()):
+        try:
+            metadata, _, _ = ostree.get_metadata_from_checksum(repo, csum)
+        except (GLib.Error, TorizonCoreBuilderError):
+            # E.g. a partial commit of a remote reference.
+            continue
+        if metadata.get(UNION_HASH_METADATA_KEY) == union_hash:
+            return csum
+    return None
 
 
 # pylint: disable=too-many-locals
 def commit_changes(repo, ref, changes_dirs, branch_name,
-                   subject, body, pre_apply_callback=None):
+                   subject, body, pre_apply_callback=None, attribute_dirs=None,
+                   union_hash=None):
+    """
+    Commit changes directories on top of a reference.
+
+    :param attribute_dirs: Changes directories whose ownership, modes and ACLs
+                           (see ChangesAttributes) must be applied while
+                           committing them.
+    :param union_hash: Hash of the union (see compute_union_hash()) to be
+                       stored in the metadata of the commit.
+    """
     # ostree --repo=toradex-os-tree commit -b my-changes --tree=ref=<ref> --tree=dir=my-changes
     if not repo.prepare_transaction():
         raise TorizonCoreBuilderError("Error preparing transaction.")
 
-    mtree = OSTree.MutableTree.new()
+    # All layers are written in a single transaction, so that nothing is left
+    # in the repository if any of them fails.
+    try:
+        mtree = OSTree.MutableTree.new()
 
-    # --tree=ref=<ref>
-    result, root, csum = repo.read_commit(ref)
-    if not result:
-        raise TorizonCoreBuilderError("Read base commit failed.")
-
-    result = repo.write_directory_to_mtree(root, mtree)
-    if not result:
-        raise TorizonCoreBuilderError("Write base tree failed.")
+        # --tree=ref=<ref>
+        result, root, csum = repo.read_commit(ref)
+        if not result:
+            raise TorizonCoreBuilderError("Read base commit failed.")
 
-    # --tree=dir=my-changes
-    for changes_dir in changes_dirs:
-        # Inform upper layer about what we are going to do.
-        if pre_apply_callback:
-            pre_apply_callback(changes_dir)
+        result = repo.write_directory_to_mtree(root, mtree)
+        if not result:
+            raise TorizonCoreBuilderError("Write base tree failed.")
+
+        # --tree=dir=my-changes
+        # The layers are merged in memory; the tree is written only once at
+        # the end, since only its final root is needed.
+        for changes_dir in changes_dirs:
+            # Inform upper layer about what we are going to do.
+            if pre_apply_callback:
+                pre_apply_callback(changes_dir)
+            start = time.monotonic()
+
+            modifier = None
+            if attribute_dirs and changes_dir in attribute_dirs:
+                modifier = ChangesAttributes(changes_dir).create_modifier()
+
+            changesdir_fd = os.open(changes_dir, os.O_DIRECTORY)
+            try:
+                if not repo.write_dfd_to_mtree(changesdir_fd, ".", mtree, modifier):
+                    raise TorizonCoreBuilderError("Adding directory to commit failed.")
+            finally:
+                os.close(changesdir_fd)
 
-        changesdir_fd = os.open(changes_dir, os.O_DIRECTORY)
-        if not repo.write_dfd_to_mtree(changesdir_fd, ".", mtree):
-            raise TorizonCoreBuilderError("Adding directory to commit failed.")
+            log.debug("Processing whiteouts.")
+            process_changes_whiteouts(mtree, changes_dir)
 
-        log.debug("Processing whiteouts.")
-        process_whiteouts(mtree)
+            log.info(f"  Layer applied in {time.monotonic() - start:.2f}s.")
 
         result, root = repo.write_mtree(mtree)
         if not result:
             raise TorizonCoreBuilderError("Write mtree failed.")
 
-    result, commitvar, _state = repo.load_commit(csum)
-    if not result:
-        raise TorizonCoreBuilderError(f"Error loading parent commit {csum}.")
-
-    # Unpack commit object, see OSTree src/libostree/ostree-repo-commit.c
-    # We cannot use commitvar.unpack() here since this would lead to a pure
-    # Python object. However, we want to retain the metadata as GLib.Variant
-    # so we can transparently pass them to our commit. Otherwise we need to know
-    # the whole GLib.Variant's structure, which we do not know (e.g. future
-    # OSTree commits might add structured data we do not know about today).
-    metadata = commitvar.get_child_value(0)
-    _orig_subject = commitvar.get_child_value(3).get_string()
-    _orig_body = commitvar.get_child_value(4).get_string()
-
-    # Append something to the version object
-    newmetadata = []
-    timestamp = datetime.datetime.now()
-    for ind in range(metadata.n_children()):
-        val = metadata.get_child_value(ind)
-        # Adjust the "version" metadata
-        if val.get_child_value(0).get_string() == 'version':
-            # Version itself is a Variant, which just contains a string...
-            version = val.get_child_value(1).get_child_value(0).get_string()
-            version += "-tcbuilder." + timestamp.strftime("%Y%m%d%H%M%S")
-            newmetadata.append(
-                GLib.Variant.new_dict_entry(
-                    GLib.Variant("s", "version"),
-                    GLib.Variant('v', GLib.Variant("s", version))))
-        # Adjust the "ostree.ref-binding" metadata, to avoid ref bindings mismatch
-        elif val.get_child_value(0).get_string() == 'ostree.ref-binding':
+        result, commitvar, _state = repo.load_commit(csum)
+        if not result:
+            raise TorizonCoreBuilderError(f"Error loading parent commit {csum}.")
+
+        # Unpack commit object, see OSTree src/libostree/ostree-repo-commit.c
+        # We cannot use commitvar.unpack() here since this would lead to a pure
+        # Python object. However, we want to retain the metadata as GLib.Variant
+        # so we can transparently pass them to our commit. Otherwise we need to
+        # know the whole GLib.Variant's structure, which we do not know (e.g.
+        # future OSTree commits might add structured data we do not know about
+        # today).
+        metadata = commitvar.get_child_value(0)
+        _orig_subject = commitvar.get_child_value(3).get_string()
+        _orig_body = commitvar.get_child_value(4).get_string()
+
+        # Append something to the version object
+        newmetadata = []
+        timestamp = datetime.datetime.now()
+        for ind in range(metadata.n_children()):
+            val = metadata.get_child_value(ind)
+            # Adjust the "version" metadata
+            if val.get_child_value(0).get_string() == 'version':
+                # Version itself is a Variant, which just contains a string...
+                version = val.get_child_value(1).get_child_value(0).get_string()
+                version += "-tcbuilder." + timestamp.strftime("%Y%m%d%H%M%S")
+                newmetadata.append(
+                    GLib.Variant.new_dict_entry(
+                        GLib.Variant("s", "version"),
+                        GLib.Variant('v', GLib.Variant("s", version))))
+            # Adjust the "ostree.ref-binding" metadata, to avoid ref bindings mismatch
+            elif val.get_child_value(0).get_string() == 'ostree.ref-binding':
+                newmetadata.append(
+                    GLib.Variant.new_dict_entry(
+                        GLib.Variant("s", "ostree.ref-binding"),
+                        GLib.Variant('v', GLib.Variant("as", [branch_name]))))
+            # Drop the union hash of the parent commit
+            elif val.get_child_value(0).get_string() == UNION_HASH_METADATA_KEY:
+                pass
+            # Pass everything else transparently
+            else:
+                newmetadata.append(val)
+
+        if union_hash is not None:
             newmetadata.append(
                 GLib.Variant.new_dict_entry(
-                    GLib.Variant("s", "ostree.ref-binding"),
-                    GLib.Variant('v', GLib.Variant("as", [branch_name]))))
-        # Pass everything else transparently
-        else:
-            newmetadata.append(val)
+                    GLib.Variant("s", UNION_HASH_METADATA_KEY),
+                    GLib.Variant('v', GLib.Variant("s", union_hash))))
 
-    if subject is None:
-        isodatetime = timestamp.replace(microsecond=0).isoformat()
-        subject = f"TorizonCore Builder union commit created at {isodatetime}"
+        if subject is None:
+            isodatetime = timestamp.replace(microsecond=0).isoformat()
+            subject = f"TorizonCore Builder union commit created at {isodatetime}"
 
-    # GLib.Variant of type "a{sv}" (array of dictionaries), which is the
-    # metadata obeject
-    newmetadatavar = GLib.Variant.new_array(GLib.VariantType("{sv}"), newmetadata)
+        # GLib.Variant of type "a{sv}" (array of dictionaries), which is the
+        # metadata obeject
+        newmetadatavar = GLib.Variant.new_array(GLib.VariantType("{sv}"), newmetadata)
 
-    result, commit = repo.write_commit(csum, subject, body, newmetadatavar, root)
-    if not result:
-        raise TorizonCoreBuilderError("Write commit failed.")
+        result, commit = repo.write_commit(csum, subject, body, newmetadatavar, root)
+        if not result:
+            raise TorizonCoreBuilderError("Write commit failed.")
 
-    repo.transaction_set_ref(None, branch_name, commit)
-    result, stats = repo.commit_transaction()
-    if not result:
-        raise TorizonCoreBuilderError("Commit failed.")
+        repo.transaction_set_ref(None, branch_name, commit)
+        result, stats = repo.commit_transaction()
+        if not result:
+            raise TorizonCoreBuilderError("Commit failed.")
+    except:
+        repo.abort_transaction()
+        raise
 
-    log.debug(f"Transaction committed. {stats.content_bytes_written} bytes "
-              f"{stats.content_objects_written} objects written.")
+    log.info(f"Transaction committed. {stats.content_objects_written} objects "
+             f"({stats.content_bytes_written} bytes) written.")
 
     return commit
 
@@ -157,12 +513,34 @@ def commit_changes(repo, ref, changes_dirs, branch_name,
 
 
 def union_changes(changes_dir, ostree_archive_dir, union_branch,
-                  subject, body, pre_apply_callback=None):
+                  subject, body, pre_apply_callback=None, attribute_dirs=None):
+    """
+    Create a commit with the changes directories on top of the base commit.
+
+    If a commit with the same inputs (see compute_union_hash()) was already
+    created, it is reused instead: the union branch is pointed to it and no
+    new commit is written.
+    """
     repo = ostree.open_ostree(ostree_archive_dir)
 
+    result, _, base_csum = repo.read_commit(ostree.OSTREE_BASE_REF)
+    if not result:
+        raise TorizonCoreBuilderError("Read base commit failed.")
+
+    union_hash = compute_union_hash(base_csum, changes_dir, union_branch, subject, body,
+                                    attribute_dirs)
+    log.debug(f"Union hash: {union_hash}")
+
+    existing_commit = find_union_commit(repo, union_hash)
+    if existing_commit is not None:
+        log.info(f"Changes are unchanged since commit {existing_commit}; reusing it.")
+        ostree.set_local_refs(repo, {union_branch: existing_commit})
+        return existing_commit
+
     # Create new commit with the changes overlayed in a single transaction
     final_commit = commit_changes(
         repo, ostree.OSTREE_BASE_REF, changes_dir, union_branch,
-        subject, body, pre_apply_callback=pre_apply_callback)
+        subject, body, pre_apply_callback=pre_apply_callback,
+        attribute_dirs=attribute_dirs, union_hash=union_hash)
 
     return final_commit
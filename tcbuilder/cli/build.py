@@ -11,6 +11,7 @@ from datetime import datetime
 from tezi.errors import TeziError
 from tcbuilder.backend.bundle import download_containers_by_compose_file
 from tcbuilder.backend.expandvars import UserFailureException
+from tcbuilder.backend.guestfs_session import GuestFSSession
 from tcbuilder.backend.registryops import RegistryOperations
 from tcbuilder.errors import (
     FileContentMissing, FeatureNotImplementedError, InvalidDataError,
@@ -22,6 +23,7 @@ from tcbuilder.backend import build as bb
 from tcbuilder.backend import combine as comb_be
 from tcbuilder.backend import dt as dt_be
 from tcbuilder.backend import images as images_be
+from tcbuilder.backend import ostree
 from tcbuilder.cli import deploy as deploy_cli
 from tcbuilder.cli import dt as dt_cli
 from tcbuilder.cli import dto as dto_cli
@@ -105,7 +107,8 @@ def handle_input_section(props, **kwargs):
             "No kind of input specified in configuration file")
 
 
-def handle_easy_installer_input(props, storage_dir=None, download_dir=None):
+def handle_easy_installer_input(props, storage_dir=None, download_dir=None,
+                                use_cache=False):
     """Handle the input/easy-installer subsection of the configuration file
 
     :param props: Dictionary holding the data of the subsection.
@@ -113,13 +116,17 @@ def handle_easy_installer_input(props, storage_dir=None, download_dir=None):
                         keyword argument.
     :param download_dir: Directory where files should be downloaded to or
                          obtained from if they already exist (TODO).
+    :param use_cache: Whether to use the unpack cache.
     """
 
     assert storage_dir is not None, "Parameter `storage_dir` must be passed"
 
+    storage_mode = props.get("storage-mode", ostree.DEFAULT_STORAGE_MODE)
+
     if "local" in props:
         images_cli.images_unpack(
-            props["local"], storage_dir, remove_storage=True)
+            props["local"], storage_dir, remove_storage=True, use_cache=use_cache,
+            storage_mode=storage_mode)
 
     elif ("remote" in props) or ("toradex-feed" in props):
         if "toradex-feed" in props:
@@ -132,12 +139,23 @@ def handle_easy_installer_input(props, storage_dir=None, download_dir=None):
             log.debug(f"Remote URL: {remote_url}, name: {remote_fname}, "
                       f"expected sha256: {cksum}")
 
+        if use_cache:
+            # With a known checksum the image can be taken from the cache
+            # without even downloading it.
+            if cksum is None:
+                cksum = bb.get_remote_sha256sum(remote_url)
+            if cksum is not None and images_cli.images_unpack_cached(
+                    images_be.get_storage_mode_cache_key(cksum, storage_mode),
+                    storage_dir, remove_storage=True):
+                return
+
         # Next call will download the file if necessary (TODO).
         local_file, is_temp = \
             bb.fetch_remote(remote_url, remote_fname, cksum, download_dir)
 
         try:
-            images_cli.images_unpack(local_file, storage_dir, remove_storage=True)
+            images_cli.images_unpack(local_file, storage_dir, remove_storage=True,
+                                     use_cache=use_cache, storage_mode=storage_mode)
         finally:
             # Avoid leaving files in the temporary directory (if it was used).
             if is_temp:
@@ -147,12 +165,13 @@ def handle_easy_installer_input(props, storage_dir=None, download_dir=None):
         raise FileContentMissing(
             "No known input type specified in configuration file")
 
-def handle_raw_image_input(props, storage_dir=None):
+def handle_raw_image_input(props, storage_dir=None, use_cache=False):
     """Handle the input/raw-image subsection of the configuration file
 
     :param props: Dictionary holding the data of the subsection.
     :param storage_dir: Absolute path of storage directory. This is a required
                         keyword argument.
+    :param use_cache: Whether to use the unpack cache.
     """
 
     assert storage_dir is not None, "Parameter `storage_dir` must be passed"
@@ -162,7 +181,9 @@ def handle_raw_image_input(props, storage_dir=None):
             props["local"],
             storage_dir,
             raw_rootfs_label=props.get("rootfs-label", common.DEFAULT_RAW_ROOTFS_LABEL),
-            remove_storage=True)
+            remove_storage=True,
+            use_cache=use_cache,
+            storage_mode=props.get("storage-mode", ostree.DEFAULT_STORAGE_MODE))
     else:
         raise FileContentMissing(
             "No known input type specified in configuration file")
@@ -234,13 +255,13 @@ def handle_dt_customization(props, storage_dir=None):
                      "device-tree set!")
         for overl in overlay_props["add"]:
             log.info(l2_pref(f"Adding device-tree overlay '{overl}'"))
-            dto_cli.dto_apply(
-                dtos_path=overl,
-                dtb_path=None,
-                include_dirs=props.get("include-dirs", []),
-                storage_dir=storage_dir,
-                allow_reapply=False,
-                test_apply=test_apply)
+        # Overlays are compiled concurrently and test applied all at once.
+        dto_cli.dto_apply_batch(
+            dtos_paths=overlay_props["add"],
+            dtb_path=None,
+            include_dirs=props.get("include-dirs", []),
+            storage_dir=storage_dir,
+            test_apply=test_apply)
 
 
 def handle_kernel_customization(props, storage_dir=None):
@@ -373,6 +394,7 @@ def handle_easy_installer_output(props, storage_dir, union_params):
         "storage_dir": storage_dir,
         "deploy_sysroot_dir": deploy_cli.DEFAULT_DEPLOY_DIR,
         "tezi_props": translate_tezi_props(props),
+        "compression": props.get("compression"),
     }
 
     deploy_cli.deploy_tezi_image(**deploy_tezi_image_params)
@@ -491,7 +513,7 @@ def handle_provisioning(output_dir, prov_props):
 
 
 def build(config_fname, storage_dir,
-          substs=None, enable_subst=True, force=False):
+          substs=None, enable_subst=True, force=False, unpack_cache=False):
     """Main handler for the normal operating mode of the build subcommand"""
 
     log.info(f"Building image as per configuration file '{config_fname}'...")
@@ -551,34 +573,35 @@ def build(config_fname, storage_dir,
                     f"File '{output_image}' already exists; please remove"
                     " it or give a different filename for the output.")
 
-    # Input section (required):
-    handle_input_section(config["input"], storage_dir=storage_dir)
+    # Appliances launched by guestfs are shared by all stages of the build.
+    with GuestFSSession():
+        # Input section (required):
+        handle_input_section(config["input"], storage_dir=storage_dir, use_cache=unpack_cache)
 
-    # Customization section (currently optional).
-    fs_changes = handle_customization_section(
-        config.get("customization", {}), storage_dir=storage_dir)
+        # Customization section (currently optional).
+        fs_changes = handle_customization_section(
+            config.get("customization", {}), storage_dir=storage_dir)
 
-
-    default_base_raw_image = (
-        config["input"]["raw-image"]["local"] if "raw-image" in config["input"] else None)
-    # Output section (required):
-    try:
-        handle_output_section(
-            config["output"],
-            storage_dir=storage_dir, changes_dirs=fs_changes,
-            default_base_raw_image=default_base_raw_image)
-
-    except Exception as exc:
-        # Avoid leaving a damaged output around:
-        # TODO: Maybe it would be best to catch BaseException here so even
-        #       keyboard interrupts are handled.
-        if "easy-installer" in config["output"] and os.path.exists(output_dir):
-            log.info(f"Removing output directory '{output_dir}' due to build errors")
-            shutil.rmtree(output_dir)
-        elif "raw-image" in config["output"] and os.path.exists(output_image):
-            log.info(f"Removing output file '{output_image}' due to build errors")
-            os.remove(output_image)
-        raise exc
+        default_base_raw_image = (
+            config["input"]["raw-image"]["local"] if "raw-image" in config["input"] else None)
+        # Output section (required):
+        try:
+            handle_output_section(
+                config["output"],
+                storage_dir=storage_dir, changes_dirs=fs_changes,
+                default_base_raw_image=default_base_raw_image)
+
+        except Exception as exc:
+            # Avoid leaving a damaged output around:
+            # TODO: Maybe it would be best to catch BaseException here so even
+            #       keyboard interrupts are handled.
+            if "easy-installer" in config["output"] and os.path.exists(output_dir):
+                log.info(f"Removing output directory '{output_dir}' due to build errors")
+                shutil.rmtree(output_dir)
+            elif "raw-image" in config["output"] and os.path.exists(output_image):
+                log.info(f"Removing output file '{output_image}' due to build errors")
+                os.remove(output_image)
+            raise exc
 
     log.info(l1_pref("Build command successfully executed!"))
 
@@ -595,7 +618,8 @@ def do_build(args):
             build(args.config_fname, args.storage_directory,
                   substs=bb.parse_assignments(args.assignments),
                   enable_subst=args.enable_substitutions,
-                  force=args.force)
+                  force=args.force,
+                  unpack_cache=args.unpack_cache)
 
     except UserFailureException as exc:
         log.warning(f"\n** Exiting due to user-defined error: {str(exc)}")
@@ -622,13 +646,12 @@ def do_build(args):
         raise exc
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Initialize "build" subcommands command line interface."""
 
     parser = subparsers.add_parser(
         "build",
-        help=("Customize a Toradex Easy Installer image based on settings "
-              "specified via a configuration file."),
+        help=help_text,
         allow_abbrev=False)
 
     parser.add_argument(
@@ -661,4 +684,11 @@ def init_parser(subparsers):
         default=True, action="store_false",
         help="Disable the variable substitution feature.")
 
+    parser.add_argument(
+        "--unpack-cache", dest="unpack_cache",
+        default=False, action="store_true",
+        help=("Keep the unpacked input image in a cache inside the storage "
+              "directory and restore it from there when the same input image "
+              "is used again."))
+
     parser.set_defaults(func=do_build)
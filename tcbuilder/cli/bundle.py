@@ -116,14 +116,13 @@ def add_dind_param_arguments(subparser):
               "by the Docker daemon (dockerd) running in the container. Please see "
               "Docker documentation for more information."))
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Initialize argument parser"""
 
     # Temporary solution to provide better messages (DEPRECATED since 2021-05-25).
     subparser = subparsers.add_parser(
         "bundle",
-        help=("Create container bundle from a Docker Compose file. Can be "
-              "used to combine with a TorizonCore base image."),
+        help=help_text,
         epilog=(
             "NOTE: following switches have been removed: --docker-username, "
             "--docker-password, --registry, --host-workdir and --file (-f); "
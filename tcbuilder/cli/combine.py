@@ -130,13 +130,12 @@ def do_combine(args):
                  "Docker Containers preprovisioned.")
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Initialize argument parser"""
 
     subparser = subparsers.add_parser(
         "combine",
-        help=("Combines a container bundle with a specified Torizon OS image "
-              "(Toradex Easy Installer or raw/WIC)"),
+        help=help_text,
         epilog=("NOTE: the switches --image-directory and --output_directory "
                 "have been removed."),
         allow_abbrev=False)
@@ -8,11 +8,13 @@ import os
 from tcbuilder.backend import deploy as dbe
 from tcbuilder.backend import common
 from tcbuilder.backend import combine as cbe
+from tcbuilder.backend.sshsession import load_device_inventory
 from tcbuilder.errors import (
     InvalidArgumentError,
     InvalidStateError,
     PathNotExistError,
     InvalidDataError,
+    TorizonCoreBuilderError,
 )
 
 log = logging.getLogger("torizon." + __name__)
@@ -34,7 +36,7 @@ def progress_update(asyncprogress, _user_data=None):
 
 
 def deploy_tezi_image(ostree_ref, output_dir, storage_dir, deploy_sysroot_dir,
-                      tezi_props=None):
+                      tezi_props=None, compression=None):
 
     common.images_unpack_executed(storage_dir)
     if common.unpacked_image_type(storage_dir) == "raw":
@@ -60,7 +62,7 @@ def deploy_tezi_image(ostree_ref, output_dir, storage_dir, deploy_sysroot_dir,
         raise PathNotExistError(f"Deploy sysroot directory {dst_sysroot_dir_} does not exist.")
 
     dbe.deploy_tezi_image(tezi_dir, src_sysroot_dir, src_ostree_archive_dir,
-                          output_dir_, dst_sysroot_dir_, ostree_ref)
+                          output_dir_, dst_sysroot_dir_, ostree_ref, compression)
 
     if tezi_props and any(tezi_props[prop] is not None for prop in tezi_props):
         # Change output directory in place.
@@ -174,7 +176,8 @@ def do_deploy_raw_image(args):
 
 
 def deploy_ostree_remote(storage_dir, remote_host, remote_username,
-                         remote_password, remote_port, mdns_source, ref, reboot):
+                         remote_password, remote_port, mdns_source, ref, reboot,
+                         static_delta=False):
 
     storage_dir_ = os.path.abspath(storage_dir)
     common.images_unpack_executed(storage_dir_)
@@ -183,7 +186,7 @@ def deploy_ostree_remote(storage_dir, remote_host, remote_username,
 
     dbe.deploy_ostree_remote(remote_host, remote_username, remote_password,
                              remote_port, mdns_source, src_ostree_archive_dir,
-                             ref, reboot)
+                             ref, reboot, static_delta)
 
 
 def do_deploy_ostree_remote(args):
@@ -195,11 +198,62 @@ def do_deploy_ostree_remote(args):
                          remote_port=args.remote_port,
                          mdns_source=args.mdns_source,
                          ref=args.ref,
-                         reboot=args.reboot)
+                         reboot=args.reboot,
+                         static_delta=args.static_delta)
+
+
+def deploy_ostree_fleet(storage_dir, inventory_file, remote_username, remote_password,
+                        remote_port, mdns_source, ref, reboot, static_delta=False,
+                        jobs=dbe.DEFAULT_FLEET_JOBS):
+    """Main handler for deploying to the devices of an inventory file"""
+
+    storage_dir_ = os.path.abspath(storage_dir)
+    common.images_unpack_executed(storage_dir_)
+
+    src_ostree_archive_dir = os.path.join(storage_dir_, "ostree-archive")
+
+    defaults = {
+        "username": remote_username,
+        "password": remote_password,
+        "port": remote_port,
+        "mdns_source": mdns_source
+    }
+    devices = load_device_inventory(inventory_file, defaults)
+
+    results = dbe.deploy_ostree_fleet(devices, src_ostree_archive_dir, ref, reboot,
+                                      static_delta, jobs)
+
+    failed = [host for host, error, _ in results if error is not None]
+    if failed:
+        raise TorizonCoreBuilderError(
+            f"Deployment failed on {len(failed)} of {len(results)} device(s).")
+
+
+def do_deploy_ostree_fleet(args):
+
+    if args.remote_jobs < 1:
+        raise InvalidArgumentError("--remote-jobs must be at least 1. Aborting.")
+
+    deploy_ostree_fleet(storage_dir=args.storage_directory,
+                        inventory_file=args.remote_inventory,
+                        remote_username=args.remote_username,
+                        remote_password=args.remote_password,
+                        remote_port=args.remote_port,
+                        mdns_source=args.mdns_source,
+                        ref=args.ref,
+                        reboot=args.reboot,
+                        static_delta=args.static_delta,
+                        jobs=args.remote_jobs)
 
 
 def do_deploy(args):
 
+    if args.remote_inventory and \
+       (args.output_directory or args.base_raw_image or args.remote_host):
+        raise InvalidArgumentError(
+            "--remote-inventory cannot be used with --output-directory, --base-raw "
+            "or --remote-host. Aborting.")
+
     if (args.output_directory and args.base_raw_image and args.remote_host):
         raise InvalidArgumentError(
             "--output-directory, --base-raw and --remote-host are "
@@ -226,16 +280,18 @@ def do_deploy(args):
         do_deploy_raw_image(args)
     elif args.remote_host is not None:
         do_deploy_ostree_remote(args)
+    elif args.remote_inventory is not None:
+        do_deploy_ostree_fleet(args)
     else:
         raise InvalidArgumentError(
             "One of the following arguments is required: --output-directory, "
-            "--base-raw, --remote-host")
+            "--base-raw, --remote-host, --remote-inventory")
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     subparser = subparsers.add_parser(
         "deploy",
-        help="Deploy unpacked image as a Toradex Easy Installer image or raw disk format.",
+        help=help_text,
         allow_abbrev=False)
 
     subparser.add_argument("--output-directory", dest="output_directory",
@@ -247,6 +303,16 @@ def init_parser(subparsers):
     subparser.add_argument("--remote-host", dest="remote_host",
                            help="Remote host machine to deploy to.")
 
+    subparser.add_argument("--remote-inventory", dest="remote_inventory", metavar="FILE",
+                           help=("Deploy to all devices listed in the given YAML inventory "
+                                 "file concurrently. SSH arguments are used as defaults "
+                                 "for the devices."))
+
+    subparser.add_argument("--remote-jobs", dest="remote_jobs", type=int,
+                           default=dbe.DEFAULT_FLEET_JOBS,
+                           help=("(inventory deployment only) Maximum number of devices "
+                                 f"deployed at the same time (default: {dbe.DEFAULT_FLEET_JOBS})."))
+
     common.add_ssh_arguments(subparser)
 
     subparser.add_argument("--mdns-source", dest="mdns_source",
@@ -259,6 +325,12 @@ def init_parser(subparsers):
                            help="Reboot machine after deploying",
                            default=False)
 
+    subparser.add_argument("--static-delta", dest="static_delta", action='store_true',
+                           help=("(remote deployment only) Send a static delta from the "
+                                 "commit booted on the device instead of letting the "
+                                 "device pull every missing object."),
+                           default=False)
+
     subparser.add_argument(metavar="REF", nargs="?", dest="ref",
                            help="OSTree reference to deploy.")
 
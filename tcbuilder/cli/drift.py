@@ -0,0 +1,106 @@
+"""
+CLI handling for drift subcommand
+"""
+
+import json
+import logging
+import os
+
+from tcbuilder.backend import isolate, common
+from tcbuilder.backend.sshsession import load_device_inventory
+from tcbuilder.cli.isolate import create_changes_directory
+from tcbuilder.errors import InvalidArgumentError, TorizonCoreBuilderError
+
+# use name hierarchy for "main" to be the parent
+log = logging.getLogger("torizon." + __name__)
+
+
+def drift_subcommand(args):
+    """
+    Check all parameters and prepare everything to call the drift scan
+    backend service.
+
+    :param args: Arguments provided to the "drift" subcommand.
+    """
+
+    if args.remote_jobs < 1:
+        raise InvalidArgumentError("--remote-jobs must be at least 1. Aborting.")
+
+    changes_dir = None
+    if args.changes_dir:
+        changes_dir = os.path.abspath(args.changes_dir)
+        create_changes_directory(changes_dir, force_removal=args.force)
+
+    defaults = {
+        "username": args.remote_username,
+        "password": args.remote_password,
+        "port": args.remote_port,
+        "mdns_source": args.mdns_source
+    }
+    devices = load_device_inventory(args.remote_inventory, defaults)
+
+    report = isolate.scan_fleet_drift(devices, args.remote_jobs, changes_dir)
+
+    if args.report_file:
+        with open(args.report_file, "w", encoding="utf-8") as outfile:
+            json.dump(report, outfile, indent=2)
+        common.set_output_ownership(args.report_file)
+        log.info(f"Drift report saved to {args.report_file}.")
+
+    if changes_dir:
+        common.set_output_ownership(changes_dir)
+
+    if report["failed"]:
+        raise TorizonCoreBuilderError(
+            f"Scan failed on {len(report['failed'])} of {len(devices)} device(s).")
+
+
+def init_parser(subparsers, help_text):
+    """
+    Parse for "drift" command.
+    """
+
+    subparser = subparsers.add_parser(
+        "drift",
+        help=help_text,
+        allow_abbrev=False)
+
+    subparser.add_argument("--remote-inventory",
+                           dest="remote_inventory",
+                           metavar="FILE",
+                           help="YAML inventory file listing the devices to "
+                                "scan (same format as in \"deploy "
+                                "--remote-inventory\"). SSH arguments are "
+                                "used as defaults for the devices.",
+                           required=True)
+    subparser.add_argument("--remote-jobs",
+                           dest="remote_jobs",
+                           type=int,
+                           default=isolate.DEFAULT_SCAN_JOBS,
+                           help="Maximum number of devices scanned at the same "
+                                f"time (default: {isolate.DEFAULT_SCAN_JOBS}).")
+    subparser.add_argument("--report",
+                           dest="report_file",
+                           metavar="FILE",
+                           help="Save the consolidated report in JSON format "
+                                "to the given file.")
+    subparser.add_argument("--changes-directory",
+                           dest="changes_dir",
+                           help="Also download the changes of each device into "
+                                "a subdirectory (named after the device) of "
+                                "the given directory. By default only the "
+                                "checksums of the files are transferred.")
+    subparser.add_argument("--force",
+                           dest="force",
+                           action="store_true",
+                           help="Force removal of the changes directory",
+                           default=False)
+    common.add_ssh_arguments(subparser)
+    subparser.add_argument("--mdns-source",
+                           dest="mdns_source",
+                           help="Use the given IP address as mDNS source. "
+                                "This is useful when multiple interfaces "
+                                "are used, and mDNS multicast requests are "
+                                "sent out the wrong network interface.")
+
+    subparser.set_defaults(func=drift_subcommand)
@@ -133,13 +133,13 @@ def do_dt_apply(args):
     dt_apply(args.dts_path, args.storage_directory, include_dirs=args.include_dirs)
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     '''Initializes the 'dt' subcommands command line interface.'''
 
     parser = subparsers.add_parser(
         "dt",
-        description="Manage device trees",
-        help="Manage device trees",
+        description=help_text,
+        help=help_text,
         allow_abbrev=False)
     subparsers = parser.add_subparsers(title='Commands', required=True, dest='cmd')
 
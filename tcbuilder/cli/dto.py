@@ -1,5 +1,6 @@
 """CLI handling for dto subcommand."""
 
+import concurrent.futures
 import logging
 import os
 import shlex
@@ -32,6 +33,34 @@ log = logging.getLogger("torizon." + __name__)
 # - target: functional output artifact in filesystem
 
 
+def get_test_dtb_path(dtb_path, storage_dir):
+    '''Get the device tree blob where to test apply overlays.
+
+    :param dtb_path: basename of a device tree blob of the base image or None to use
+                     the current device tree blob.
+    :param storage_dir: path to root directory where most operations will be performed.
+    '''
+
+    if dtb_path:
+        # User has provided the basename of a device tree blob of the base image.
+        (any_dtb_path, _) = dt.get_current_dtb_path(storage_dir)
+        return os.path.join(os.path.dirname(any_dtb_path), dtb_path)
+
+    # Use the current device tree blob.
+    (dtb_path, is_dtb_exact) = dt.get_current_dtb_path(storage_dir)
+    if not is_dtb_exact:
+        log.error("error: could not find the device tree to check the overlay against.")
+        log.error("Please use --device-tree to pass one of the device trees below or use "
+                  "--force to bypass checking:")
+        dtb_list = subprocess.check_output(
+            ["find", os.path.dirname(dtb_path), "-maxdepth", "1", "-type", "f",
+             "-name", "*.dtb", "-printf", "- %f\\n"],
+            text=True).rstrip()
+        log.error(dtb_list)
+        sys.exit(1)
+    return dtb_path
+
+
 # pylint: disable=too-many-locals
 def dto_apply(dtos_path, dtb_path, include_dirs, storage_dir,
               allow_reapply=False, test_apply=True):
@@ -76,24 +105,7 @@ def dto_apply(dtos_path, dtb_path, include_dirs, storage_dir,
 
     # Test apply the overlay against the current device tree and other applied overlays.
     if test_apply:
-        if dtb_path:
-            # User has provided the basename of a device tree blob of the base image.
-            (any_dtb_path, _) = dt.get_current_dtb_path(storage_dir)
-            dtb_path = os.path.join(os.path.dirname(any_dtb_path), dtb_path)
-        else:
-            # Use the current device tree blob.
-            (dtb_path, is_dtb_exact) = dt.get_current_dtb_path(storage_dir)
-            if not is_dtb_exact:
-                log.error("error: could not find the device tree to check the overlay against.")
-                log.error("Please use --device-tree to pass one of the device trees below or use "
-                          "--force to bypass checking:")
-                dtb_list = subprocess.check_output(
-                    ["find", os.path.dirname(dtb_path), "-maxdepth", "1", "-type", "f",
-                     "-name", "*.dtb", "-printf", "- %f\\n"],
-                    text=True).rstrip()
-                log.error(dtb_list)
-                sys.exit(1)
-
+        dtb_path = get_test_dtb_path(dtb_path, storage_dir)
         applied_overlay_paths = \
             dto.get_applied_overlay_paths(storage_dir, base_names=applied_overlay_basenames)
         with tempfile.NamedTemporaryFile(delete=False) as tmpf:
@@ -126,6 +138,107 @@ def dto_apply(dtos_path, dtb_path, include_dirs, storage_dir,
 # pylint: enable=too-many-locals
 
 
+# pylint: disable=too-many-locals,too-many-branches
+def dto_apply_batch(dtos_paths, dtb_path, include_dirs, storage_dir,
+                    test_apply=True, jobs=None):
+    '''Apply several overlays at once (the equivalent of calling dto_apply() on each one).
+
+    The overlays are compiled concurrently and then test applied together, in a single
+    step, over the device tree and the already applied overlays; if that fails, the first
+    overlay that cannot be applied is determined by bisecting the list.
+
+    :param dtos_paths: list of full paths to the source device-tree overlay files to be
+                       applied, in order.
+    :param dtb_path: the basename of the blob file where to test apply the overlays (None
+                     to use the current device tree).
+    :param include_dirs: list of directories where to search include files when building the
+                         overlay files.
+    :param storage_dir: path to root directory where most operations will be performed.
+    :param test_apply: whether or not to apply the overlays over the device tree to check for
+                       errors.
+    :param jobs: maximum number of overlays compiled at the same time (defaults to the
+                 number of processors).
+    '''
+
+    images_unpack_executed(storage_dir)
+    if unpacked_image_type(storage_dir) == "raw":
+        raise InvalidDataError("dto commands are not supported for WIC/raw images. "
+                               "Aborting.")
+    if not dtos_paths:
+        return
+
+    applied_overlay_basenames = dto.get_applied_overlays_base_names(storage_dir)
+    dtob_target_basenames = [os.path.splitext(os.path.basename(dtos_path))[0] + ".dtbo"
+                             for dtos_path in dtos_paths]
+
+    # Detect redundant overlay applications.
+    for idx, dtob_target_basename in enumerate(dtob_target_basenames):
+        if dtob_target_basename in applied_overlay_basenames or \
+           dtob_target_basename in dtob_target_basenames[:idx]:
+            log.error(f"error: overlay {dtob_target_basename} is already applied.")
+            sys.exit(1)
+
+    # Compile the overlays concurrently (the work is done by the cpp and dtc processes).
+    dtob_tmp_paths = []
+    for _ in dtos_paths:
+        with tempfile.NamedTemporaryFile(delete=False) as tmpf:
+            dtob_tmp_paths.append(tmpf.name)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs or os.cpu_count()) as executor:
+        results = list(executor.map(
+            lambda paths: dt.build_dts(paths[0], include_dirs, paths[1]),
+            zip(dtos_paths, dtob_tmp_paths)))
+    failed = [dtos_path for dtos_path, result in zip(dtos_paths, results) if not result]
+    if failed:
+        for dtos_path in failed:
+            log.error(f"error: cannot apply {dtos_path}.")
+        sys.exit(1)
+
+    # Test apply all overlays at once against the current device tree and other applied
+    # overlays.
+    if test_apply:
+        dtb_path = get_test_dtb_path(dtb_path, storage_dir)
+        applied_overlay_paths = \
+            dto.get_applied_overlay_paths(storage_dir, base_names=applied_overlay_basenames)
+        all_dtob_paths = applied_overlay_paths + dtob_tmp_paths
+        with tempfile.NamedTemporaryFile() as tmpf:
+            applicable = dto.modify_dtb_by_overlays(dtb_path, all_dtob_paths, tmpf.name)
+        if not applicable:
+            if applied_overlay_paths:
+                with tempfile.NamedTemporaryFile() as tmpf:
+                    if not dto.modify_dtb_by_overlays(dtb_path, applied_overlay_paths,
+                                                      tmpf.name, quiet=True):
+                        log.error("error: the already applied overlays are not applicable.")
+                        sys.exit(1)
+            idx = dto.find_inapplicable_overlay(
+                dtb_path, all_dtob_paths, start=len(applied_overlay_paths))
+            log.error(f"error: overlay '{dtos_paths[idx - len(applied_overlay_paths)]}' "
+                      "is not applicable.")
+            sys.exit(1)
+        log.info(f"{', '.join(repr(name) for name in dtob_target_basenames)} can "
+                 f"successfully modify the device tree '{os.path.basename(dtb_path)}'.")
+
+    # Deploy the device tree overlay blobs.
+    dt_changes_dir = dt.get_dt_changes_dir(storage_dir)
+    dtob_target_dir = os.path.join(
+        dt_changes_dir, dt.get_dtb_kernel_subdir(storage_dir), "overlays")
+    os.makedirs(dtob_target_dir, exist_ok=True)
+    for dtob_tmp_path, dtob_target_basename in zip(dtob_tmp_paths, dtob_target_basenames):
+        shutil.move(dtob_tmp_path, os.path.join(dtob_target_dir, dtob_target_basename))
+
+    # Deploy the enablement of the device tree overlay blobs.
+    new_overlay_basenames = applied_overlay_basenames + dtob_target_basenames
+    overlays_txt_target_path = \
+        os.path.join(dt_changes_dir, dt.get_dtb_kernel_subdir(storage_dir), "overlays.txt")
+    with open(overlays_txt_target_path, "w") as ovlf:
+        ovlf.write("fdt_overlays=" + " ".join(new_overlay_basenames) + "\n")
+
+    # All set :-)
+    for dtob_target_basename in dtob_target_basenames:
+        log.info(f"Overlay {dtob_target_basename} successfully applied.")
+
+# pylint: enable=too-many-locals,too-many-branches
+
+
 def do_dto_apply(args):
     '''Perform the 'dto apply' command.'''
 
@@ -403,13 +516,13 @@ def do_dto_deploy(args):
     deploy_cli.do_deploy_ostree_remote(args)
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     '''Initializes the 'dto' subcommands command line interface.'''
 
     parser = subparsers.add_parser(
         "dto",
-        description="Manage device tree overlays",
-        help="Manage device tree overlays",
+        description=help_text,
+        help=help_text,
         allow_abbrev=False)
 
     subparsers = parser.add_subparsers(title='Commands', required=True, dest='cmd')
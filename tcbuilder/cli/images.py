@@ -7,7 +7,7 @@ import os
 import shutil
 import sys
 
-from tcbuilder.backend import images, common
+from tcbuilder.backend import images, common, ostree
 from tcbuilder.errors import UserAbortError, TorizonCoreBuilderError
 from tezi.errors import TeziError
 
@@ -23,7 +23,9 @@ def get_extra_dirs(storage_dir, main_dirs):
     Get all directories names inside "storage" that should be removed when
     unpacking a new TEZI image but that are not included in the list of
     "keep directories" and the list of "main directories". At this time,
-    only the "toolchain directory" should be kept between images unpack.
+    only the "toolchain directory", the "unpack cache directory" and the
+    commit index (whose entries never become stale) should be kept between
+    images unpack.
 
     :param storage_dir: Storage directory.
     :param main_dirs: List of main directories for the unpacking.
@@ -31,7 +33,9 @@ def get_extra_dirs(storage_dir, main_dirs):
     """
 
     # Directories that should be kept between images "unpacks"
-    keep_dirs = [os.path.join(storage_dir, "toolchain")]
+    keep_dirs = [os.path.join(storage_dir, "toolchain"),
+                 os.path.join(storage_dir, images.UNPACK_CACHE_DIRNAME),
+                 os.path.join(storage_dir, ostree.COMMIT_INDEX_FILE)]
 
     extra_dirs = []
 
@@ -135,13 +139,54 @@ def do_images_serve(args):
 
 
 def images_unpack(image_dir, storage_dir, raw_rootfs_label=None,
-                  remove_storage=False):
-    """Main handler for the 'images unpack' subcommand"""
+                  remove_storage=False, use_cache=False, stream_import=False,
+                  storage_mode=ostree.DEFAULT_STORAGE_MODE):
+    """Main handler for the 'images unpack' subcommand
+
+    :param use_cache: Whether to restore the unpacked image from the unpack
+                      cache if present there (and to store it otherwise).
+    :param stream_import: Whether to import the OSTree objects while the root
+                          fs tarball is being extracted.
+    :param storage_mode: Mode of the storage repository (a key of
+                         ostree.STORAGE_MODES).
+    """
 
     image_dir = os.path.abspath(image_dir)
+    cache_key = None
+    if use_cache:
+        cache_key = images.get_unpack_cache_key(image_dir, raw_rootfs_label, storage_mode)
+        if images_unpack_cached(cache_key, storage_dir, remove_storage):
+            return
+
     dir_list = prepare_storage(storage_dir, remove_storage)
     images.import_local_image(image_dir, dir_list[0], dir_list[1],
-                              dir_list[2], raw_rootfs_label)
+                              dir_list[2], raw_rootfs_label, stream_import, storage_mode)
+
+    if use_cache:
+        images.save_unpack_cache(get_unpack_cache_dir(storage_dir), cache_key, *dir_list)
+
+
+def images_unpack_cached(cache_key, storage_dir, remove_storage=False):
+    """Unpack an image from the unpack cache
+
+    :param cache_key: Key of the image in the cache (i.e. the SHA-256 checksum
+                      of the image file).
+    :param storage_dir: Storage directory.
+    :param remove_storage: Whether to clear the storage without asking.
+    :returns: True if the image was found in the cache, False otherwise.
+    """
+
+    cache_dir = get_unpack_cache_dir(storage_dir)
+    if not os.path.isdir(os.path.join(cache_dir, cache_key)):
+        return False
+
+    dir_list = prepare_storage(storage_dir, remove_storage)
+    return images.restore_unpack_cache(cache_dir, cache_key, *dir_list)
+
+
+def get_unpack_cache_dir(storage_dir):
+    """Get the path of the unpack cache directory"""
+    return os.path.join(os.path.abspath(storage_dir), images.UNPACK_CACHE_DIRNAME)
 
 
 def do_images_unpack(args):
@@ -150,15 +195,18 @@ def do_images_unpack(args):
     images_unpack(args.image_directory,
                   args.storage_directory,
                   args.raw_rootfs_label,
-                  args.remove_storage)
+                  args.remove_storage,
+                  args.use_cache,
+                  args.stream_import,
+                  args.storage_mode)
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Initialize 'images' subcommands command line interface."""
 
     parser = subparsers.add_parser(
         "images",
-        help="Manage Toradex Easy Installer Images.",
+        help=help_text,
         allow_abbrev=False)
     # FIXME: This should be moved to "images unpack" and "images download"
     parser.add_argument("--remove-storage", dest="remove_storage", action="store_true",
@@ -245,4 +293,25 @@ def init_parser(subparsers):
 
     common.add_common_raw_image_arguments(subparser)
 
+    subparser.add_argument(
+        "--cache", dest="use_cache",
+        default=False, action="store_true",
+        help=("Keep the unpacked image in a cache inside the storage directory "
+              "and restore it from there when the same image is unpacked again."))
+    subparser.add_argument(
+        "--stream-import", dest="stream_import",
+        default=False, action="store_true",
+        help=("Import OSTree objects while extracting the root filesystem instead "
+              "of pulling them from the extracted sysroot afterwards (Toradex "
+              "Easy Installer images only)."))
+    subparser.add_argument(
+        "--storage-mode", dest="storage_mode",
+        choices=list(ostree.STORAGE_MODES), default=ostree.DEFAULT_STORAGE_MODE,
+        help=("Mode of the OSTree repository holding the image in the storage: "
+              "\"archive\" stores objects compressed; \"bare-user\" stores them "
+              "uncompressed, which speeds up union and deploy, and creates a "
+              "compressed copy only when needed (for \"platform push\", "
+              "\"ostree serve\" and deploying to remote devices). "
+              f"(default: {ostree.DEFAULT_STORAGE_MODE})"))
+
     subparser.set_defaults(func=do_images_unpack)
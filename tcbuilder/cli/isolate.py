@@ -7,7 +7,7 @@ import logging
 import shutil
 
 from tcbuilder.backend import isolate, common
-from tcbuilder.errors import OperationFailureError
+from tcbuilder.errors import InvalidArgumentError, OperationFailureError
 
 # use name hierarchy for "main" to be the parent
 log = logging.getLogger("torizon." + __name__)
@@ -50,30 +50,45 @@ def isolate_subcommand(args):
     if args.changes_dir:
         changes_dir = os.path.abspath(args.changes_dir)
 
-    create_changes_directory(changes_dir, force_removal=args.force)
+    if args.compress and not args.stream:
+        raise InvalidArgumentError("Error: --compress can only be used with --stream.")
+
+    manifest_file = isolate.get_manifest_file(changes_dir)
+    if args.incremental and os.path.isdir(changes_dir) and os.path.exists(manifest_file):
+        log.info("Updating changes captured previously (incremental mode).")
+    else:
+        create_changes_directory(changes_dir, force_removal=args.force)
+        # The manifest of a removed capture must not be used.
+        if os.path.exists(manifest_file):
+            os.remove(manifest_file)
 
     ret = isolate.isolate_user_changes(changes_dir,
                                        args.remote_host,
                                        args.remote_username,
                                        args.remote_password,
                                        args.remote_port,
-                                       args.mdns_source)
+                                       args.mdns_source,
+                                       stream=args.stream,
+                                       compress=args.compress,
+                                       incremental=args.incremental)
     if ret == isolate.NO_CHANGES:
         log.info("There are no changes in /etc to be isolated.")
     else:
         if args.changes_dir:
             common.set_output_ownership(changes_dir)
+            if args.incremental:
+                common.set_output_ownership(manifest_file)
         log.info("Changes in /etc successfully isolated.")
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """
     Parse for "isolate" command.
     """
 
     subparser = subparsers.add_parser(
         "isolate",
-        help="capture /etc changes.",
+        help=help_text,
         allow_abbrev=False)
 
     subparser.add_argument("--changes-directory",
@@ -100,5 +115,26 @@ def init_parser(subparsers):
                                 "This is useful when multiple interfaces "
                                 "are used, and mDNS multicast requests are "
                                 "sent out the wrong network interface.")
+    subparser.add_argument("--stream",
+                           dest="stream",
+                           action="store_true",
+                           help="Pipe the changes from the device straight "
+                                "into the changes directory instead of "
+                                "staging an archive in the device's /tmp.",
+                           default=False)
+    subparser.add_argument("--incremental",
+                           dest="incremental",
+                           action="store_true",
+                           help="Transfer only the files that changed since the "
+                                "previous incremental capture into the changes "
+                                "directory, based on a checksum manifest kept "
+                                "next to it (<changes directory>.manifest.json).",
+                           default=False)
+    subparser.add_argument("--compress",
+                           dest="compress",
+                           action="store_true",
+                           help="Compress the streamed changes with gzip "
+                                "(useful on slow links; requires --stream).",
+                           default=False)
 
     subparser.set_defaults(func=isolate_subcommand)
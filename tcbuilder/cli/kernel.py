@@ -267,12 +267,12 @@ def assert_custom_kargs_compat_image(storage_dir):
         sys.exit(1)
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Initialize 'kernel' subcommands command line interface."""
 
     parser = subparsers.add_parser(
         "kernel",
-        help="Manage and modify TorizonCore Linux Kernel.",
+        help=help_text,
         allow_abbrev=False)
     subparsers = parser.add_subparsers(title='Commands', required=True, dest='cmd')
 
@@ -21,8 +21,9 @@ def serve_ostree(storage_dir, repo_dir=None):
 
     if repo_dir is None:
         storage_dir_ = os.path.abspath(storage_dir)
-        src_ostree_archive_dir = os.path.join(storage_dir_, "ostree-archive")
         images_unpack_executed(storage_dir_)
+        src_ostree_archive_dir = ostree.get_archive_repo(
+            os.path.join(storage_dir_, "ostree-archive"))
         summary_cmd = ['ostree', 'summary', '--repo', src_ostree_archive_dir, '-u']
         subprocess.check_output(summary_cmd, stderr=subprocess.STDOUT)
     else:
@@ -60,12 +61,12 @@ def do_serve_ostree(args):
     serve_ostree(args.storage_directory, args.ostree_repo_directory)
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Initialize argument parser"""
 
     parser = subparsers.add_parser(
         "ostree",
-        help="OSTree operational commands",
+        help=help_text,
         allow_abbrev=False)
 
     subparsers = parser.add_subparsers(
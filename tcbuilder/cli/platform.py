@@ -656,13 +656,12 @@ def add_common_push_arguments(subparser):
         action="store",
         help="Custom Uptane metadata for the package.", required=False)
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Initialize 'platform' subcommands command line interface."""
 
     parser = subparsers.add_parser(
         "platform",
-        help=("Execute operations that interact with the Torizon Platform Services "
-              "(app.torizon.io) or a compatible server"),
+        help=help_text,
         allow_abbrev=False)
     subparsers = parser.add_subparsers(title='Commands', required=True, dest='cmd')
 
@@ -843,9 +842,7 @@ def static_delta_create(credentials, from_delta, to_delta, upload_delta=True):
             args=(repo, from_delta, to_delta),
             loading_msg="Creating static delta...")
 
-        b64_from = base64.b64encode(bytes.fromhex(from_delta)).decode().strip('=').replace('/', '_')
-        b64_to = base64.b64encode(bytes.fromhex(to_delta)).decode().strip('=').replace('/', '_')
-        delta_id = f"{b64_from[:2]}/{b64_from[2:]}-{b64_to}"
+        delta_id = ostree.get_delta_id(from_delta, to_delta)
         delta_dir = f"{local_ostree_repo}/deltas/{delta_id}"
         superblock_hash = common.get_file_sha256sum(f"{delta_dir}/superblock")
 
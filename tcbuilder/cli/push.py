@@ -21,12 +21,12 @@ def push_subcommand(args):
                 "of TorizonCore Builder; please use \"platform push\" instead.")
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Initialize argument parser"""
 
     subparser = subparsers.add_parser(
         "push",
-        help="Push artifact to OTA server as a new update package.",
+        help=help_text,
         description=("Warning: The \"push\" command is deprecated and will be "
                      "removed in an upcoming major release of TorizonCore Builder; "
                      "please use \"platform push\" instead."),
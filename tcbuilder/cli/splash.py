@@ -67,12 +67,12 @@ def do_splash(args):
     splash(args.splash_image, args.storage_directory)
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Parser for "splash" command."""
 
     subparser = subparsers.add_parser(
         "splash",
-        help="change splash screen",
+        help=help_text,
         epilog="NOTE: the switches --image and --work-dir have been removed.",
         allow_abbrev=False)
 
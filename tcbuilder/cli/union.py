@@ -8,8 +8,8 @@ sub-command).
 import argparse
 import logging
 import os
+import stat
 import subprocess
-import shutil
 
 from tcbuilder.backend import union as ub
 from tcbuilder.errors import PathNotExistError, InvalidArgumentError
@@ -18,54 +18,63 @@ from tcbuilder.backend.common import images_unpack_executed
 log = logging.getLogger("torizon." + __name__)
 
 
-def check_and_append_dirs(changes_dirs, new_changes_dirs, temp_dir):
-    """Check and append additional directories with changes"""
+def check_and_append_dirs(changes_dirs, new_changes_dirs):
+    """Check and append additional directories with changes
 
+    The directories are used in place: their ownership, modes and ACLs are
+    applied while committing them (see ub.ChangesAttributes).
+
+    :returns: List with the absolute paths of the additional directories.
+    """
+
+    extra_dirs = []
     for changes_dir in new_changes_dirs:
         if not os.path.exists(changes_dir):
             raise PathNotExistError(f'Changes directory "{changes_dir}" does not exist')
+        extra_dirs.append(os.path.abspath(changes_dir))
 
-        copy_src = os.path.join(changes_dir, ".")
-        copy_dest = os.path.join(temp_dir, changes_dir)
-        shutil.copytree(copy_src, copy_dest, symlinks=True)
-        temp_change_dir = os.path.join(temp_dir, changes_dir)
-        set_acl_attributes(temp_change_dir)
-        changes_dirs.append(os.path.abspath(temp_change_dir))
+    changes_dirs.extend(extra_dirs)
+    return extra_dirs
 
 
-def apply_tcattr_acl(files):
+def read_tcattr_entries(tcattr_file):
     """
-    Apply ACLs based on .tcattr files. It just needs to be done once for
-    each ".tcattr" file found in each sub directory of the tree.
+    Read the entries of a ".tcattr" file.
 
-    :param files: A list with the elements being a tuple of the base_dir
-                  of all '.tcattr' files and all filenames that we should
-                  apply the ACL attributes.
+    :param tcattr_file: Path to the ".tcattr" file.
+    :returns: List of tuples (filename, lines) with the (unescaped) filename
+              of each entry, relative to the directory of the ".tcattr"
+              file, and the lines of the entry following the "# file:" line.
     """
 
-    for tcattr_basedir in {tcattr[0] for tcattr in files}:
-        tcattr_file = os.path.join(tcattr_basedir, '.tcattr')
-        setfacl_cmd = ['setfacl', f'--restore={tcattr_file}']
-        subprocess.run(setfacl_cmd, cwd=tcattr_basedir, check=True)
+    entries = []
+    with open(tcattr_file, 'r') as fd_tcattr:
+        for line in fd_tcattr:
+            line = line.rstrip('\n')
+            if line.startswith('# file: '):
+                entries.append((ub.unescape_getfacl_name(line[len('# file: '):]), []))
+            elif line and entries:
+                entries[-1][1].append(line)
+    return entries
 
 
-def set_file_mode(filename, mode):
+def apply_tcattr_acl(change_dir, entries):
     """
-    Set file mode and ownership if filename is a regular file or a directory.
-    If filename is a symbolic link, set just the ownership since it is not
-    possible to set the mode (permissions) for a symbolic link in Linux.
+    Apply the ACLs of the ".tcattr" files with a single "setfacl" call.
 
-    :param filename: Filename to set the mode to.
-    :param mode: Mode to be set on the file.
+    :param change_dir: Directory with changes.
+    :param entries: List of tuples (path, lines) where path is relative to
+                    change_dir and lines are the lines of the ".tcattr"
+                    entry following the "# file:" line.
     """
 
-    root_uid = 0
-    root_gid = 0
-
-    os.chown(filename, root_uid, root_gid, follow_symlinks=False)
-
-    if not os.path.islink(filename):
-        os.chmod(filename, mode)
+    if not entries:
+        return
+    restore = "".join(
+        "# file: {}\n{}\n\n".format(ub.escape_getfacl_name(path), "\n".join(lines))
+        for path, lines in entries)
+    setfacl_cmd = ['setfacl', '--restore=-']
+    subprocess.run(setfacl_cmd, input=restore, cwd=change_dir, text=True, check=True)
 
 
 def apply_default_acl(files):
@@ -76,93 +85,63 @@ def apply_default_acl(files):
       - For directories: 0755.
       - For symbolic links just the user and group will be set.
       - For all files and directories the user and group will be "root".
+    Files already having the right ownership and mode are not touched.
 
     :param files: A list of files to apply default ACL.
     """
 
-    default_file_mode = 0o660
-    default_dir_mode = 0o755
-    default_exec_mode = 0o770
+    root_uid = 0
+    root_gid = 0
 
     for filename in files:
-        mode = default_file_mode
-        if os.path.isdir(filename):
-            mode = default_dir_mode
-        else:
-            # Check if file is an executable file
-            status = os.stat(filename, follow_symlinks=False)
-            if status.st_mode & 0o111:
-                mode = default_exec_mode
-        set_file_mode(filename, mode)
-
-
-def remove_links_from_tcattr(base_dir):
-    """
-    Remove any symbolic link from the '.tcattr' file.
-    It's need because we cannot set mode (permissions) for symbolic
-    links in Linux.
-
-    :param base_dir: Base directory where there is a '.tcattr' file.
-    """
-
-    tcattr = []
-    tcattr_file = os.path.join(base_dir, '.tcattr')
-    tcattr_file_tmp = os.path.join(base_dir, '.tcattr.tmp')
-    field_separator = '%TCB%'
-
-    with open(tcattr_file, 'r') as fd_tcattr:
-        for line in fd_tcattr:
-            if line.startswith('\n'):
-                tcattr.append(field_separator)
-            else:
-                tcattr.append(line)
-    tcattr = ''.join(tcattr)
-
-    with open(tcattr_file_tmp, 'w') as fd_tcattr_tmp:
-        for file_attr in tcattr.split(field_separator):
-            filename = file_attr.split('\n')[0].replace('# file: ', '')
-            if not os.path.islink(os.path.join(base_dir, filename)):
-                fd_tcattr_tmp.write(file_attr+'\n')
-
-    os.rename(tcattr_file_tmp, tcattr_file)
+        status = os.lstat(filename)
+        if status.st_uid != root_uid or status.st_gid != root_gid:
+            os.chown(filename, root_uid, root_gid, follow_symlinks=False)
+        # It is not possible to set the mode of a symbolic link in Linux.
+        if stat.S_ISLNK(status.st_mode):
+            continue
+        mode = stat.S_IMODE(ub.default_file_mode(status.st_mode))
+        if stat.S_IMODE(status.st_mode) != mode:
+            os.chmod(filename, mode)
 
 
 def set_acl_attributes(change_dir):
     """
-    From "change_dir" onward, find all ".tcattr" files and create two lists
-    which the content should be:
+    From "change_dir" onward, find all ".tcattr" files and, in a single walk
+    over the tree, sort files and/or directories into two groups:
       - Files and/or directories that must have ".tcattr" ACLs
       - The other files and/or directories that must have "default" ACLs
     Each ".tcattr" file should be created by the "isolate" command or
-    manually by the user.
-    Having both lists in hand, set the attributes.
+    manually by the user; entries of symbolic links are ignored since we
+    cannot set their mode (permissions) in Linux.
+    Having both groups in hand, set the attributes.
 
     :param change_dir: Directory with changes to be incoporated into an
                        OSTree commit.
     """
 
-    files_to_apply_tcattr_acl = []
+    change_dir = os.path.normpath(change_dir)
+    tcattr_entries = []
+    tcattr_paths = set()
     files_to_apply_default_acl = []
 
-    for base_dir, _, filenames in os.walk(change_dir):
-        if '.tcattr' not in filenames:
-            continue
-        remove_links_from_tcattr(base_dir)
-        with open(os.path.join(base_dir, '.tcattr')) as fd_tcattr:
-            files_to_apply_tcattr_acl = [
-                (base_dir, line.strip().replace('# file: ', ''))
-                for line in fd_tcattr
-                if '# file: ' in line]
-
+    # Entries of a ".tcattr" file refer to its directory or below, which
+    # os.walk() (top-down) visits only after the ".tcattr" file is read.
     for base_dir, dirnames, filenames in os.walk(change_dir):
+        if '.tcattr' in filenames:
+            for filename, lines in read_tcattr_entries(os.path.join(base_dir, '.tcattr')):
+                path = os.path.normpath(os.path.join(base_dir, filename))
+                if os.path.islink(path):
+                    continue
+                tcattr_paths.add(path)
+                tcattr_entries.append((os.path.relpath(path, change_dir), lines))
+
         for filename in dirnames + filenames:
-            if filename != '.tcattr' and \
-               os.path.join(base_dir, filename) not in [
-                       os.path.join(*f)
-                       for f in files_to_apply_tcattr_acl]:
-                files_to_apply_default_acl.append(os.path.join(base_dir, filename))
+            path = os.path.join(base_dir, filename)
+            if filename != '.tcattr' and path not in tcattr_paths:
+                files_to_apply_default_acl.append(path)
 
-    apply_tcattr_acl(files_to_apply_tcattr_acl)
+    apply_tcattr_acl(change_dir, tcattr_entries)
     apply_default_acl(files_to_apply_default_acl)
 
 
@@ -184,7 +163,7 @@ def make_dirs_labels(changes_dirs, stor_pref, work_pref):
         elif fulldir.startswith(work_pref):
             dirs_labels[fulldir] = f"WORKDIR/{fulldir[len(work_pref):]}"
         else:
-            assert False, f"Unhandled prefix: {fulldir}"
+            dirs_labels[fulldir] = fulldir
 
     return dirs_labels
 
@@ -209,13 +188,12 @@ def union(changes_dirs, storage_dir, union_branch,
                 set_acl_attributes(changed_dir)
             changes_dirs_.append(changed_dir)
 
-    temp_dir_extra = os.path.join("/tmp", "changes_dirs")
+    extra_dirs = []
     if changes_dirs:
-        os.mkdir(temp_dir_extra)
-        check_and_append_dirs(changes_dirs_, changes_dirs, temp_dir_extra)
+        extra_dirs = check_and_append_dirs(changes_dirs_, changes_dirs)
 
     src_ostree_archive_dir = os.path.join(storage_dir_, "ostree-archive")
-    dirs_labels = make_dirs_labels(changes_dirs_, storage_dir_, temp_dir_extra)
+    dirs_labels = make_dirs_labels(changes_dirs_, storage_dir_, os.getcwd())
 
     # Callback to show the label when backend is about to apply it:
     def apply_callback(fulldir):
@@ -225,7 +203,7 @@ def union(changes_dirs, storage_dir, union_branch,
     commit = ub.union_changes(
         changes_dirs_, src_ostree_archive_dir,
         union_branch, commit_subject, commit_body,
-        pre_apply_callback=apply_callback)
+        pre_apply_callback=apply_callback, attribute_dirs=extra_dirs)
 
     log.info(f"Commit {commit} has been generated for changes and is ready"
              " to be deployed.")
@@ -260,12 +238,11 @@ def do_union(args):
           args.union_branch, args.subject, args.body)
 
 
-def init_parser(subparsers):
+def init_parser(subparsers, help_text):
     """Initialize argument parser"""
     subparser = subparsers.add_parser(
         "union",
-        help=("Create a commit out of isolated changes for unpacked "
-              "Toradex Easy Installer Image"),
+        help=help_text,
         epilog=("NOTE: the switch --extra-changes-directory has been "
                 "removed; please use --changes-directory instead."),
         allow_abbrev=False)
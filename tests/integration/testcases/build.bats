@@ -250,6 +250,42 @@ teardown_file() {
     rm -rf "$DUMMY_OUTPUT"
 }
 
+@test "build: config file with rootfs compression settings" {
+    local DUMMY_OUTPUT="dummy_output_directory"
+    rm -rf $DUMMY_OUTPUT
+
+    run torizoncore-builder build \
+          --file "$SAMPLES_DIR/config/tcbuild-with-compression.yaml" \
+          --set INPUT_IMAGE="$DEFAULT_TEZI_IMAGE"
+    assert_success
+
+    # Uncompressed size in image.json (in MiB) must match the actual tarball contents.
+    local size=$(zstd -dc $DUMMY_OUTPUT/*.ota.tar.zst | wc -c)
+    run sh -c "grep -oE '\"uncompressed_size\":\s*[0-9.e+-]+' $DUMMY_OUTPUT/image.json |
+               sed 's/.*:\s*//' |
+               awk -v bytes=$size '{ d = \$1 - bytes / 1048576; if (d < 0.001 && d > -0.001) found = 1 }
+                                   END { exit !found }'"
+    assert_success
+
+    rm -rf "$DUMMY_OUTPUT"
+}
+
+@test "build: config file with storage mode" {
+    local DUMMY_OUTPUT="dummy_output_directory"
+    rm -rf $DUMMY_OUTPUT
+
+    run torizoncore-builder build \
+          --file "$SAMPLES_DIR/config/tcbuild-with-storage-mode.yaml" \
+          --set INPUT_IMAGE="$DEFAULT_TEZI_IMAGE"
+    assert_success
+
+    run torizoncore-builder-shell "ostree config --repo=/storage/ostree-archive/ get core.mode"
+    assert_success
+    assert_output "bare-user"
+
+    rm -rf "$DUMMY_OUTPUT"
+}
+
 @test "build: check overlays's clear" {
     local OVERLAY_IMAGE="overlay_image"
     local DUMMY_OUTPUT="dummy_output_directory"
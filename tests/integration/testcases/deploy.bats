@@ -87,6 +87,38 @@ load 'lib/common.bash'
     assert_failure 42
 }
 
+# bats test_tags=requires-device
+@test "deploy: deploy changes to devices of an inventory file" {
+    requires-device
+
+    torizoncore-builder-clean-storage
+    torizoncore-builder images --remove-storage unpack $DEFAULT_TEZI_IMAGE
+    torizoncore-builder union --changes-directory $SAMPLES_DIR/changes2 branch1
+
+    local INVENTORY="inventory.yaml"
+    cat > $INVENTORY <<EOF
+devices:
+  - host: $DEVICE_ADDR
+    port: $DEVICE_PORT
+EOF
+
+    run torizoncore-builder deploy --remote-inventory $INVENTORY \
+                                   --remote-username $DEVICE_USER \
+                                   --remote-password $DEVICE_PASS \
+                                   --static-delta --reboot branch1
+    assert_success
+    assert_output --partial "Deployment results:"
+    assert_output --regexp "$DEVICE_ADDR +OK"
+
+    rm -f $INVENTORY
+
+    run device-wait 20
+    assert_success
+
+    run device-shell-root /usr/sbin/secret_of_life
+    assert_failure 42
+}
+
 @test "deploy: check with --image-autoinstall" {
     local LICENSE_FILE="license-fc.html"
     local LICENSE_DIR="$SAMPLES_DIR/installer/$LICENSE_FILE"
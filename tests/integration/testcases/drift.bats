@@ -0,0 +1,61 @@
+bats_load_library 'bats/bats-support/load.bash'
+bats_load_library 'bats/bats-assert/load.bash'
+bats_load_library 'bats/bats-file/load.bash'
+load 'lib/common.bash'
+
+@test "drift: run without parameters" {
+    run torizoncore-builder drift
+    assert_failure 2
+    assert_output --partial "error: the following arguments are required: --remote-inventory"
+}
+
+@test "drift: check help output" {
+    run torizoncore-builder drift --help
+    assert_success
+    assert_output --partial "usage: torizoncore-builder drift"
+}
+
+@test "drift: check invalid inventory file" {
+    local INVENTORY="inventory.yaml"
+    echo "devices: []" > $INVENTORY
+
+    run torizoncore-builder drift --remote-inventory $INVENTORY
+    assert_failure
+    assert_output --partial "must hold a non-empty list 'devices'"
+
+    rm -f $INVENTORY
+}
+
+# bats test_tags=requires-device
+@test "drift: scan devices of an inventory file" {
+    requires-device
+
+    local TMPFILE=$(mktemp -u tmp.XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX)
+    local DRIFT_FILE=/etc/$TMPFILE
+    device-shell-root "touch $DRIFT_FILE"
+
+    local INVENTORY="inventory.yaml"
+    cat > $INVENTORY <<EOF
+devices:
+  - host: $DEVICE_ADDR
+    port: $DEVICE_PORT
+EOF
+
+    local REPORT="drift-report.json"
+    local CHANGES_DIR=$(mktemp -d -u tmpdir.XXXXXXXXXXXXXXXXXXXXXXXXX)
+    run torizoncore-builder drift --remote-inventory $INVENTORY \
+                                  --remote-username $DEVICE_USER \
+                                  --remote-password $DEVICE_PASS \
+                                  --report $REPORT \
+                                  --changes-directory $CHANGES_DIR
+    assert_success
+    assert_output --partial "Drift report (1 device(s) scanned, 0 failed"
+    assert_output --regexp "etc/$TMPFILE +A [0-9a-f]+ +$DEVICE_ADDR"
+
+    run grep "\"path\": \"etc/$TMPFILE\"" $REPORT
+    assert_success
+    assert_file_exist "$CHANGES_DIR/$DEVICE_ADDR/usr$DRIFT_FILE"
+
+    device-shell-root "rm -f $DRIFT_FILE"
+    rm -rf $INVENTORY $REPORT $CHANGES_DIR
+}
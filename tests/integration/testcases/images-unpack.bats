@@ -86,3 +86,41 @@ bats_load_library 'bats/bats-file/load.bash'
     run torizoncore-builder-shell "ls -l /storage/toolchain"
     assert_success
 }
+
+@test "images unpack: restore image from the unpack cache" {
+    torizoncore-builder-clean-storage
+
+    run torizoncore-builder images --remove-storage unpack --cache $DEFAULT_TEZI_IMAGE
+    assert_success
+    assert_output --partial "Unpacked OSTree from Toradex Easy Installer image"
+
+    run torizoncore-builder images --remove-storage unpack --cache $DEFAULT_TEZI_IMAGE
+    assert_success
+    assert_output --partial "Restoring unpacked image"
+    assert_output --partial "Unpacked OSTree from cache"
+
+    run torizoncore-builder-shell "ls /storage/"
+    assert_success
+    assert_output --regexp "ostree-archive.*sysroot.*tezi.*unpack-cache"
+}
+
+@test "images unpack: unpack image into a bare-user storage repository" {
+    torizoncore-builder-clean-storage
+
+    run torizoncore-builder images --remove-storage unpack --storage-mode bare-user \
+        $DEFAULT_TEZI_IMAGE
+    assert_success
+    assert_output --partial "Unpacked OSTree from Toradex Easy Installer image"
+
+    run torizoncore-builder-shell "grep '^mode' /storage/ostree-archive/config"
+    assert_success
+    assert_output "mode=bare-user"
+
+    run torizoncore-builder union --changes-directory $SAMPLES_DIR/changes branch1
+    assert_success
+
+    # The archive copy is created on demand only.
+    run torizoncore-builder-shell "ls /storage/"
+    assert_success
+    refute_output --partial "ostree-archive-export"
+}
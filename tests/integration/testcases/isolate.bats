@@ -292,3 +292,83 @@ load 'lib/isolate.bash'
                                     --force
     assert_success
 }
+
+@test "isolate: check --compress requires --stream" {
+    run torizoncore-builder isolate --remote-host 127.0.0.1 --compress
+    assert_failure
+    assert_output --partial "--compress can only be used with --stream"
+}
+
+# bats test_tags=requires-device
+@test "isolate: isolate changes streaming them from the device" {
+    requires-device
+
+    local ISOLATE_DIR=$(mktemp -d tmpdir.XXXXXXXXXXXXXXXXXXXXXXXXX)
+    rm -rf $ISOLATE_DIR
+
+    create-files-in-device
+
+    torizoncore-builder images --remove-storage unpack $DEFAULT_TEZI_IMAGE
+    run torizoncore-builder isolate --changes-directory $ISOLATE_DIR \
+                                    --remote-host $DEVICE_ADDR \
+                                    --remote-username $DEVICE_USER \
+                                    --remote-password $DEVICE_PASS \
+                                    --remote-port $DEVICE_PORT \
+                                    --stream --compress
+    assert_success
+    assert_output --partial "Changes in /etc successfully isolated."
+
+    check-tcattr-file "changes-dir" "$ISOLATE_DIR"
+    check-isolated-files "changes-dir" "$ISOLATE_DIR"
+
+    check-rm-output-file $ISOLATE_DIR $TMPFILE
+}
+
+# bats test_tags=requires-device
+@test "isolate: isolate changes incrementally" {
+    requires-device
+
+    local ISOLATE_DIR=$(mktemp -d tmpdir.XXXXXXXXXXXXXXXXXXXXXXXXX)
+    rm -rf $ISOLATE_DIR
+
+    local TMPFILE=$(mktemp tmp.XXXXXXXXXXXXXXXXXXXXXXXXXXXXXXXX)
+    local ISOLATE_FILE=/etc/$TMPFILE
+    device-shell-root "touch $ISOLATE_FILE"
+
+    run torizoncore-builder isolate --changes-directory $ISOLATE_DIR \
+                                    --remote-host $DEVICE_ADDR \
+                                    --remote-username $DEVICE_USER \
+                                    --remote-password $DEVICE_PASS \
+                                    --remote-port $DEVICE_PORT \
+                                    --incremental
+    assert_success
+    assert_output --partial "Changes in /etc successfully isolated."
+    assert_file_exist "$ISOLATE_DIR.manifest.json"
+
+    # Nothing changed on the device: nothing to be transferred.
+    run torizoncore-builder isolate --changes-directory $ISOLATE_DIR \
+                                    --remote-host $DEVICE_ADDR \
+                                    --remote-username $DEVICE_USER \
+                                    --remote-password $DEVICE_PASS \
+                                    --remote-port $DEVICE_PORT \
+                                    --incremental
+    assert_success
+    assert_output --partial "Updating changes captured previously"
+    assert_output --regexp "0 of [0-9]+ changed file\(s\) differ from the previous capture"
+
+    device-shell-root "echo modified > $ISOLATE_FILE"
+    run torizoncore-builder isolate --changes-directory $ISOLATE_DIR \
+                                    --remote-host $DEVICE_ADDR \
+                                    --remote-username $DEVICE_USER \
+                                    --remote-password $DEVICE_PASS \
+                                    --remote-port $DEVICE_PORT \
+                                    --incremental --stream
+    assert_success
+    assert_output --regexp "1 of [0-9]+ changed file\(s\) differ from the previous capture"
+    run cat "$ISOLATE_DIR/usr$ISOLATE_FILE"
+    assert_output "modified"
+
+    device-shell-root "rm -f $ISOLATE_FILE"
+    rm -f "$ISOLATE_DIR.manifest.json"
+    check-rm-output-file $ISOLATE_DIR $TMPFILE
+}
@@ -40,6 +40,8 @@ load 'lib/union.bash'
     run torizoncore-builder union --changes-directory $SAMPLES_DIR/changes branch1
     assert_success
     assert_output --regexp "Commit.*has been generated for changes and (is )?ready to be deployed."
+    assert_output --regexp "Layer applied in [0-9.]+s."
+    assert_output --regexp "Transaction committed. [0-9]+ objects \([0-9]+ bytes\) written."
 
     local COMMIT=$(echo "$output" | grep '^Commit' | cut -d' ' -f 2)
     local ROOTFS=/storage/$COMMIT
@@ -163,3 +165,75 @@ load 'lib/union.bash'
     check-credentials-for-links $ROOTFS
     check-tcattr-files-removal $ROOTFS
 }
+
+@test "union: check --changes-directory is committed without being modified or copied" {
+    torizoncore-builder-clean-storage
+    torizoncore-builder images --remove-storage unpack $DEFAULT_TEZI_IMAGE
+
+    local EXTRA_DIR="extra_changes_dir"
+    rm -rf $EXTRA_DIR
+    cp -a "$SAMPLES_DIR/changes3" $EXTRA_DIR
+    local BEFORE=$(find $EXTRA_DIR -exec stat -c '%n %u:%g %a' {} + | sort)
+
+    local COMMIT=tcattr-branch
+    run torizoncore-builder union --changes-directory $EXTRA_DIR $COMMIT
+    assert_success
+
+    local AFTER=$(find $EXTRA_DIR -exec stat -c '%n %u:%g %a' {} + | sort)
+    assert_equal "$AFTER" "$BEFORE"
+
+    local ROOTFS=/storage/$COMMIT
+    torizoncore-builder-shell "rm -rf $ROOTFS"
+    torizoncore-builder-shell "ostree checkout --repo=/storage/ostree-archive/ $COMMIT $ROOTFS"
+    check-credentials-for-links $ROOTFS
+    check-tcattr-files-removal $ROOTFS
+
+    rm -rf $EXTRA_DIR
+}
+
+@test "union: reuse commit when changes are unchanged" {
+    torizoncore-builder-clean-storage
+    torizoncore-builder images --remove-storage unpack $DEFAULT_TEZI_IMAGE
+
+    run torizoncore-builder union --changes-directory $SAMPLES_DIR/changes branch1
+    assert_success
+    local COMMIT=$(echo "$output" | grep '^Commit' | cut -d' ' -f 2)
+
+    run torizoncore-builder union --changes-directory $SAMPLES_DIR/changes branch1
+    assert_success
+    assert_output --partial "Changes are unchanged since commit $COMMIT; reusing it."
+    assert_output --partial "Commit $COMMIT has been generated"
+
+    run torizoncore-builder-shell "ostree rev-parse --repo=/storage/ostree-archive/ branch1"
+    assert_success
+    assert_output "$COMMIT"
+
+    run torizoncore-builder union --changes-directory $SAMPLES_DIR/changes \
+        --subject other-subject branch1
+    assert_success
+    refute_output --partial "reusing it"
+}
+
+@test "union: do not reuse commit of another branch" {
+    torizoncore-builder-clean-storage
+    torizoncore-builder images --remove-storage unpack $DEFAULT_TEZI_IMAGE
+
+    run torizoncore-builder union --changes-directory $SAMPLES_DIR/changes branch1
+    assert_success
+    local COMMIT1=$(echo "$output" | grep '^Commit' | cut -d' ' -f 2)
+
+    run torizoncore-builder union --changes-directory $SAMPLES_DIR/changes branch2
+    assert_success
+    refute_output --partial "reusing it"
+    local COMMIT2=$(echo "$output" | grep '^Commit' | cut -d' ' -f 2)
+    assert [ "$COMMIT1" != "$COMMIT2" ]
+
+    run torizoncore-builder-shell "ostree show --repo=/storage/ostree-archive/ \
+                                   --print-metadata-key=ostree.ref-binding branch2"
+    assert_success
+    assert_output "['branch2']"
+
+    run torizoncore-builder-shell "ostree rev-parse --repo=/storage/ostree-archive/ branch1"
+    assert_success
+    assert_output "$COMMIT1"
+}
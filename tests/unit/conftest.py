@@ -22,3 +22,19 @@ def fixture_work_dir():
     logging.info("Cleaning up /workdir/bundle...")
     if work_dir.join("bundle").isdir():
         work_dir.join("bundle").remove(rec=1)
+
+
+def pytest_configure(config):
+    """Register the markers used by the unit tests"""
+    config.addinivalue_line(
+        "markers", "benchmark: performance benchmark, only run with '-m benchmark'")
+
+
+def pytest_collection_modifyitems(config, items):
+    """Leave benchmarks out unless they are selected explicitly"""
+    if "benchmark" in config.getoption("markexpr", ""):
+        return
+    skip_benchmark = pytest.mark.skip(reason="benchmark: run with '-m benchmark' to enable")
+    for item in items:
+        if "benchmark" in item.keywords:
+            item.add_marker(skip_benchmark)
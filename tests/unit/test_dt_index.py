@@ -0,0 +1,47 @@
+"""Tests of the device tree file index of the storage sysroot"""
+
+import json
+import os
+
+from tcbuilder.backend import dt, dto
+
+KERNEL_SUBDIR = "usr/lib/modules/5.15.77-6.2.0/dtb"
+
+
+def create_storage(storage_dir):
+    """Create a storage directory with a deployment holding device trees"""
+    deploy_dir = storage_dir / "sysroot" / "ostree" / "deploy" / "torizon" / "deploy" / "0.0"
+    dtb_dir = deploy_dir / KERNEL_SUBDIR
+    (dtb_dir / "overlays").mkdir(parents=True)
+    (deploy_dir / "usr" / "bin").mkdir()
+    dtb_dir.joinpath("board-b.dtb").write_text("dtb")
+    dtb_dir.joinpath("board-a.dtb").write_text("dtb")
+    dtb_dir.joinpath("overlays.txt").write_text("fdt_overlays=display.dtbo\n")
+    dtb_dir.joinpath("overlays", "display.dtbo").write_text("dtbo")
+    return dtb_dir
+
+
+def test_sysroot_dt_index(tmp_path):
+    """Device tree files are found through the index"""
+
+    storage_dir = str(tmp_path)
+    dtb_dir = create_storage(tmp_path)
+
+    assert dt.get_dtb_kernel_subdir(storage_dir) == KERNEL_SUBDIR
+    assert dto.get_active_overlays_txt_path(storage_dir) == str(dtb_dir / "overlays.txt")
+    assert dto.get_applied_overlays_base_names(storage_dir) == ["display.dtbo"]
+    assert dto.find_path_to_overlay(storage_dir, "display.dtbo") == \
+        str(dtb_dir / "overlays" / "display.dtbo")
+
+    index_file = tmp_path / "sysroot" / dt.SYSROOT_DT_INDEX_FILE
+    with open(index_file) as jsonf:
+        index = json.load(jsonf)
+    assert os.path.join(storage_dir, "sysroot", index["first_dtb"]) == \
+        str(dtb_dir / "board-a.dtb")
+    assert "board-b.dtb" in index["dtbs"]
+
+    # The index is not rebuilt once stored.
+    dtb_dir.joinpath("overlays", "other.dtbo").write_text("dtbo")
+    assert "other.dtbo" not in dt.get_sysroot_dt_index(storage_dir)["overlays"]
+    os.unlink(index_file)
+    assert "other.dtbo" in dt.get_sysroot_dt_index(storage_dir)["overlays"]
@@ -0,0 +1,23 @@
+"""Tests of the bisection of overlays that cannot be applied"""
+
+import pytest
+
+from tcbuilder.backend import dto
+
+
+@pytest.mark.parametrize("bad_idx,start", [(0, 0), (3, 0), (7, 0), (5, 2), (2, 2)])
+def test_find_inapplicable_overlay(monkeypatch, bad_idx, start):
+    """The first overlay breaking the application is found with few attempts"""
+
+    dtob_paths = [f"overlay{idx}.dtbo" for idx in range(8)]
+    attempts = []
+
+    def fake_modify(_dtb_path, dtob_paths_, _target_dtb_path, quiet=False):
+        assert quiet
+        attempts.append(len(dtob_paths_))
+        return f"overlay{bad_idx}.dtbo" not in dtob_paths_
+
+    monkeypatch.setattr(dto, "modify_dtb_by_overlays", fake_modify)
+
+    assert dto.find_inapplicable_overlay("base.dtb", dtob_paths, start=start) == bad_idx
+    assert len(attempts) <= 3
@@ -0,0 +1,124 @@
+"""Tests and benchmark of the HTTP server used to serve OSTree repositories
+
+The benchmark pulls an archive repository through the server with the
+"ostree" program, as done by devices on "deploy --remote-host", and reports
+the time taken compared to a plain single-threaded HTTP/1.0 server. It is
+skipped by default (run pytest with "-m benchmark -s" to see the results).
+
+Note: These tests expect all dependencies of TorizonCore Builder to be
+installed (i.e. they should be run inside the TorizonCore Builder container).
+"""
+
+import http.client
+import os
+import shutil
+import subprocess
+import threading
+import time
+
+from functools import partial
+from http.server import HTTPServer, SimpleHTTPRequestHandler
+
+import pytest
+
+from tcbuilder.backend import ostree
+
+# Shape of the tree committed into the benchmark repository.
+BENCH_DIRS = 50
+BENCH_FILES_PER_DIR = 40
+BENCH_FILE_SIZE = 4096
+
+
+class QuietHTTPRequestHandler(SimpleHTTPRequestHandler):
+    """SimpleHTTPRequestHandler not logging requests"""
+
+    #pylint: disable=redefined-builtin
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture(name="http_thread")
+def fixture_http_thread(tmp_path):
+    """Serve a temporary directory with the OSTree HTTP server"""
+    http_thread = ostree.serve_ostree_start(str(tmp_path), host="127.0.0.1", port=0)
+    yield http_thread
+    ostree.serve_ostree_stop(http_thread)
+
+
+def test_keep_alive(tmp_path, http_thread):
+    """Several requests must be served over a single HTTP/1.1 connection"""
+
+    data = os.urandom(1024 * 1024)
+    tmp_path.joinpath("object").write_bytes(data)
+
+    conn = http.client.HTTPConnection("127.0.0.1", http_thread.server_port)
+    for _ in range(3):
+        conn.request("GET", "/object")
+        resp = conn.getresponse()
+        assert resp.status == 200
+        assert resp.version == 11
+        assert resp.read() == data
+
+    conn.request("GET", "/missing")
+    resp = conn.getresponse()
+    resp.read()
+    assert resp.status == 404
+    conn.close()
+
+
+def create_bench_repo(repo_dir, tree_dir):
+    """Create an archive repository with many small objects"""
+    for dir_idx in range(BENCH_DIRS):
+        sub_dir = tree_dir / f"dir{dir_idx}"
+        sub_dir.mkdir(parents=True)
+        for file_idx in range(BENCH_FILES_PER_DIR):
+            sub_dir.joinpath(f"file{file_idx}").write_bytes(os.urandom(BENCH_FILE_SIZE))
+    subprocess.run(["ostree", "init", "--mode=archive", f"--repo={repo_dir}"], check=True)
+    subprocess.run(["ostree", "commit", f"--repo={repo_dir}", "--branch=bench",
+                    f"--tree=dir={tree_dir}"], check=True, stdout=subprocess.DEVNULL)
+
+
+def pull_repo(url, dest_dir):
+    """Pull the "bench" branch from a remote, returning the time taken"""
+    shutil.rmtree(dest_dir, ignore_errors=True)
+    subprocess.run(["ostree", "init", "--mode=archive", f"--repo={dest_dir}"], check=True)
+    subprocess.run(["ostree", "remote", "add", "--no-gpg-verify", f"--repo={dest_dir}",
+                    "bench", url], check=True)
+    start = time.monotonic()
+    subprocess.run(["ostree", "pull", f"--repo={dest_dir}", "bench", "bench"],
+                   check=True, stdout=subprocess.DEVNULL)
+    elapsed = time.monotonic() - start
+    subprocess.run(["ostree", "fsck", f"--repo={dest_dir}"],
+                   check=True, stdout=subprocess.DEVNULL)
+    return elapsed
+
+
+@pytest.mark.benchmark
+@pytest.mark.skipif(shutil.which("ostree") is None, reason="ostree program not available")
+def test_benchmark_pull(tmp_path):
+    """Benchmark pulling an archive repository through the HTTP server"""
+
+    repo_dir = tmp_path / "repo"
+    create_bench_repo(repo_dir, tmp_path / "tree")
+
+    # Baseline: plain single-threaded HTTP/1.0 server.
+    baseline = HTTPServer(("127.0.0.1", 0),
+                          partial(QuietHTTPRequestHandler, directory=str(repo_dir)))
+    threading.Thread(target=baseline.serve_forever, daemon=True).start()
+    try:
+        baseline_time = pull_repo(
+            f"http://127.0.0.1:{baseline.server_port}", tmp_path / "pull-baseline")
+    finally:
+        baseline.shutdown()
+        baseline.server_close()
+
+    http_thread = ostree.serve_ostree_start(str(repo_dir), host="127.0.0.1", port=0)
+    try:
+        server_time = pull_repo(
+            f"http://127.0.0.1:{http_thread.server_port}", tmp_path / "pull")
+    finally:
+        ostree.serve_ostree_stop(http_thread)
+
+    objects = BENCH_DIRS * BENCH_FILES_PER_DIR
+    print(f"\nPulled {objects} objects: plain HTTPServer {baseline_time:.2f}s, "
+          f"OSTree HTTP server {server_time:.2f}s")
@@ -0,0 +1,55 @@
+"""Tests of the archive copy of non-archive repositories
+
+Note: These tests expect all dependencies of TorizonCore Builder to be
+installed (i.e. they should be run inside the TorizonCore Builder container).
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from tcbuilder.backend import ostree
+
+pytestmark = pytest.mark.skipif(shutil.which("ostree") is None,
+                                reason="ostree program not available")
+
+
+def create_repo(repo_dir, mode):
+    """Create a repository with a single commit"""
+    tree_dir = repo_dir.parent / f"{repo_dir.name}-tree"
+    tree_dir.mkdir()
+    tree_dir.joinpath("file").write_text("data")
+    subprocess.run(["ostree", "init", f"--mode={mode}", f"--repo={repo_dir}"], check=True)
+    result = subprocess.run(
+        ["ostree", "commit", f"--repo={repo_dir}", "--branch=base",
+         f"--tree=dir={tree_dir}"], check=True, stdout=subprocess.PIPE, text=True)
+    shutil.rmtree(tree_dir)
+    return result.stdout.strip()
+
+
+def test_archive_repo_of_storage(tmp_path):
+    """The storage repository gets an archive copy with its references"""
+
+    (tmp_path / "sysroot").mkdir()
+    repo_dir = tmp_path / "ostree-archive"
+    commit = create_repo(repo_dir, "bare-user")
+
+    archive_dir = ostree.get_archive_repo(str(repo_dir))
+    assert archive_dir == str(repo_dir) + ostree.ARCHIVE_EXPORT_SUFFIX
+    assert ostree.get_reference_dict(archive_dir) == {"base": commit}
+
+
+def test_archive_repo_of_other_repos(tmp_path):
+    """Archive repositories are used as they are; other ones are refused"""
+
+    repo_dir = tmp_path / "archive"
+    create_repo(repo_dir, "archive")
+    assert ostree.get_archive_repo(str(repo_dir)) == str(repo_dir)
+
+    repo_dir = tmp_path / "bare"
+    create_repo(repo_dir, "bare-user")
+    with pytest.raises(ostree.TorizonCoreBuilderError, match="not in archive mode"):
+        ostree.get_archive_repo(str(repo_dir))
+    assert sorted(os.listdir(tmp_path)) == ["archive", "bare"]
@@ -0,0 +1,89 @@
+"""Tests of the commit index of OSTree repositories
+
+Note: These tests expect all dependencies of TorizonCore Builder to be
+installed (i.e. they should be run inside the TorizonCore Builder container).
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+from tcbuilder.backend import ostree
+
+pytestmark = pytest.mark.skipif(shutil.which("ostree") is None,
+                                reason="ostree program not available")
+
+KERNEL_VERSION = "5.15.77-6.2.0+git.aeed6fb5d9bc"
+
+
+def create_repo(repo_dir, tree_dir):
+    """Create a repository with a commit holding a kernel"""
+    kernel_dir = tree_dir / "usr" / "lib" / "modules" / KERNEL_VERSION
+    kernel_dir.mkdir(parents=True)
+    (tree_dir / "usr" / "lib" / "modules" / "extra").mkdir()
+    kernel_dir.joinpath("vmlinuz").write_text("kernel")
+    subprocess.run(["ostree", "init", "--mode=archive", f"--repo={repo_dir}"], check=True)
+    result = subprocess.run(
+        ["ostree", "commit", f"--repo={repo_dir}", "--branch=base",
+         "--subject=subject", "--body=body",
+         "--add-metadata-string=oe.arch=aarch64",
+         "--add-metadata-string=oe.kargs-default=quiet",
+         f"--tree=dir={tree_dir}"], check=True, stdout=subprocess.PIPE, text=True)
+    return result.stdout.strip()
+
+
+def test_commit_index(tmp_path, monkeypatch):
+    """Commit information is collected once and then read from the index"""
+
+    # Repository of a storage directory.
+    repo_dir = tmp_path / "ostree-archive"
+    (tmp_path / "sysroot").mkdir()
+    csum = create_repo(repo_dir, tmp_path / "tree")
+    repo = ostree.open_ostree(str(repo_dir))
+
+    info = ostree.get_commit_info(repo, "base", kernel=True)
+    assert info["subject"] == "subject"
+    assert info["body"] == "body"
+    assert info["arch"] == "aarch64"
+    assert info["kernel_version"] == KERNEL_VERSION
+    assert os.path.exists(tmp_path / ostree.COMMIT_INDEX_FILE)
+
+    # Forget the loaded index and make reading the commit impossible.
+    monkeypatch.setattr(ostree, "_commit_indexes", {})
+    monkeypatch.setattr(repo, "load_commit", None)
+    monkeypatch.setattr(ostree, "ls", None)
+
+    assert ostree.get_kernel_version(repo, csum) == KERNEL_VERSION
+    metadata, subject, body = ostree.get_metadata_from_ref(repo, "base")
+    assert metadata["oe.arch"] == "aarch64"
+    assert (subject, body) == ("subject", "body")
+
+
+def test_commit_index_outside_storage(tmp_path, monkeypatch):
+    """Nothing is written for repositories not in the storage directory"""
+
+    repo_dir = tmp_path / "repo"
+    csum = create_repo(repo_dir, tmp_path / "tree")
+    repo = ostree.open_ostree(str(repo_dir))
+    files = sorted(os.listdir(repo_dir))
+
+    assert ostree.get_commit_info(repo, csum, kernel=True)["kernel_version"] == KERNEL_VERSION
+    assert sorted(os.listdir(repo_dir)) == files
+    assert not os.path.exists(tmp_path / ostree.COMMIT_INDEX_FILE)
+
+    # The information is still cached in memory.
+    monkeypatch.setattr(repo, "load_commit", None)
+    assert ostree.get_commit_info(repo, csum)["arch"] == "aarch64"
+
+
+def test_commit_index_missing_commit(tmp_path):
+    """Unknown references raise an error"""
+
+    repo_dir = tmp_path / "repo"
+    create_repo(repo_dir, tmp_path / "tree")
+    repo = ostree.open_ostree(str(repo_dir))
+
+    with pytest.raises(ostree.TorizonCoreBuilderError):
+        ostree.get_commit_info(repo, "missing")
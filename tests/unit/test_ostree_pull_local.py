@@ -0,0 +1,91 @@
+"""Tests and benchmark of the import of references from a local repository
+
+The benchmark imports a repository holding many references, as done by
+"images unpack". It is skipped by default (run pytest with
+"-m benchmark -s" to see the results).
+
+Note: These tests expect all dependencies of TorizonCore Builder to be
+installed (i.e. they should be run inside the TorizonCore Builder container).
+"""
+
+import os
+import shutil
+import subprocess
+import time
+
+import pytest
+
+from tcbuilder.backend import ostree
+
+# Shape of the benchmark repository: each reference points to its own commit.
+BENCH_REFS = 12
+BENCH_FILES_PER_COMMIT = 200
+
+pytestmark = pytest.mark.skipif(shutil.which("ostree") is None,
+                                reason="ostree program not available")
+
+
+def create_src_repo(repo_dir, tree_dir):
+    """Create a repository with BENCH_REFS references"""
+    subprocess.run(["ostree", "init", "--mode=archive", f"--repo={repo_dir}"], check=True)
+    refs = {}
+    for ref_idx in range(BENCH_REFS):
+        sub_dir = tree_dir / f"commit{ref_idx}"
+        sub_dir.mkdir(parents=True)
+        for file_idx in range(BENCH_FILES_PER_COMMIT):
+            sub_dir.joinpath(f"file{file_idx}").write_bytes(os.urandom(512))
+        result = subprocess.run(
+            ["ostree", "commit", f"--repo={repo_dir}", f"--branch=branch{ref_idx}",
+             f"--tree=dir={sub_dir}"], check=True, stdout=subprocess.PIPE, text=True)
+        refs[f"branch{ref_idx}"] = result.stdout.strip()
+    return refs
+
+
+def check_refs(repo_dir, refs):
+    """Check that the references and their commits are in a repository"""
+    assert ostree.get_reference_dict(repo_dir) == refs
+    repo = ostree.open_ostree(repo_dir)
+    for ref_csum in refs.values():
+        assert repo.load_commit(ref_csum)[0]
+
+
+def test_pull_local_refs(tmp_path, monkeypatch):
+    """All references are imported by a single "ostree pull-local" process"""
+
+    src_dir = tmp_path / "src"
+    refs = create_src_repo(src_dir, tmp_path / "tree")
+    # Two references pointing to the same commit: it is pulled only once.
+    refs["alias"] = refs["branch0"]
+
+    commands = []
+    orig_run = subprocess.run
+
+    def run(cmd, *args, **kwargs):
+        commands.append(cmd)
+        return orig_run(cmd, *args, **kwargs)
+
+    monkeypatch.setattr(subprocess, "run", run)
+    repo = ostree.create_ostree(str(tmp_path / "repo"))
+    ostree.pull_local_refs(repo, str(src_dir), refs)
+
+    pulls = [cmd for cmd in commands if cmd[:2] == ["ostree", "pull-local"]]
+    assert len(pulls) == 1
+    assert len(pulls[0]) == 4 + BENCH_REFS
+    check_refs(str(tmp_path / "repo"), refs)
+
+
+@pytest.mark.benchmark
+def test_benchmark_pull_local_refs(tmp_path):
+    """Benchmark importing many references from a local repository"""
+
+    src_dir = tmp_path / "src"
+    refs = create_src_repo(src_dir, tmp_path / "tree")
+
+    repo = ostree.create_ostree(str(tmp_path / "repo"))
+    start = time.monotonic()
+    ostree.pull_local_refs(repo, str(src_dir), refs)
+    elapsed = time.monotonic() - start
+
+    check_refs(str(tmp_path / "repo"), refs)
+
+    print(f"\nImported {BENCH_REFS} references: pull_local_refs() {elapsed:.2f}s")
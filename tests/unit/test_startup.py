@@ -0,0 +1,99 @@
+"""Startup time regression tests for TorizonCore Builder
+
+Commands are loaded lazily by the main script: these tests make sure that
+showing the help of a command only imports the modules that command needs
+and that the time spent importing modules stays within a budget.
+
+Note: These tests expect all dependencies of TorizonCore Builder to be
+installed (i.e. they should be run inside the TorizonCore Builder container).
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+MAIN_SCRIPT = os.path.join(
+    os.path.dirname(__file__), "..", "..", "torizoncore-builder.py")
+
+# Third-party modules that are slow to import.
+HEAVY_MODULES = ["gi", "guestfs", "docker", "compose", "paramiko", "git", "jsonschema"]
+
+# CLI modules each command is allowed to import (besides its own).
+CLI_DEPENDENCIES = {
+    "build": ["deploy", "dt", "dto", "images", "kernel", "splash", "union"],
+    "bundle": [],
+    "combine": [],
+    "deploy": [],
+    "drift": ["isolate"],
+    "dt": [],
+    "dto": ["deploy", "dt", "images", "union"],
+    "images": [],
+    "isolate": [],
+    "kernel": ["deploy", "dt", "dto", "images", "union"],
+    "ostree": [],
+    "platform": ["bundle"],
+    "push": ["bundle", "platform"],
+    "splash": [],
+    "union": [],
+}
+
+# Maximum time (in seconds) to be spent importing modules when showing the
+# help of the main program and of each command.
+BASE_IMPORT_BUDGET = 0.5
+COMMAND_IMPORT_BUDGET = 5.0
+
+
+def get_imported_modules(args):
+    """Run the main script and return the modules it imported
+
+    :param args: List of arguments to be passed to the main script.
+    :returns: Dictionary mapping the name of each imported module to its
+              self import time in seconds.
+    """
+
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", MAIN_SCRIPT] + args,
+        stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True, check=True)
+
+    modules = {}
+    for line in proc.stderr.splitlines():
+        # Format: "import time: self [us] | cumulative | imported package"
+        if not line.startswith("import time:"):
+            continue
+        fields = line[len("import time:"):].split("|")
+        if not fields[0].strip().isdigit():
+            continue  # Header line.
+        modules[fields[2].strip()] = int(fields[0]) / 1e6
+    return modules
+
+
+def is_heavy(module):
+    """Tell whether a module is (part of) a heavy third-party package"""
+    return module.split(".")[0] in HEAVY_MODULES
+
+
+def test_base_help_imports():
+    """Base help must not import any command or heavy module"""
+
+    modules = get_imported_modules(["--help"])
+
+    assert not [mod for mod in modules if mod.startswith("tcbuilder.cli.")]
+    assert not [mod for mod in modules if mod.startswith("tcbuilder.backend.")]
+    assert not [mod for mod in modules if is_heavy(mod)]
+    assert sum(modules.values()) < BASE_IMPORT_BUDGET
+
+
+@pytest.mark.parametrize("command", sorted(CLI_DEPENDENCIES))
+def test_command_help_imports(command):
+    """Command help must import only the modules needed by that command"""
+
+    modules = get_imported_modules([command, "--help"])
+
+    allowed = [command] + CLI_DEPENDENCIES[command]
+    cli_modules = [mod[len("tcbuilder.cli."):]
+                   for mod in modules if mod.startswith("tcbuilder.cli.")]
+    assert command in cli_modules
+    assert set(cli_modules) <= set(allowed)
+    assert sum(modules.values()) < COMMAND_IMPORT_BUDGET
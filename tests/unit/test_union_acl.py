@@ -0,0 +1,102 @@
+"""Tests and benchmark of the ACL handling of the union command
+
+The benchmark applies the attributes of a synthetic changes tree holding a
+large ".tcattr" file. It is skipped by default (run pytest with
+"-m benchmark -s" to see the results).
+
+Note: These tests expect all dependencies of TorizonCore Builder to be
+installed (i.e. they should be run inside the TorizonCore Builder container)
+and must run as root, since they change the ownership of files.
+"""
+
+import os
+import shutil
+import stat
+import time
+
+import pytest
+
+from tcbuilder.cli import union
+
+# Shape of the tree used by the benchmark.
+BENCH_DIRS = 50
+BENCH_FILES_PER_DIR = 100
+# Every BENCH_TCATTR_STEP-th file is listed in the ".tcattr" file.
+BENCH_TCATTR_STEP = 10
+
+pytestmark = [
+    pytest.mark.skipif(os.geteuid() != 0, reason="must run as root"),
+    pytest.mark.skipif(shutil.which("setfacl") is None, reason="setfacl not available"),
+]
+
+
+def write_tcattr(base_dir, names, uid=1000, gid=1000, mode="rw-"):
+    """Write a ".tcattr" file listing the given names"""
+    with open(os.path.join(base_dir, ".tcattr"), "w") as fd_tcattr:
+        for name in names:
+            fd_tcattr.write(f"# file: {name}\n# owner: {uid}\n# group: {gid}\n"
+                            f"user::{mode}\ngroup::r--\nother::---\n\n")
+
+
+def create_bench_tree(change_dir):
+    """Create a changes tree where part of the files have ".tcattr" ACLs"""
+    etc_dir = change_dir / "usr" / "etc"
+    names = []
+    for dir_idx in range(BENCH_DIRS):
+        sub_dir = etc_dir / f"dir{dir_idx}"
+        sub_dir.mkdir(parents=True)
+        for file_idx in range(BENCH_FILES_PER_DIR):
+            sub_dir.joinpath(f"file{file_idx}").write_text("data")
+            if file_idx % BENCH_TCATTR_STEP == 0:
+                names.append(f"dir{dir_idx}/file{file_idx}")
+    write_tcattr(str(etc_dir), names)
+    return names
+
+
+def test_set_acl_attributes(tmp_path):
+    """Files get the attributes from ".tcattr" files or the default ones"""
+
+    etc_dir = tmp_path / "usr" / "etc"
+    (etc_dir / "sub dir").mkdir(parents=True)
+    etc_dir.joinpath("listed").write_text("data")
+    etc_dir.joinpath("sub dir", "listed too").write_text("data")
+    etc_dir.joinpath("plain").write_text("data")
+    etc_dir.joinpath("script").write_text("data")
+    etc_dir.joinpath("script").chmod(0o755)
+    etc_dir.joinpath("link").symlink_to("plain")
+    write_tcattr(str(etc_dir), ["listed", "sub\\040dir/listed\\040too", "link"])
+    # A second ".tcattr" file, deeper in the tree.
+    write_tcattr(str(etc_dir / "sub dir"), [], uid=0, gid=0)
+
+    union.set_acl_attributes(str(tmp_path))
+
+    for name in ["listed", "sub dir/listed too"]:
+        status = os.lstat(etc_dir / name)
+        assert (status.st_uid, status.st_gid) == (1000, 1000)
+        assert stat.S_IMODE(status.st_mode) == 0o640
+
+    assert stat.S_IMODE(os.lstat(etc_dir / "plain").st_mode) == 0o660
+    assert stat.S_IMODE(os.lstat(etc_dir / "script").st_mode) == 0o770
+    assert stat.S_IMODE(os.lstat(etc_dir / "sub dir").st_mode) == 0o755
+    assert os.lstat(etc_dir / "link").st_uid == 0
+
+
+@pytest.mark.benchmark
+def test_benchmark_set_acl_attributes(tmp_path):
+    """Benchmark set_acl_attributes() on a large tree"""
+
+    change_dir = tmp_path / "changes"
+    names = create_bench_tree(change_dir)
+    files = BENCH_DIRS * (BENCH_FILES_PER_DIR + 1) + 2
+
+    start = time.monotonic()
+    union.set_acl_attributes(str(change_dir))
+    elapsed = time.monotonic() - start
+
+    status = os.lstat(change_dir / "usr" / "etc" / names[-1])
+    assert (status.st_uid, status.st_gid) == (1000, 1000)
+    status = os.lstat(change_dir / "usr" / "etc" / "dir0" / "file1")
+    assert stat.S_IMODE(status.st_mode) == 0o660
+
+    print(f"\n{files} files, {len(names)} with .tcattr ACLs: "
+          f"set_acl_attributes() {elapsed:.2f}s")
@@ -0,0 +1,73 @@
+"""Tests of the whiteout processing of the union command
+
+Note: These tests expect all dependencies of TorizonCore Builder to be
+installed (i.e. they should be run inside the TorizonCore Builder container).
+"""
+
+import os
+
+# pylint: disable=wrong-import-order,wrong-import-position
+import gi
+gi.require_version("OSTree", "1.0")
+from gi.repository import Gio, OSTree
+# pylint: enable=wrong-import-order,wrong-import-position
+
+from tcbuilder.backend import union
+
+
+def create_tree(base_dir, files):
+    """Create files (with parent directories) from a list of relative paths"""
+    for name in files:
+        path = base_dir / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text("data")
+
+
+def list_mtree(mtree, path=""):
+    """List all files and directories of a MutableTree"""
+    names = [f"{path}/{name}" for name in mtree.get_files()]
+    for dirname, submt in mtree.get_subdirs().items():
+        names.append(f"{path}/{dirname}/")
+        names.extend(list_mtree(submt, f"{path}/{dirname}"))
+    return sorted(names)
+
+
+def merge_tree(repo, mtree, tree_dir):
+    """Write a directory on top of a MutableTree"""
+    tree_fd = os.open(tree_dir, os.O_DIRECTORY)
+    try:
+        assert repo.write_dfd_to_mtree(tree_fd, ".", mtree, None)
+    finally:
+        os.close(tree_fd)
+
+
+def test_process_changes_whiteouts(tmp_path):
+    """Whiteouts and .tcattr files of the changes are applied to the tree"""
+
+    base_dir = tmp_path / "base"
+    create_tree(base_dir, ["usr/etc/removed", "usr/etc/kept", "usr/etc/gone/file",
+                           "usr/etc/opaque/old", "usr/lib/untouched/file"])
+    changes_dir = tmp_path / "changes"
+    create_tree(changes_dir, ["usr/etc/.wh.removed", "usr/etc/.wh.gone", "usr/etc/.tcattr",
+                              "usr/etc/added", "usr/etc/opaque/.wh..wh..opq"])
+
+    repo = OSTree.Repo.new(Gio.File.new_for_path(str(tmp_path / "repo")))
+    repo.create(OSTree.RepoMode.ARCHIVE)
+    repo.prepare_transaction()
+
+    mtree = OSTree.MutableTree.new()
+    merge_tree(repo, mtree, str(base_dir))
+    merge_tree(repo, mtree, str(changes_dir))
+    union.process_changes_whiteouts(mtree, str(changes_dir))
+    repo.abort_transaction()
+
+    assert list_mtree(mtree) == [
+        "/usr/",
+        "/usr/etc/",
+        "/usr/etc/added",
+        "/usr/etc/kept",
+        "/usr/etc/opaque/",
+        "/usr/lib/",
+        "/usr/lib/untouched/",
+        "/usr/lib/untouched/file",
+    ]
@@ -19,20 +19,69 @@ if sys.version_info < MIN_PYTHON:
 
 # pylint: disable=wrong-import-position
 import argparse
+import importlib
 import logging
 import os
 import subprocess
 import traceback
 
-from tcbuilder.cli import (bundle, build, combine, deploy, dt, dto, images, isolate,
-                           kernel, ostree, platform, push, splash, union)
-
 from tcbuilder.errors import TorizonCoreBuilderError, InvalidArgumentError
 # pylint: enable=wrong-import-position
 
 # IMPORTANT: This line may be edited by the build system.
 VERSION_SUFFIX = ''
 
+# Commands in ALPHABETICAL order: each one maps to the CLI module implementing
+# it and to the help text shown in the list of commands (the only copy of it:
+# it is passed to the init_parser() function of the module). The module (and
+# thus all the backend modules it depends on) is only imported when the
+# command is actually selected in the command line, which keeps startup time
+# low.
+COMMANDS = {
+    "build": ("tcbuilder.cli.build",
+              "Customize a Toradex Easy Installer image based on settings "
+              "specified via a configuration file."),
+    "bundle": ("tcbuilder.cli.bundle",
+               "Create container bundle from a Docker Compose file. Can be "
+               "used to combine with a TorizonCore base image."),
+    "combine": ("tcbuilder.cli.combine",
+                "Combines a container bundle with a specified Torizon OS image "
+                "(Toradex Easy Installer or raw/WIC)"),
+    "deploy": ("tcbuilder.cli.deploy",
+               "Deploy unpacked image as a Toradex Easy Installer image or raw "
+               "disk format."),
+    "drift": ("tcbuilder.cli.drift",
+              "scan devices for /etc changes (configuration drift)."),
+    "dt": ("tcbuilder.cli.dt",
+           "Manage device trees"),
+    "dto": ("tcbuilder.cli.dto",
+            "Manage device tree overlays"),
+    "images": ("tcbuilder.cli.images",
+               "Manage Toradex Easy Installer Images."),
+    "isolate": ("tcbuilder.cli.isolate",
+                "capture /etc changes."),
+    "kernel": ("tcbuilder.cli.kernel",
+               "Manage and modify TorizonCore Linux Kernel."),
+    "ostree": ("tcbuilder.cli.ostree",
+               "OSTree operational commands"),
+    "platform": ("tcbuilder.cli.platform",
+                 "Execute operations that interact with the Torizon Platform "
+                 "Services (app.torizon.io) or a compatible server"),
+    "push": ("tcbuilder.cli.push",
+             "Push artifact to OTA server as a new update package."),
+    "splash": ("tcbuilder.cli.splash",
+               "change splash screen"),
+    "union": ("tcbuilder.cli.union",
+              "Create a commit out of isolated changes for unpacked "
+              "Toradex Easy Installer Image"),
+}
+
+# Base options taking a separate value (needed to locate the command name).
+# XXX: Always keep in sync with the base arguments defined below.
+BASE_OPTIONS_WITH_VALUE = [
+    "--log-level", "--log-file", "--storage-directory", "--bundle-directory"
+]
+
 parser = argparse.ArgumentParser(
     description="TorizonCore Builder is an utility that allows to create "
                 "customized TorizonCore OSTree commits and Toradex Easy "
@@ -126,21 +175,47 @@ parser.add_argument(
 
 subparsers = parser.add_subparsers(title='Commands', required=True, dest='cmd')
 
-# Commands in ALPHABETICAL order.
-build.init_parser(subparsers)
-bundle.init_parser(subparsers)
-combine.init_parser(subparsers)
-deploy.init_parser(subparsers)
-dt.init_parser(subparsers)
-dto.init_parser(subparsers)
-images.init_parser(subparsers)
-isolate.init_parser(subparsers)
-kernel.init_parser(subparsers)
-ostree.init_parser(subparsers)
-platform.init_parser(subparsers)
-push.init_parser(subparsers)
-splash.init_parser(subparsers)
-union.init_parser(subparsers)
+
+def get_command_name(argv):
+    """Determine the name of the command selected in the command line.
+
+    :param argv: List of command line arguments (without the program name).
+    :returns: The first argument that is neither a base option nor the value
+              of one, or None if no such argument exists.
+    """
+
+    skip_value = False
+    for arg in argv:
+        if skip_value:
+            skip_value = False
+        elif arg in BASE_OPTIONS_WITH_VALUE:
+            skip_value = True
+        elif not arg.startswith("-"):
+            return arg
+    return None
+
+
+def init_commands_parsers(subparsers, argv):
+    """Initialize the parsers of all commands.
+
+    Only the module of the command selected in the command line gets imported
+    and has its full parser initialized; every other command is registered
+    with a lightweight placeholder parser so that it still shows up in the
+    help output.
+
+    :param subparsers: Object returned by `parser.add_subparsers()`.
+    :param argv: List of command line arguments (without the program name).
+    """
+
+    cmd_name = get_command_name(argv)
+    for name, (module_name, help_text) in COMMANDS.items():
+        if name == cmd_name:
+            importlib.import_module(module_name).init_parser(subparsers, help_text)
+        else:
+            subparsers.add_parser(name, help=help_text, allow_abbrev=False)
+
+
+init_commands_parsers(subparsers, sys.argv[1:])
 
 # pylint: disable=broad-except
 